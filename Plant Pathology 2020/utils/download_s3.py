@@ -1,30 +1,140 @@
-import boto3
+"""Sync training results from S3 into a local folder.
+
+Lists every object under the prefix (paginated, so more than 1000 keys are
+fine), downloads with a bounded thread pool and multipart transfers, and
+keeps a manifest (key -> size, ETag) in the local folder so unchanged
+objects are skipped on the next run.
+
+Usage:
+  python utils/download_s3.py
+  python utils/download_s3.py --prefix runpod/results/nano/ --workers 16
+
+Point --endpoint-url (or S3_ENDPOINT_URL) at a local S3 stand-in such as
+MinIO or `moto_server` to try it without touching the real bucket.
+"""
+import argparse
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
 bucket_name = 'thesis-abiya'
 prefix = 'runpod/results/'
 local_dir = 'downloaded_results'
 
-s3 = boto3.client('s3')
+MANIFEST_NAME = '.s3_manifest.json'
+MB = 1024 * 1024
 
-# List all objects under the prefix
-response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
 
-if 'Contents' in response:
-    for obj in response['Contents']:
-        s3_key = obj['Key']
-        if s3_key.endswith('/'):  # skip directories
-            continue
+def make_client(endpoint_url=None, workers=8, max_concurrency=4):
+    # every worker may open max_concurrency connections for a multipart transfer
+    config = Config(max_pool_connections=max(10, workers * max_concurrency))
+    return boto3.client('s3', endpoint_url=endpoint_url, config=config)
+
+
+def list_objects(s3, bucket, prefix):
+    """Yield every object under `prefix`, following pagination."""
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):  # skip directories
+                continue
+            yield obj
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
 
-        # Construct local path
-        relative_path = os.path.relpath(s3_key, prefix)
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_current(entry, obj, local_path):
+    """True when the manifest says this exact object version is already on disk."""
+    if not entry or entry.get('etag') != obj['ETag'] or entry.get('size') != obj['Size']:
+        return False
+    try:
+        return os.path.getsize(local_path) == obj['Size']
+    except OSError:
+        return False
+
+
+def sync(bucket, prefix, local_dir, endpoint_url=None, workers=8, max_concurrency=4, chunk_mb=16):
+    s3 = make_client(endpoint_url, workers, max_concurrency)
+    transfer = TransferConfig(multipart_threshold=chunk_mb * MB, multipart_chunksize=chunk_mb * MB,
+                              max_concurrency=max_concurrency, use_threads=True)
+    os.makedirs(local_dir, exist_ok=True)
+    manifest_path = os.path.join(local_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    lock = threading.Lock()
+
+    todo = []
+    listed = 0
+    for obj in list_objects(s3, bucket, prefix):
+        listed += 1
+        relative_path = os.path.relpath(obj['Key'], prefix)
         local_path = os.path.join(local_dir, relative_path)
+        if is_current(manifest.get(obj['Key']), obj, local_path):
+            continue
+        todo.append((obj, local_path))
 
-        # Create local directories if they don't exist
+    if not listed:
+        print("No objects found under the prefix.")
+        return 0
+    print(f"Listed {listed} objects, {listed - len(todo)} unchanged, {len(todo)} to download.")
+
+    def download(obj, local_path):
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp = local_path + '.part'
+        s3.download_file(bucket, obj['Key'], tmp, Config=transfer)
+        os.replace(tmp, local_path)
+        with lock:
+            manifest[obj['Key']] = {'size': obj['Size'], 'etag': obj['ETag']}
+        return obj['Key'], local_path
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(download, obj, path): obj['Key'] for obj, path in todo}
+            for fut in as_completed(futures):
+                try:
+                    key, path = fut.result()
+                    print(f"Downloaded {key} to {path}")
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed {futures[fut]}: {e}")
+    finally:
+        # keep progress even when interrupted, so a re-run resumes
+        with lock:
+            save_manifest(manifest_path, manifest)
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally sync an S3 prefix to a local folder.')
+    parser.add_argument('--bucket', default=bucket_name)
+    parser.add_argument('--prefix', default=prefix)
+    parser.add_argument('--local-dir', default=local_dir)
+    parser.add_argument('--endpoint-url', default=os.environ.get('S3_ENDPOINT_URL'))
+    parser.add_argument('--workers', type=int, default=8, help='files downloaded in parallel')
+    parser.add_argument('--max-concurrency', type=int, default=4, help='parts per multipart download')
+    parser.add_argument('--chunk-mb', type=int, default=16, help='multipart threshold and part size')
+    args = parser.parse_args()
+    return sync(args.bucket, args.prefix, args.local_dir, endpoint_url=args.endpoint_url, workers=args.workers,
+                max_concurrency=args.max_concurrency, chunk_mb=args.chunk_mb)
+
 
-        # Download the file
-        s3.download_file(bucket_name, s3_key, local_path)
-        print(f"Downloaded {s3_key} to {local_path}")
-else:
-    print("No objects found under the prefix.")
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,91 +1,193 @@
-import os
-import cv2
-import re
-import numpy as np
-
-# Path ke folder gambar
-folder_path = "comparison_output/test/"  # Ganti path kamu
-
-# Resolusi layar target (Full HD)
-MAX_WIDTH = 1920
-MAX_HEIGHT = 1080
-
-# Regex nama file
-pattern = re.compile(r"(scab_test_(\d+))_jpg\.rf\..*\.jpg")
-
-# Ambil dan filter file
-files_with_numbers = []
-for filename in os.listdir(folder_path):
-    match = pattern.match(filename)
-    if match:
-        full_tag = match.group(1)  # e.g. "healthy_test_142"
-        num = int(match.group(2))
-        if num >= 0:
-            files_with_numbers.append((filename, num, full_tag))
-
-# Urutkan secara leksikografis berdasarkan filename
-files_with_numbers.sort(key=lambda x: x[0])
-
-print(f"Menampilkan {len(files_with_numbers)} gambar... (Tekan [Delete] untuk keluar)")
-
-for filename, _, display_name in files_with_numbers:
-    img_path = os.path.join(folder_path, filename)
-    img = cv2.imread(img_path)
-
-    if img is None:
-        print(f"Gagal membuka: {filename}")
-        continue
-
-    # Resize proporsional
-    h, w = img.shape[:2]
-    scale = min(MAX_WIDTH / w, MAX_HEIGHT / h, 1.0)
-    new_w, new_h = int(w * scale), int(h * scale)
-    img_resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-    # Buat canvas hitam
-    canvas = np.zeros((MAX_HEIGHT, MAX_WIDTH, 3), dtype=np.uint8)
-
-    # Hitung posisi tengah
-    start_y = (MAX_HEIGHT - new_h) // 2
-    start_x = (MAX_WIDTH - new_w) // 2
-
-    # Tempel gambar
-    canvas[start_y:start_y + new_h, start_x:start_x + new_w] = img_resized
-
-    # Tambahkan nama file (tanpa .rf...) di kiri atas
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    text = display_name
-    font_scale = 2
-    thickness = 3
-    text_color = (255, 255, 255)
-    bg_color = (0, 0, 0)
-
-    # Hitung ukuran teks
-    (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
-    text_x, text_y = 50, 80
-
-    # Gambar background kotak hitam (biar teks jelas)
-    cv2.rectangle(canvas,
-                  (text_x - 10, text_y - text_height - 10),
-                  (text_x + text_width + 10, text_y + 10),
-                  bg_color, -1)
-
-    # Gambar teks
-    cv2.putText(canvas, text, (text_x, text_y), font, font_scale, text_color, thickness, cv2.LINE_AA)
-
-    # Tampilkan full screen
-    window_name = "Gambar"
-    cv2.namedWindow(window_name, cv2.WND_PROP_FULLSCREEN)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-    cv2.imshow(window_name, canvas)
-    cv2.moveWindow(window_name, 1920, 0)  # Pindahkan ke monitor ke-2 (kanan)
-
-
-    print(f"Menampilkan: {filename} — tekan tombol untuk lanjut, [Delete] untuk keluar.")
-    key = cv2.waitKey(0)
-    cv2.destroyAllWindows()
-
-    # Tombol Delete
-    if key == 8:
-        print("Dihentikan oleh pengguna (tombol Delete).")
-        break
+import argparse
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Path ke folder gambar
+folder_path = "comparison_output/test/"  # Ganti path kamu
+
+# Resolusi layar target (Full HD)
+MAX_WIDTH = 1920
+MAX_HEIGHT = 1080
+
+# Regex nama file: group 1 = label yang ditampilkan, group 2 = nomor (opsional)
+DEFAULT_PATTERNS = [r"(scab_test_(\d+))_jpg\.rf\..*\.jpg"]
+
+# Tombol
+KEY_EXIT = {8}                                  # Backspace/Delete: keluar
+KEY_BACK = {ord('a'), ord('b'), 2424832, 65361}  # a / b / panah kiri: mundur
+
+
+def kumpulkan_file(folder, patterns):
+    """Ambil file yang cocok dengan salah satu pattern, urut berdasarkan nama."""
+    regexes = [re.compile(p) for p in patterns]
+    files = []
+    for entry in os.scandir(folder):
+        if not entry.is_file():
+            continue
+        for rx in regexes:
+            match = rx.match(entry.name)
+            if not match:
+                continue
+            if rx.groups >= 2 and match.group(2) is not None and int(match.group(2)) < 0:
+                break
+            display_name = match.group(1) if rx.groups >= 1 else entry.name
+            files.append((entry.name, display_name))
+            break
+    # Urutkan secara leksikografis berdasarkan filename
+    files.sort(key=lambda x: x[0])
+    return files
+
+
+def buat_canvas(img_path, display_name):
+    """Baca gambar, resize proporsional ke canvas Full HD, dan tulis nama file."""
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    scale = min(MAX_WIDTH / w, MAX_HEIGHT / h, 1.0)
+    new_w, new_h = int(w * scale), int(h * scale)
+    img_resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    # Buat canvas hitam, tempel gambar di tengah
+    canvas = np.zeros((MAX_HEIGHT, MAX_WIDTH, 3), dtype=np.uint8)
+    start_y = (MAX_HEIGHT - new_h) // 2
+    start_x = (MAX_WIDTH - new_w) // 2
+    canvas[start_y:start_y + new_h, start_x:start_x + new_w] = img_resized
+
+    # Tambahkan nama file (tanpa .rf...) di kiri atas, dengan kotak hitam supaya jelas
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 2
+    thickness = 3
+    (text_width, text_height), _ = cv2.getTextSize(display_name, font, font_scale, thickness)
+    text_x, text_y = 50, 80
+    cv2.rectangle(canvas,
+                  (text_x - 10, text_y - text_height - 10),
+                  (text_x + text_width + 10, text_y + 10),
+                  (0, 0, 0), -1)
+    cv2.putText(canvas, display_name, (text_x, text_y), font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+    return canvas
+
+
+class Prefetcher:
+    """Decode dan letterbox gambar berikutnya di thread background.
+
+    Cache LRU dibatasi `cache_size` canvas (sekitar 6 MB per canvas Full HD),
+    jadi gambar yang baru dilihat tetap ada saat mundur tanpa decode ulang.
+    """
+
+    def __init__(self, folder, files, ahead=4, cache_size=16):
+        self.folder = folder
+        self.files = files
+        self.ahead = ahead
+        self.cache_size = max(cache_size, ahead + 2)
+        self.cache = OrderedDict()
+        self.cond = threading.Condition()
+        self.current = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _next_missing(self):
+        for i in range(self.current, min(len(self.files), self.current + self.ahead + 1)):
+            if i not in self.cache:
+                return i
+        return None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.stopped and self._next_missing() is None:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                i = self._next_missing()
+            filename, display_name = self.files[i]
+            canvas = buat_canvas(os.path.join(self.folder, filename), display_name)
+            with self.cond:
+                self.cache[i] = canvas
+                self._evict()
+                self.cond.notify_all()
+
+    def _evict(self):
+        # buang yang paling lama tidak dipakai, tapi jangan jendela prefetch
+        window = range(self.current, self.current + self.ahead + 1)
+        for key in list(self.cache.keys()):
+            if len(self.cache) <= self.cache_size:
+                break
+            if key not in window:
+                del self.cache[key]
+
+    def get(self, i):
+        """Canvas untuk gambar ke-i (None kalau gagal dibuka); tunggu kalau belum siap."""
+        with self.cond:
+            self.current = i
+            self.cond.notify_all()
+            while i not in self.cache:
+                self.cond.wait()
+            self.cache.move_to_end(i)
+            return self.cache[i]
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tampilkan gambar hasil perbandingan satu per satu.')
+    parser.add_argument('folder', nargs='?', default=folder_path)
+    parser.add_argument('--pattern', action='append', help='regex nama file (boleh lebih dari satu); group 1 = label')
+    parser.add_argument('--ahead', type=int, default=4, help='jumlah gambar yang di-decode lebih dulu')
+    parser.add_argument('--cache', type=int, default=16, help='jumlah canvas maksimum di cache')
+    parser.add_argument('--monitor-x', type=int, default=1920, help='posisi x jendela (monitor ke-2 = 1920)')
+    args = parser.parse_args()
+
+    files = kumpulkan_file(args.folder, args.pattern or DEFAULT_PATTERNS)
+    print(f"Menampilkan {len(files)} gambar... (tombol apa saja = lanjut, [a]/[b]/panah kiri = mundur, [Delete] = keluar)")
+    if not files:
+        return
+
+    # Tampilkan full screen; jendela dibuat sekali saja
+    window_name = "Gambar"
+    cv2.namedWindow(window_name, cv2.WND_PROP_FULLSCREEN)
+    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    cv2.moveWindow(window_name, args.monitor_x, 0)  # Pindahkan ke monitor ke-2 (kanan)
+
+    prefetcher = Prefetcher(args.folder, files, ahead=args.ahead, cache_size=args.cache)
+    i = 0
+    step = 1  # arah terakhir; gambar yang gagal dibuka dilewati ke arah ini
+    try:
+        while 0 <= i < len(files):
+            filename = files[i][0]
+            canvas = prefetcher.get(i)
+            if canvas is None:
+                print(f"Gagal membuka: {filename}")
+                i += step
+                if i < 0:  # tidak ada gambar terbaca di depan: mulai lagi dari awal
+                    i, step = 0, 1
+                continue
+            cv2.imshow(window_name, canvas)
+            print(f"Menampilkan: {filename} — tekan tombol untuk lanjut, [Delete] untuk keluar.")
+            key = cv2.waitKeyEx(0)
+
+            # Tombol Delete
+            if key in KEY_EXIT:
+                print("Dihentikan oleh pengguna (tombol Delete).")
+                break
+            if key in KEY_BACK:
+                i, step = max(0, i - 1), -1
+            else:
+                i, step = i + 1, 1
+    finally:
+        prefetcher.stop()
+        cv2.destroyAllWindows()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+from dataset_manifest import Manifest  # noqa: E402
+
+
+def test_rows_indexed_without_hash_get_hashed_later(tmp_path):
+    images = tmp_path / 'train'
+    images.mkdir()
+    (images / 'a_rust.jpg').write_bytes(b'first image')
+    (images / 'b_healthy.jpg').write_bytes(b'second image')
+    manifest = Manifest(str(tmp_path / 'manifest.sqlite'))
+
+    assert manifest.refresh(str(images), hash_files=False)['added'] == 2
+    assert all(r['sha1'] is None for r in manifest.query(str(images)))
+
+    stats = manifest.refresh(str(images))
+    assert stats['unchanged'] == 2 and stats['hashed'] == 2
+    assert {r['name']: r['sha1'] for r in manifest.query(str(images))} == {
+        'a_rust.jpg': hashlib.sha1(b'first image').hexdigest(),
+        'b_healthy.jpg': hashlib.sha1(b'second image').hexdigest(),
+    }
+    assert manifest.refresh(str(images))['hashed'] == 0
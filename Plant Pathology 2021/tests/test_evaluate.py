@@ -0,0 +1,81 @@
+import csv
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('PIL')
+from PIL import Image  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website', 'tools'))
+
+STUB = '''
+import os
+import numpy as np
+from PIL import Image
+
+
+class _T:
+    def __init__(self, a):
+        self.a = np.asarray(a)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.a
+
+
+class _Result:
+    def __init__(self, path):
+        with Image.open(path) as im:
+            W, H = im.size
+        self.orig_shape = (H, W)
+        if os.path.basename(path).startswith('empty'):
+            self.masks = None
+            self.boxes = type('Boxes', (), {'cls': _T([]), 'conf': _T([])})()
+        else:
+            leaf = np.array([[2, 2], [W - 2, 2], [W - 2, H - 2], [2, H - 2]], dtype=float)
+            lesion = np.array([[4, 4], [12, 4], [12, 12], [4, 12]], dtype=float)
+            self.masks = type('Masks', (), {'xy': [leaf, lesion]})()
+            self.boxes = type('Boxes', (), {'cls': _T([0, 1]), 'conf': _T([0.9, 0.8])})()
+
+
+class YOLO:
+    def __init__(self, weights):
+        pass
+
+    def predict(self, source, **kwargs):
+        return [_Result(p) for p in source]
+'''
+
+
+def test_split_with_an_empty_prediction(tmp_path, monkeypatch):
+    stub = tmp_path / 'stub'
+    (stub / 'ultralytics').mkdir(parents=True)
+    (stub / 'ultralytics' / '__init__.py').write_text(STUB)
+    monkeypatch.syspath_prepend(str(stub))
+    monkeypatch.delitem(sys.modules, 'ultralytics', raising=False)
+
+    split = tmp_path / 'split'
+    (split / 'images').mkdir(parents=True)
+    (split / 'labels').mkdir()
+    # distinct content: predictions are cached per image hash
+    for name, color in (('leaf_rust.jpg', (0, 128, 0)), ('empty_healthy.jpg', (0, 200, 0))):
+        Image.new('RGB', (32, 32), color).save(split / 'images' / name)
+        (split / 'labels' / (os.path.splitext(name)[0] + '.txt')).write_text('0 0.1 0.1 0.9 0.1 0.9 0.9 0.1 0.9\n')
+    weights = tmp_path / 'stub.pt'
+    weights.write_bytes(b'weights')
+    out = tmp_path / 'out'
+
+    import evaluate
+    monkeypatch.setattr(sys, 'argv', ['evaluate.py', '--split', str(split), '--models', f'stub={weights}',
+                                      '--out', str(out), '--workers', '1'])
+    assert evaluate.main() == 0
+
+    with open(out / 'eval_stub.csv', newline='', encoding='utf-8') as f:
+        rows = {r['image']: r for r in csv.DictReader(f)}
+    assert set(rows) == {'leaf_rust.jpg', 'empty_healthy.jpg'}
+    assert float(rows['empty_healthy.jpg']['leaf_iou']) == 0.0
+    assert float(rows['leaf_rust.jpg']['leaf_iou']) > 0.5
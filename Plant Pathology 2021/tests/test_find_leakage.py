@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+from find_leakage import quarantine  # noqa: E402
+
+
+def test_quarantine_never_overwrites(tmp_path):
+    root = str(tmp_path)
+    files = {}
+    for rel, subset in (('train/rust/x.jpg', 'train'), ('test/rust/x.jpg', 'test'), ('test/healthy/x.jpg', 'test')):
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(rel)
+        files[path] = subset
+    train, test_rust, test_healthy = files
+    # an earlier --fix already left a file at the mirrored destination
+    os.makedirs(os.path.join(root, '_leaked', 'test', 'rust'))
+    with open(os.path.join(root, '_leaked', 'test', 'rust', 'x.jpg'), 'w') as f:
+        f.write('earlier')
+
+    moved = dict(quarantine(root, [(train, test_rust, 0), (train, test_healthy, 0)], files))
+
+    assert os.path.exists(train)
+    assert set(moved) == {test_rust, test_healthy}
+    assert len(set(moved.values())) == 2
+    for src, dst in moved.items():
+        with open(dst) as f:
+            assert f.read() == os.path.relpath(src, root).replace(os.sep, '/')
+    with open(os.path.join(root, '_leaked', 'test', 'rust', 'x.jpg')) as f:
+        assert f.read() == 'earlier'
@@ -0,0 +1,65 @@
+import csv
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+import split_by_subset  # noqa: E402
+
+LABELS = ['healthy', 'rust', 'frog_eye_leaf_spot', 'rust frog_eye_leaf_spot']
+
+
+def make_dataset(root, n=60):
+    images = root / 'images'
+    images.mkdir()
+    with open(root / 'train.csv', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['image', 'labels'])
+        for i in range(n):
+            name = f'img_{i:03d}.jpg'
+            (images / name).write_bytes(f'image {i}'.encode('utf-8'))
+            writer.writerow([name, LABELS[i % len(LABELS)]])
+
+
+def write_config(root, seed):
+    path = root / 'split_config.json'
+    path.write_text(json.dumps({'subset': {
+        'csv': str(root / 'train.csv'), 'images': str(root / 'images'), 'out_dir': str(root / 'subsets'),
+        'mapping_csv': str(root / 'mapping.csv'), 'per_class_limit': 1000, 'seed': seed, 'workers': 2}}))
+    return str(path)
+
+
+def subset_files(root):
+    return {s: set(os.listdir(root / 'subsets' / s)) for s in split_by_subset.SUBSETS}
+
+
+def test_changing_seed_keeps_subsets_disjoint(tmp_path):
+    make_dataset(tmp_path)
+    assert split_by_subset.run(write_config(tmp_path, 'first')) == 0
+    before = subset_files(tmp_path)
+
+    assert split_by_subset.run(write_config(tmp_path, 'second')) == 0
+    after = subset_files(tmp_path)
+
+    assert before != after  # the new seed moved some images
+    for a in split_by_subset.SUBSETS:
+        for b in split_by_subset.SUBSETS:
+            if a < b:
+                assert not after[a] & after[b]
+    assert sum(len(files) for files in after.values()) == 60
+    with open(tmp_path / 'mapping.csv', newline='', encoding='utf-8') as f:
+        mapping = {row['name_file']: row['subset'] for row in csv.DictReader(f)}
+    assert {name: s for s, files in after.items() for name in files} == mapping
+
+
+def test_rows_removed_from_csv_are_pruned(tmp_path):
+    make_dataset(tmp_path)
+    config = write_config(tmp_path, 'first')
+    assert split_by_subset.run(config) == 0
+    csv_path = tmp_path / 'train.csv'
+    rows = csv_path.read_text(encoding='utf-8').splitlines()
+    csv_path.write_text('\n'.join(rows[:31]) + '\n', encoding='utf-8')
+
+    assert split_by_subset.run(config) == 0
+    assert sum(len(files) for files in subset_files(tmp_path).values()) == 30
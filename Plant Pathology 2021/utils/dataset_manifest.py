@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Incremental SQLite manifest of dataset images.
+
+One table holds, per image path: class labels, subset, size, mtime,
+SHA-1 and image dimensions. `refresh()` walks a folder with os.scandir
+and only re-hashes / re-reads files whose size or mtime changed, so the
+split scripts, asset tools and the website can query the manifest instead
+of rescanning and rehashing the tree on every run.
+
+Labels come from (in order): an explicit {name: labels} mapping such as
+train.csv, a class-named parent folder, or the class name in the filename
+(Roboflow exports look like 00001_frog_eye_leaf_spot_jpg.rf.<hash>.jpg).
+The subset is the nearest 'train'/'valid'/'test' folder in the path.
+
+Usage examples:
+  python utils/dataset_manifest.py refresh dataset/original_dataset/train_images --csv dataset/original_dataset/train.csv
+  python utils/dataset_manifest.py refresh dataset/original_dataset_split_by_subset
+  python utils/dataset_manifest.py query dataset/original_dataset_split_by_subset --subset test --label rust
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_DB = os.path.join('dataset', 'manifest.sqlite')
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.gif', '.webp'}
+KNOWN_CLASSES = ['frog_eye_leaf_spot', 'rust', 'healthy', 'scab', 'complex', 'powdery_mildew']
+SUBSETS = ('train', 'valid', 'test')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL DEFAULT '',
+    subset TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha1 TEXT,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+CREATE INDEX IF NOT EXISTS files_sha1 ON files(sha1);
+CREATE INDEX IF NOT EXISTS files_subset ON files(subset);
+"""
+
+
+def is_image_file(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTS
+
+
+def file_sha1(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def image_size(path: str) -> Tuple[Optional[int], Optional[int]]:
+    """Width and height from the image header, or (None, None) without Pillow."""
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None, None
+
+
+def infer_labels(path: str) -> List[str]:
+    """Class labels from a class-named parent folder, else from the filename."""
+    parent = os.path.basename(os.path.dirname(path))
+    if parent in KNOWN_CLASSES:
+        return [parent]
+    lname = os.path.basename(path).lower()
+    if 'frog' in lname:
+        return ['frog_eye_leaf_spot']
+    return [c for c in KNOWN_CLASSES if c in lname][:1]
+
+
+def infer_subset(path: str) -> Optional[str]:
+    for part in reversed(os.path.normpath(path).split(os.sep)[:-1]):
+        if part in SUBSETS:
+            return part
+    return None
+
+
+def read_csv_labels(csv_path: str) -> Dict[str, str]:
+    """{image name: space-separated labels} from a train.csv style file."""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        return {row['image']: ' '.join((row.get('labels') or '').split()) for row in csv.DictReader(f) if row.get('image')}
+
+
+def walk_images(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif is_image_file(e.name):
+                    yield e
+
+
+def _prefix_range(root: str) -> Tuple[str, str]:
+    # every path strictly under root sorts between 'root/' and 'root0' ('0' == '/' + 1)
+    root = os.path.normpath(root)
+    return root + os.sep, root + chr(ord(os.sep) + 1)
+
+
+class Manifest:
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self.connect() as con:
+            con.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection that commits on success and is always closed."""
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            con.execute('PRAGMA journal_mode=WAL')
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def refresh(self, root: str, labels: Optional[Dict[str, str]] = None, hash_files: bool = True,
+                reuse_from: Optional[str] = None) -> Dict[str, int]:
+        """Bring the rows under `root` in line with the disk.
+
+        Unchanged files (same size and mtime) are not opened, except that
+        with `hash_files` a row indexed earlier without a hash is hashed. With
+        `reuse_from`, a new file whose name and size match a row under that
+        root (e.g. a copy or link of a source image) takes its hash and
+        dimensions instead of being read. Returns counts of added, updated,
+        unchanged, hashed (unchanged rows that got their missing hash) and
+        removed rows.
+        """
+        stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'hashed': 0, 'removed': 0}
+        lo, hi = _prefix_range(root)
+        reuse = self.by_name(reuse_from) if reuse_from else {}
+        with self.connect() as con:
+            known = {r['path']: (r['size'], r['mtime_ns'], r['labels'], r['sha1'])
+                     for r in con.execute('SELECT path, size, mtime_ns, labels, sha1 FROM files WHERE path >= ? AND path < ?', (lo, hi))}
+            seen = set()
+            batch = []
+            for e in walk_images(root):
+                path = os.path.normpath(e.path)
+                seen.add(path)
+                st = e.stat()
+                lbl = labels.get(e.name) if labels is not None else None
+                old = known.get(path)
+                if old is not None and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                    if lbl is not None and lbl != old[2]:
+                        con.execute('UPDATE files SET labels = ? WHERE path = ?', (lbl, path))
+                    if hash_files and old[3] is None:
+                        src = reuse.get(e.name)
+                        sha1 = src['sha1'] if src is not None and src['size'] == st.st_size and src['sha1'] else file_sha1(path)
+                        con.execute('UPDATE files SET sha1 = ? WHERE path = ?', (sha1, path))
+                        stats['hashed'] += 1
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated' if old is not None else 'added'] += 1
+                if lbl is None:
+                    lbl = ' '.join(infer_labels(path))
+                src = reuse.get(e.name)
+                if src is not None and src['size'] == st.st_size and src['sha1']:
+                    sha1, w, h = src['sha1'], src['width'], src['height']
+                else:
+                    sha1 = file_sha1(path) if hash_files else None
+                    w, h = image_size(path)
+                batch.append((path, e.name, lbl, infer_subset(path), st.st_size, st.st_mtime_ns, sha1, w, h))
+                if len(batch) >= 500:
+                    self._upsert(con, batch)
+                    batch = []
+            self._upsert(con, batch)
+            gone = [(p,) for p in known if p not in seen]
+            con.executemany('DELETE FROM files WHERE path = ?', gone)
+            stats['removed'] = len(gone)
+        return stats
+
+    @staticmethod
+    def _upsert(con: sqlite3.Connection, rows: List[tuple]) -> None:
+        con.executemany('INSERT OR REPLACE INTO files (path, name, labels, subset, size, mtime_ns, sha1, width, height) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def query(self, root: Optional[str] = None, subset: Optional[str] = None, label: Optional[str] = None) -> List[sqlite3.Row]:
+        sql = 'SELECT * FROM files WHERE 1 = 1'
+        args: List = []
+        if root:
+            lo, hi = _prefix_range(root)
+            sql += ' AND path >= ? AND path < ?'
+            args += [lo, hi]
+        if subset:
+            sql += ' AND subset = ?'
+            args.append(subset)
+        if label:
+            sql += " AND (' ' || labels || ' ') LIKE ?"
+            args.append(f'% {label} %')
+        with self.connect() as con:
+            return con.execute(sql + ' ORDER BY path', args).fetchall()
+
+    def by_name(self, root: str) -> Dict[str, sqlite3.Row]:
+        return {r['name']: r for r in self.query(root)}
+
+    def rename(self, pairs: List[Tuple[str, str]]) -> None:
+        """Move rows along with renamed files so they need no re-hash."""
+        rows = [(os.path.normpath(dst), os.path.basename(dst), os.path.normpath(src)) for src, dst in pairs if src != dst]
+        with self.connect() as con:
+            con.executemany('UPDATE OR REPLACE files SET path = ?, name = ? WHERE path = ?', rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Maintain and query the dataset manifest.')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_refresh = sub.add_parser('refresh', help='incrementally index a folder')
+    p_refresh.add_argument('root')
+    p_refresh.add_argument('--csv', help='train.csv with image,labels columns')
+    p_refresh.add_argument('--no-hash', action='store_true')
+    p_query = sub.add_parser('query', help='list indexed images')
+    p_query.add_argument('root', nargs='?')
+    p_query.add_argument('--subset')
+    p_query.add_argument('--label')
+    args = parser.parse_args()
+
+    manifest = Manifest(args.db)
+    if args.cmd == 'refresh':
+        labels = read_csv_labels(args.csv) if args.csv else None
+        stats = manifest.refresh(args.root, labels=labels, hash_files=not args.no_hash)
+        print(', '.join(f'{k}: {v}' for k, v in stats.items()))
+        return 0
+    rows = manifest.query(args.root, subset=args.subset, label=args.label)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['path', 'labels', 'subset', 'size', 'sha1', 'width', 'height'])
+    for r in rows:
+        writer.writerow([r['path'], r['labels'], r['subset'], r['size'], r['sha1'], r['width'], r['height']])
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
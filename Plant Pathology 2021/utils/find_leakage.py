@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Find near-duplicate images that leak across train/valid/test subsets.
+
+Roboflow exports (`*_jpg.rf.<hash>.jpg`) and the multi-class copies made by
+split_by_class.py mean the same leaf photo can reach several subsets under
+different names, which filename-based checks cannot see. This script:
+
+- indexes the subset tree in the dataset manifest (utils/dataset_manifest.py),
+- computes a 64-bit DCT perceptual hash per image in a process pool and
+  caches it in the manifest database keyed by the file's SHA-1, so only new
+  or changed images are hashed on the next run (rows indexed without a
+  SHA-1, e.g. by `refresh --no-hash`, get one first),
+- finds pairs within `--threshold` Hamming distance with a BK-tree instead
+  of comparing every pair,
+- writes a CSV report of cross-subset pairs and, with `--fix`, moves the
+  leaked copies out of the lower-priority subsets (train > valid > test)
+  into `<root>/_leaked/`, keeping their path relative to the root (a
+  numeric suffix is added if that name is already taken).
+
+Images that cannot be read are listed as a warning and the exit status is
+non-zero, so a partial check is never reported as clean.
+
+Usage:
+  python utils/find_leakage.py                       # root from split_config.json
+  python utils/find_leakage.py dataset/object_detection --threshold 6 --fix
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from dataset_manifest import DEFAULT_DB, Manifest, file_sha1
+
+DEFAULT_CONFIG = os.path.join('utils', 'split_config.json')
+SUBSET_PRIORITY = ('train', 'valid', 'test')
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(path: str) -> Optional[int]:
+    """64-bit pHash: low-frequency 8x8 DCT block of a 32x32 grayscale, thresholded at its median."""
+    try:
+        with Image.open(path) as im:
+            small = np.asarray(im.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    except Exception:
+        return None
+    low = (DCT @ small @ DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])
+    return int(sum(1 << i for i, b in enumerate(bits) if b))
+
+
+def safe_sha1(path: str) -> Optional[str]:
+    try:
+        return file_sha1(path)
+    except OSError:
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Metric tree over Hamming distance; each node is [hash, payloads, {distance: child}]."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, h: int, payload) -> None:
+        if self.root is None:
+            self.root = [h, [payload], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [payload], {}]
+                return
+            node = child
+
+    def search(self, h: int, radius: int) -> List[Tuple[int, object]]:
+        out = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                out.extend((d, p) for p in node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        return out
+
+
+def ensure_cache(manifest: Manifest) -> None:
+    with manifest.connect() as con:
+        con.execute('CREATE TABLE IF NOT EXISTS phash (sha1 TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+
+
+def load_hashes(manifest: Manifest, rows, workers: int) -> Dict[str, int]:
+    """{path: pHash}, computing only hashes missing from the cache.
+
+    `rows` are dicts; rows without a SHA-1 are hashed first and the
+    manifest is updated with the result.
+    """
+    ensure_cache(manifest)
+    unhashed = [r for r in rows if not r['sha1']]
+    if unhashed:
+        print(f'{len(unhashed)} images were indexed without a SHA-1; hashing them now...')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for r, sha in zip(unhashed, pool.map(safe_sha1, [r['path'] for r in unhashed], chunksize=64)):
+                r['sha1'] = sha
+        with manifest.connect() as con:
+            con.executemany('UPDATE files SET sha1 = ? WHERE path = ?',
+                            [(r['sha1'], r['path']) for r in unhashed if r['sha1']])
+    with manifest.connect() as con:
+        cached = {r['sha1']: int(r['hash'], 16) for r in con.execute('SELECT sha1, hash FROM phash')}
+    todo = {}
+    for r in rows:
+        if r['sha1'] and r['sha1'] not in cached and r['sha1'] not in todo:
+            todo[r['sha1']] = r['path']
+    if todo:
+        print(f'Hashing {len(todo)} new images with {workers} processes...')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            computed = dict(zip(todo.keys(), pool.map(phash, todo.values(), chunksize=64)))
+        new_rows = [(sha, f'{h:016x}') for sha, h in computed.items() if h is not None]
+        with manifest.connect() as con:
+            con.executemany('INSERT OR REPLACE INTO phash (sha1, hash) VALUES (?, ?)', new_rows)
+        cached.update({sha: h for sha, h in computed.items() if h is not None})
+    return {r['path']: cached[r['sha1']] for r in rows if r['sha1'] in cached}
+
+
+def find_pairs(hashes: Dict[str, int], subsets: Dict[str, str], threshold: int) -> List[Tuple[str, str, int]]:
+    """Near-duplicate pairs (a, b, distance) whose subsets differ."""
+    tree = BKTree()
+    for path, h in hashes.items():
+        tree.add(h, path)
+    pairs = []
+    for a, h in hashes.items():
+        for d, b in tree.search(h, threshold):
+            if a < b and subsets.get(a) != subsets.get(b):
+                pairs.append((a, b, d))
+    return sorted(pairs)
+
+
+def leaked_path(root: str, path: str) -> str:
+    """Free destination for `path` under <root>/_leaked/, mirroring its path relative to the root."""
+    dst = os.path.join(root, '_leaked', os.path.relpath(path, root))
+    base, ext = os.path.splitext(dst)
+    counter = 1
+    while os.path.exists(dst):
+        dst = f'{base}_{counter}{ext}'
+        counter += 1
+    return dst
+
+
+def quarantine(root: str, pairs: List[Tuple[str, str, int]], subsets: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Keep each duplicate group in its highest-priority subset; move the rest aside."""
+    parent: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b, _ in pairs:
+        parent[find(a)] = find(b)
+    groups: Dict[str, List[str]] = {}
+    for p in list(parent):
+        groups.setdefault(find(p), []).append(p)
+
+    moved = []
+    rank = {s: i for i, s in enumerate(SUBSET_PRIORITY)}
+    for members in groups.values():
+        keep = min((subsets.get(m) for m in members), key=lambda s: rank.get(s, len(rank)))
+        for m in members:
+            if subsets.get(m) == keep:
+                continue
+            dst = leaked_path(root, m)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.move(m, dst)
+            moved.append((m, dst))
+    return moved
+
+
+def main() -> int:
+    try:
+        with open(DEFAULT_CONFIG, 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+    except Exception:
+        cfg = {}
+    parser = argparse.ArgumentParser(description='Report or fix near-duplicate leakage across subsets.')
+    parser.add_argument('root', nargs='?', default=cfg.get('subset', {}).get('out_dir'))
+    parser.add_argument('--db', default=cfg.get('manifest') or DEFAULT_DB)
+    parser.add_argument('--threshold', type=int, default=6, help='max Hamming distance (of 64 bits) for a near-duplicate')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--report', default=None, help='CSV report path (default: <root>/leakage_report.csv)')
+    parser.add_argument('--fix', action='store_true', help='move leaked copies into <root>/_leaked/')
+    args = parser.parse_args()
+    if not args.root or not os.path.isdir(args.root):
+        print(f'Subset folder not found: {args.root}', file=sys.stderr)
+        return 2
+
+    manifest = Manifest(args.db)
+    manifest.refresh(args.root)
+    leaked_dir = os.path.join(os.path.normpath(args.root), '_leaked') + os.sep
+    rows = [dict(r) for r in manifest.query(args.root) if r['subset'] and not r['path'].startswith(leaked_dir)]
+    subsets = {r['path']: r['subset'] for r in rows}
+    hashes = load_hashes(manifest, rows, args.workers)
+    pairs = find_pairs(hashes, subsets, args.threshold)
+
+    report = args.report or os.path.join(args.root, 'leakage_report.csv')
+    with open(report, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path_a', 'subset_a', 'path_b', 'subset_b', 'distance'])
+        for a, b, d in pairs:
+            writer.writerow([a, subsets[a], b, subsets[b], d])
+    print(f'{len(hashes)} images hashed, {len(pairs)} cross-subset near-duplicate pairs (threshold {args.threshold}).')
+    print(f'Report written to {report}')
+    unchecked = sorted(r['path'] for r in rows if r['path'] not in hashes)
+    if unchecked:
+        print(f'WARNING: {len(unchecked)} of {len(rows)} images could not be read and were not checked for leakage:',
+              file=sys.stderr)
+        for path in unchecked[:20]:
+            print(f'  {path}', file=sys.stderr)
+        if len(unchecked) > 20:
+            print(f'  ... and {len(unchecked) - 20} more', file=sys.stderr)
+
+    if args.fix and pairs:
+        moved = quarantine(args.root, pairs, subsets)
+        manifest.refresh(args.root)
+        print(f'Moved {len(moved)} leaked images into {leaked_dir}')
+    if pairs and not args.fix:
+        return 1
+    return 3 if unchecked else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -8,148 +8,327 @@ with rows: original_image_name,new_name. If an original image appears in
 multiple class folders, multiple mapping rows will be created (one per
 renamed copy).
 
+All new names are planned in memory from a single scan of each class
+folder. Before anything is renamed the plan is written to an append-only
+journal (`mapping.csv.journal` by default, JSON lines); every applied
+rename is then appended as it happens, so an interrupted run can be
+resumed or rolled back from the journal. If the dataset manifest is
+configured (`manifest`), its rows follow the renames so nothing is re-hashed.
+
 Safe defaults:
 - The script defaults to base folder `dataset/original_dataset_split_by_class`.
-- It does a dry-run by default; add `--apply` to actually perform renames.
+- It does a dry-run unless `apply` is true in utils/split_config.json.
 - It will skip files that already look renamed (leading digits + underscore)
-  to avoid double-renaming unless `--force` is provided.
+  to avoid double-renaming unless `force` is provided.
 
-Usage examples:
-  # Dry-run (no changes):
+Usage examples (settings live in the `rename` section of split_config.json):
+  # Plan and rename ("action": "run", the default); a dry-run
+  # unless "apply" is true:
   python utils/rename_split_images.py
 
-  # Apply renaming and write mapping.csv:
-  python utils/rename_split_images.py --apply
-
-  # Start numbering from 1000 and 6-digit padding:
-  python utils/rename_split_images.py --apply --start 1000 --pad 6
+  # Finish an interrupted run:            "action": "resume"
+  # Undo a finished or interrupted run:   "action": "rollback"
 
 """
 from __future__ import annotations
 
 import csv
+import functools
 import json
 import os
 import re
 import sys
-from typing import List, Tuple
+from typing import Dict, List, Optional, Pattern, Set, Tuple
 
 IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.gif'}
 DEFAULT_BASE = os.path.join('dataset', 'original_dataset_split_by_class')
 DEFAULT_MAPPING = os.path.join('dataset', 'original_dataset', 'mapping.csv')
 DEFAULT_CONFIG = os.path.join('utils', 'split_config.json')
 
+# fsync the journal after this many applied renames (and always at the end)
+JOURNAL_SYNC_EVERY = 256
+
+# "run" plans and renames (dry-run unless "apply"); the others work from the journal
+ACTIONS = ('run', 'resume', 'rollback')
+
+# (class_name, src_path, dst_path); src == dst for files that are kept as-is
+Plan = List[Tuple[str, str, str]]
+
 
 def is_image_file(name: str) -> bool:
-    name_lower = name.lower()
-    return any(name_lower.endswith(ext) for ext in IMAGE_EXTS)
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTS
 
 
 def find_class_folders(base: str) -> List[str]:
     if not os.path.isdir(base):
         raise FileNotFoundError(f'Base folder not found: {base}')
-    entries = sorted(os.listdir(base))
-    return [os.path.join(base, e) for e in entries if os.path.isdir(os.path.join(base, e))]
+    with os.scandir(base) as it:
+        return sorted(e.path for e in it if e.is_dir())
 
 
 def make_new_name(index: int, pad: int, class_name: str, ext: str) -> str:
     return f"{index:0{pad}d}_{class_name}{ext}"
 
 
-def already_renamed(name: str, pad: int) -> bool:
+@functools.lru_cache(maxsize=None)
+def renamed_pattern(pad: int) -> Pattern[str]:
     # matches something like 00001_class.ext or 0001_anything
-    return re.match(rf'^\d{{{pad},}}_', name) is not None
+    return re.compile(rf'^\d{{{pad},}}_')
+
+
+def already_renamed(name: str, pad: int) -> bool:
+    return renamed_pattern(pad).match(name) is not None
+
+
+def scan_folder(folder: str) -> List[str]:
+    """Return the sorted file names in `folder` (one scandir call)."""
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it if e.is_file())
 
 
 def collect_files(base: str) -> List[Tuple[str, str]]:
     """Return list of tuples (class_name, file_path) for image files found."""
-    folders = find_class_folders(base)
     out = []
-    for folder in folders:
+    for folder in find_class_folders(base):
         class_name = os.path.basename(folder)
-        for fn in sorted(os.listdir(folder)):
-            if not is_image_file(fn):
-                continue
-            out.append((class_name, os.path.join(folder, fn)))
+        for fn in scan_folder(folder):
+            if is_image_file(fn):
+                out.append((class_name, os.path.join(folder, fn)))
     return out
 
 
 def ensure_dir(path: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
 
 
-def run(base: str, mapping_csv: str, start: int = 1, pad: int = 5, apply: bool = False, skip_existing: bool = True, force: bool = False) -> int:
-    files = collect_files(base)
-    if not files:
-        print('No image files found under', base, file=sys.stderr)
-        return 1
-
-    # prepare mapping output directory
-    ensure_dir(mapping_csv)
-
+def plan_renames(base: str, start: int = 1, pad: int = 5, skip_existing: bool = True, force: bool = False) -> Tuple[Plan, int]:
+    """Choose every new name in memory. Returns (plan, collisions)."""
     index = int(start)
-    mappings: List[Tuple[str, str]] = []
+    plan: Plan = []
     collisions = 0
+    # new names must be unique across all classes
+    used_names: Set[str] = set()
 
-    # We'll maintain a set of new names to ensure uniqueness across all classes
-    used_names = set()
-
-    for class_name, path in files:
-        dirname = os.path.dirname(path)
-        orig_name = os.path.basename(path)
-
-        if skip_existing and already_renamed(orig_name, pad) and not force:
-            # skip and record mapping (original -> same name)
-            mappings.append((orig_name, orig_name))
-            continue
-
-        ext = os.path.splitext(orig_name)[1]
-        # find next available name
-        while True:
-            new_name = make_new_name(index, pad, class_name, ext)
-            if new_name in used_names:
-                index += 1
+    for folder in find_class_folders(base):
+        class_name = os.path.basename(folder)
+        names = scan_folder(folder)
+        present = set(names)
+        for orig_name in names:
+            if not is_image_file(orig_name):
                 continue
-            dst_path = os.path.join(dirname, new_name)
-            if os.path.exists(dst_path) and not force:
-                # collision with existing file, advance index
-                collisions += 1
-                index += 1
+            path = os.path.join(folder, orig_name)
+            if skip_existing and already_renamed(orig_name, pad) and not force:
+                # keep and record mapping (original -> same name)
+                plan.append((class_name, path, path))
                 continue
-            # got a free name
-            break
 
-        used_names.add(new_name)
-        mappings.append((orig_name, new_name))
-
-        if apply:
+            ext = os.path.splitext(orig_name)[1]
+            # find next available name
+            while True:
+                new_name = make_new_name(index, pad, class_name, ext)
+                if new_name in used_names:
+                    index += 1
+                    continue
+                if new_name in present and not force:
+                    # collision with existing file, advance index
+                    collisions += 1
+                    index += 1
+                    continue
+                break
+
+            used_names.add(new_name)
+            plan.append((class_name, path, os.path.join(folder, new_name)))
+            index += 1
+    return plan, collisions
+
+
+class Journal:
+    """Append-only JSON-lines log of a rename run.
+
+    Records: {"op": "plan", "i", "src", "dst"} for every planned file
+    (src == dst for files kept as-is), then
+    {"op": "begin"}, {"op": "done", "i"} per applied rename, and finally
+    {"op": "commit"} or {"op": "rollback"}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = None
+        self._pending = 0
+
+    def __enter__(self) -> 'Journal':
+        ensure_dir(self.path)
+        torn = False
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+        self._f = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            # terminate a record cut short by a crash so new records parse
+            self._f.write('\n')
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.sync()
+        self._f.close()
+
+    def write(self, record: Dict, sync: bool = False) -> None:
+        self._f.write(json.dumps(record) + '\n')
+        self._pending += 1
+        if sync or self._pending >= JOURNAL_SYNC_EVERY:
+            self.sync()
+
+    def sync(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+
+    @staticmethod
+    def read(path: str) -> Tuple[Dict[int, Tuple[str, str]], Set[int], Optional[str]]:
+        """Return (planned renames by index, applied indexes, final state)."""
+        planned: Dict[int, Tuple[str, str]] = {}
+        done: Set[int] = set()
+        state = None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # record cut short by a crash
+                op = rec.get('op')
+                if op == 'plan':
+                    planned[rec['i']] = (rec['src'], rec['dst'])
+                elif op == 'done':
+                    done.add(rec['i'])
+                elif op in ('begin', 'commit', 'rollback'):
+                    state = op
+        return planned, done, state
+
+
+def write_mapping(mapping_csv: str, rows: List[Tuple[str, str]]) -> None:
+    with open(mapping_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['original_image_name', 'new_name'])
+        writer.writerows(rows)
+    print(f'Mapping CSV written to {mapping_csv} ({len(rows)} rows)')
+
+
+def update_manifest(manifest_db: Optional[str], pairs: List[Tuple[str, str]]) -> None:
+    """Move dataset manifest rows along with the renamed files."""
+    if not manifest_db or not os.path.exists(manifest_db):
+        return
+    from dataset_manifest import Manifest
+    Manifest(manifest_db).rename(pairs)
+
+
+def apply_journal(journal_path: str, manifest_db: Optional[str] = None) -> int:
+    """Apply (or finish applying) every planned rename not yet marked done.
+
+    A rename whose source is gone but whose target exists is treated as
+    done; it was applied just before a crash could record it.
+    """
+    planned, done, state = Journal.read(journal_path)
+    if state == 'rollback':
+        print('Journal was rolled back; nothing to resume.', file=sys.stderr)
+        return 1
+    failed = 0
+    with Journal(journal_path) as journal:
+        if state is None:
+            journal.write({'op': 'begin'}, sync=True)
+        for i in sorted(planned):
+            if i in done:
+                continue
+            src, dst = planned[i]
             try:
-                os.rename(path, dst_path)
+                if src == dst:
+                    pass
+                elif os.path.exists(src):
+                    os.rename(src, dst)
+                elif not os.path.exists(dst):
+                    raise FileNotFoundError(src)
+                journal.write({'op': 'done', 'i': i})
             except Exception as e:
-                print(f'Failed to rename {path} -> {dst_path}: {e}', file=sys.stderr)
-        else:
-            # dry-run print first few
-            if len(mappings) <= 20:
-                print(f'[DRY-RUN] {path} -> {os.path.join(dirname, new_name)}')
+                failed += 1
+                print(f'Failed to rename {src} -> {dst}: {e}', file=sys.stderr)
+        if not failed:
+            journal.write({'op': 'commit'}, sync=True)
+    update_manifest(manifest_db, [planned[i] for i in sorted(planned)])
+    if failed:
+        print(f'{failed} renames failed; fix the cause and re-run with "action": "resume".', file=sys.stderr)
+        return 2
+    return 0
+
+
+def rollback_journal(journal_path: str, manifest_db: Optional[str] = None) -> int:
+    """Undo applied renames in reverse order."""
+    planned, _, state = Journal.read(journal_path)
+    if state == 'rollback':
+        print('Journal already rolled back.')
+        return 0
+    failed = 0
+    restored = 0
+    undone: List[Tuple[str, str]] = []
+    for i in sorted(planned, reverse=True):
+        src, dst = planned[i]
+        if src == dst or not os.path.exists(dst) or os.path.exists(src):
+            continue
+        try:
+            os.rename(dst, src)
+            restored += 1
+            undone.append((dst, src))
+        except Exception as e:
+            failed += 1
+            print(f'Failed to restore {dst} -> {src}: {e}', file=sys.stderr)
+    update_manifest(manifest_db, undone)
+    if failed:
+        return 2
+    with Journal(journal_path) as journal:
+        journal.write({'op': 'rollback'}, sync=True)
+    print(f'Rolled back {restored} renames.')
+    return 0
+
+
+def run(base: str, mapping_csv: str, start: int = 1, pad: int = 5, apply: bool = False, skip_existing: bool = True,
+        force: bool = False, journal_path: Optional[str] = None, manifest_db: Optional[str] = None) -> int:
+    plan, collisions = plan_renames(base, start=start, pad=pad, skip_existing=skip_existing, force=force)
+    if not plan:
+        print('No image files found under', base, file=sys.stderr)
+        return 1
 
-        index += 1
+    mappings = [(os.path.basename(src), os.path.basename(dst)) for _, src, dst in plan]
+    renames = [(src, dst) for _, src, dst in plan if src != dst]
+    journal_path = journal_path or mapping_csv + '.journal'
 
-    # Write mapping CSV
     if apply:
+        if os.path.exists(journal_path):
+            _, _, state = Journal.read(journal_path)
+            if state == 'begin':
+                print(f'Unfinished journal {journal_path}; use "action": "resume" or "rollback" first.', file=sys.stderr)
+                return 3
+            os.replace(journal_path, journal_path + '.prev')
+        with Journal(journal_path) as journal:
+            for i, (_, src, dst) in enumerate(plan):
+                journal.write({'op': 'plan', 'i': i, 'src': src, 'dst': dst})
+            journal.sync()
+        rc = apply_journal(journal_path, manifest_db)
+        if rc:
+            return rc
         try:
-            with open(mapping_csv, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['original_image_name', 'new_name'])
-                for orig, new in mappings:
-                    writer.writerow([orig, new])
-            print(f'Mapping CSV written to {mapping_csv} ({len(mappings)} rows)')
+            ensure_dir(mapping_csv)
+            write_mapping(mapping_csv, mappings)
         except Exception as e:
             print(f'Failed to write mapping CSV: {e}', file=sys.stderr)
             return 2
     else:
+        for src, dst in renames[:20]:
+            print(f'[DRY-RUN] {src} -> {dst}')
         print('\nDry-run complete.')
-        print(f'Total files considered: {len(mappings)}')
-        print('To apply the changes, re-run with --apply')
+        print(f'Total files considered: {len(mappings)} ({len(renames)} to rename)')
+        print('To apply the changes, set "apply": true in the rename config')
 
     if collisions:
         print(f'Note: encountered {collisions} name collisions while choosing new names.')
@@ -168,6 +347,12 @@ def main():
     rename_cfg = cfg.get('rename', {})
     base = rename_cfg.get('base') or DEFAULT_BASE
     mapping = rename_cfg.get('mapping') or DEFAULT_MAPPING
+    journal = rename_cfg.get('journal') or mapping + '.journal'
+    action = rename_cfg.get('action', 'run')
+    if action not in ACTIONS:
+        print(f'Unknown rename action {action!r}; use one of: {", ".join(ACTIONS)}', file=sys.stderr)
+        return 2
+    manifest_db = cfg.get('manifest')
     start = int(rename_cfg.get('start') or 1)
     pad = int(rename_cfg.get('pad') or 5)
     # default: do rename immediately (no CLI flags)
@@ -175,7 +360,17 @@ def main():
     skip_existing = bool(rename_cfg.get('skip_existing', True))
     force = bool(rename_cfg.get('force', False))
 
-    return run(base=base, mapping_csv=mapping, start=start, pad=pad, apply=apply, skip_existing=skip_existing, force=force)
+    if action == 'resume':
+        rc = apply_journal(journal, manifest_db)
+        if rc == 0:
+            planned, _, _ = Journal.read(journal)
+            ensure_dir(mapping)
+            write_mapping(mapping, [(os.path.basename(src), os.path.basename(dst)) for _, (src, dst) in sorted(planned.items())])
+        return rc
+    if action == 'rollback':
+        return rollback_journal(journal, manifest_db)
+    return run(base=base, mapping_csv=mapping, start=start, pad=pad, apply=apply, skip_existing=skip_existing,
+               force=force, journal_path=journal, manifest_db=manifest_db)
 
 
 if __name__ == '__main__':
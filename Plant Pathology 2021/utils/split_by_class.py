@@ -2,28 +2,50 @@
 """Split images into class folders based on train.csv labels.
 
 Usage example:
-  python utils/split_by_class.py \
-    --csv dataset/original_dataset/train.csv \
-    --images dataset/original_dataset/train_images \
-    --out dataset/original_dataset_split_by_class
-
-This script copies images that belong to any of the target classes
-('healthy', 'rust', 'frog_eye_leaf_spot') into corresponding
-subfolders under the output folder. If an image has multiple labels,
-it will be copied into each matching class folder.
+  python utils/split_by_class.py
+
+Paths are read from utils/split_config.json (`csv`, `images`, `out`,
+`classes`). Images that belong to any of the target classes ('healthy',
+'rust', 'frog_eye_leaf_spot') are materialized into corresponding
+subfolders under the output folder. If an image has multiple labels, it
+is placed into each matching class folder.
+
+Materialization (`materialize` in the config):
+- 'copy'     real copies (shutil.copy2), done through a thread pool
+- 'hardlink' no extra disk usage; falls back to copy across filesystems
+- 'reflink'  copy-on-write clone (btrfs/xfs); falls back to copy
+- 'symlink'  absolute symlinks to the source images
+- 'auto'     reflink, then hardlink, then copy
+
+Note that hardlinked files share their content with the source: editing
+one in place edits both (renaming, as rename_split_images.py does, is safe).
+
+Up-to-date targets are skipped. The decision uses one os.scandir pass per
+folder and `skip_check`: 'mtime' (same size and mtime, or same inode/link
+target) or 'hash' (same size and SHA-1). With `prune` enabled, files in
+the class folders that are no longer labelled for that class are removed.
+When `manifest` is set, source hashes are read from the dataset manifest
+(utils/dataset_manifest.py) and the class folders are indexed into it.
 """
 from __future__ import annotations
 
-import argparse
 import csv
+import hashlib
+import json
 import os
 import shutil
+import stat
 import sys
-import json
-from typing import Iterable, List, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 DEFAULT_CLASSES = ["healthy", "rust", "frog_eye_leaf_spot"]
+DEFAULT_CONFIG = os.path.join('utils', 'split_config.json')
+MATERIALIZE_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'auto')
+
+# Linux ioctl to clone a file's extents (copy-on-write).
+FICLONE = 0x40049409
 
 
 def ensure_dir(path: str) -> None:
@@ -41,63 +63,113 @@ def parse_labels_field(field: str) -> List[str]:
     return [tok.strip() for tok in field.split() if tok.strip()]
 
 
-def split_by_class(csv_path: str, images_dir: str, out_dir: str, classes: Iterable[str]) -> dict:
-    """Read CSV and copy images to class folders.
-
-    Returns a summary dict with counts and missing files.
-    """
-    classes = list(classes)
-    class_set: Set[str] = set(classes)
-
-    # Prepare output folders
-    for cls in classes:
-        ensure_dir(os.path.join(out_dir, cls))
+def scan_dir(path: str) -> Dict[str, os.stat_result]:
+    """Return {name: lstat} for regular files and symlinks in `path` (one scandir)."""
+    entries: Dict[str, os.stat_result] = {}
+    if not os.path.isdir(path):
+        return entries
+    with os.scandir(path) as it:
+        for e in it:
+            if e.is_file(follow_symlinks=False) or e.is_symlink():
+                entries[e.name] = e.stat(follow_symlinks=False)
+    return entries
 
-    counts = {cls: 0 for cls in classes}
-    missing_files: List[str] = []
-    processed_images: Set[str] = set()
 
-    # Read CSV
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        # Expect headers 'image' and 'labels'
-        if 'image' not in reader.fieldnames or 'labels' not in reader.fieldnames:
-            raise ValueError("CSV must contain 'image' and 'labels' headers")
-from __future__ import annotations
+def file_sha1(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
 
-import csv
-import json
-import os
-import shutil
-import sys
-from typing import Iterable, List, Set
 
+def is_up_to_date(src: str, src_st: os.stat_result, dst: str, dst_st: os.stat_result, check: str,
+                  src_sha1: Optional[str] = None) -> bool:
+    """Decide whether `dst` already holds `src` without copying it again.
 
-DEFAULT_CLASSES = ["healthy", "rust", "frog_eye_leaf_spot"]
-DEFAULT_CONFIG = os.path.join('utils', 'split_config.json')
-
-
-def ensure_dir(path: str) -> None:
-    os.makedirs(path, exist_ok=True)
-
-
-def parse_labels_field(field: str) -> List[str]:
-    if field is None:
-        return []
-    return [tok.strip() for tok in field.split() if tok.strip()]
-
-
-def split_by_class(csv_path: str, images_dir: str, out_dir: str, classes: Iterable[str]) -> dict:
+    `src_sha1` (e.g. from the dataset manifest) avoids re-hashing the source.
+    """
+    if stat.S_ISLNK(dst_st.st_mode):
+        return os.readlink(dst) == os.path.abspath(src)
+    if (dst_st.st_ino, dst_st.st_dev) == (src_st.st_ino, src_st.st_dev):
+        return True  # hardlink to the source
+    if dst_st.st_size != src_st.st_size:
+        return False
+    if check == 'hash':
+        return (src_sha1 or file_sha1(src)) == file_sha1(dst)
+    return dst_st.st_mtime_ns == src_st.st_mtime_ns
+
+
+def reflink(src: str, dst: str) -> None:
+    import fcntl
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+    except OSError:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        raise
+
+
+def materialize(src: str, dst: str, mode: str) -> str:
+    """Place `src` at `dst` using `mode`; return the method actually used."""
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    if mode in ('reflink', 'auto'):
+        try:
+            reflink(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+    if mode in ('hardlink', 'auto'):
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def split_by_class(csv_path: str, images_dir: str, out_dir: str, classes: Iterable[str],
+                   mode: str = 'copy', workers: int = 8, check: str = 'mtime', prune: bool = False,
+                   manifest_db: Optional[str] = None) -> dict:
+    """Read CSV and materialize images into class folders.
+
+    With `manifest_db`, source hashes come from the dataset manifest and
+    the class folders are indexed there afterwards.
+
+    Returns a summary dict with counts, missing files and per-method totals.
+    """
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"materialize must be one of {MATERIALIZE_MODES}, got {mode!r}")
     classes = list(classes)
     class_set: Set[str] = set(classes)
 
-    # Prepare output folders
+    # Prepare output folders and take one snapshot of what is already there
+    existing: Dict[str, Dict[str, os.stat_result]] = {}
     for cls in classes:
         ensure_dir(os.path.join(out_dir, cls))
+        existing[cls] = scan_dir(os.path.join(out_dir, cls))
+    sources = scan_dir(images_dir)
+    manifest = None
+    src_hashes: Dict[str, str] = {}
+    if manifest_db:
+        from dataset_manifest import Manifest
+        manifest = Manifest(manifest_db)
+        manifest.refresh(images_dir, hash_files=(check == 'hash'))
+        src_hashes = {name: row['sha1'] for name, row in manifest.by_name(images_dir).items()}
 
     counts = {cls: 0 for cls in classes}
     missing_files: List[str] = []
     processed_images: Set[str] = set()
+    wanted: Dict[str, Set[str]] = {cls: set() for cls in classes}
+    jobs: List[Tuple[str, str, str]] = []  # src, dst, cls
+    skipped = 0
 
     with open(csv_path, newline='', encoding='utf-8') as f:
         reader = csv.DictReader(f)
@@ -111,35 +183,63 @@ def split_by_class(csv_path: str, images_dir: str, out_dir: str, classes: Iterab
                 continue
 
             labels = parse_labels_field(labels_field)
-            matches = [lbl for lbl in labels if lbl in class_set]
+            matches = [lbl for lbl in dict.fromkeys(labels) if lbl in class_set]
             if not matches:
                 continue
 
             src_path = os.path.join(images_dir, image_name)
-            if not os.path.isfile(src_path):
+            src_st = sources.get(image_name)
+            if src_st is None:
                 missing_files.append(src_path)
                 continue
 
             for cls in matches:
-                dst_dir = os.path.join(out_dir, cls)
-                ensure_dir(dst_dir)
-                dst_path = os.path.join(dst_dir, image_name)
-                try:
-                    if os.path.isfile(dst_path):
-                        if os.path.getsize(dst_path) == os.path.getsize(src_path):
-                            counts[cls] += 1
-                            continue
-                    shutil.copy2(src_path, dst_path)
+                wanted[cls].add(image_name)
+                dst_path = os.path.join(out_dir, cls, image_name)
+                dst_st = existing[cls].get(image_name)
+                if dst_st is not None and is_up_to_date(src_path, src_st, dst_path, dst_st, check, src_hashes.get(image_name)):
                     counts[cls] += 1
-                except Exception:
-                    missing_files.append(src_path)
+                    skipped += 1
+                    continue
+                jobs.append((src_path, dst_path, cls))
 
             processed_images.add(image_name)
 
+    methods: Dict[str, int] = {}
+
+    def run_job(job: Tuple[str, str, str]):
+        src_path, dst_path, cls = job
+        try:
+            return cls, materialize(src_path, dst_path, mode), None
+        except Exception:
+            return cls, None, src_path
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        for cls, method, failed in pool.map(run_job, jobs):
+            if failed:
+                missing_files.append(failed)
+                continue
+            counts[cls] += 1
+            methods[method] = methods.get(method, 0) + 1
+
+    pruned = 0
+    if prune:
+        for cls in classes:
+            for name in existing[cls]:
+                if name not in wanted[cls]:
+                    os.unlink(os.path.join(out_dir, cls, name))
+                    pruned += 1
+
+    if manifest is not None:
+        manifest.refresh(out_dir, reuse_from=images_dir)
+
     summary = {
         'counts': counts,
         'processed_images': len(processed_images),
         'missing_files': missing_files,
+        'up_to_date': skipped,
+        'methods': methods,
+        'pruned': pruned,
     }
     return summary
 
@@ -162,17 +262,28 @@ def main() -> int:
     out_path = cfg.get('out')
     classes_cfg = cfg.get('classes')
     classes = classes_cfg if isinstance(classes_cfg, list) else (classes_cfg.split(',') if isinstance(classes_cfg, str) else DEFAULT_CLASSES)
+    mode = cfg.get('materialize', 'copy')
+    workers = int(cfg.get('workers', 8))
+    check = cfg.get('skip_check', 'mtime')
+    prune = bool(cfg.get('prune', False))
+    manifest_db = cfg.get('manifest')
 
     if not (csv_path and images_path and out_path):
         print('csv, images, and out must be set in utils/split_config.json', file=sys.stderr)
         return 2
 
-    summary = split_by_class(csv_path, images_path, out_path, classes)
+    summary = split_by_class(csv_path, images_path, out_path, classes, mode=mode, workers=workers, check=check, prune=prune,
+                             manifest_db=manifest_db)
 
     print('\nSplit summary:')
     for cls, cnt in summary['counts'].items():
         print(f'  {cls}: {cnt}')
     print(f"Processed unique images: {summary['processed_images']}")
+    print(f"Already up to date: {summary['up_to_date']}")
+    for method, cnt in sorted(summary['methods'].items()):
+        print(f'  {method}: {cnt}')
+    if summary['pruned']:
+        print(f"Pruned stale files: {summary['pruned']}")
     if summary['missing_files']:
         print(f"Missing or failed copies: {len(summary['missing_files'])} (examples):")
         for pth in summary['missing_files'][:10]:
@@ -1,27 +1,44 @@
 #!/usr/bin/env python3
-"""Create subset folders with limited images per class and split into train/valid/test.
+"""Split the labelled images into train/valid/test subset folders.
 
 Reads configuration from utils/split_config.json by default. It will:
-- For each class folder under `base_split_dir`, take the first N images (sorted)
-  where N is `per_class_limit` (250 by default).
-- Split them sequentially into train/valid/test using ratios (70/10/20 default).
-- Copy images into `out_dir/{subset}/{class}` preserving extensions.
-- Write a mapping CSV `mapping_csv` with columns: original_path,new_path,subset
-
-The script does not attempt to deduplicate images that are present in multiple
-class folders; each file found under a class folder is treated independently
-(as they are separate files/copies in class folders).
+- Stream `train.csv` (`subset.csv`, falling back to the top-level `csv`)
+  once and keep rows with at least one of the target classes.
+- Assign every image to exactly one subset from a seeded SHA-1 of its
+  name, using the configured ratios (70/10/20 default) as thresholds.
+  The thresholds are applied identically inside every label combination,
+  so each class is split by the same ratios, and an image's subset only
+  depends on its name and the seed: adding rows to the CSV never moves
+  existing images, and multi-label images are never duplicated across
+  subsets.
+- Stop taking images for a class once `per_class_limit` is reached; an
+  image is skipped only when all of its classes are full.
+- Materialize the images into `out_dir/{subset}` from the original
+  images folder (copy/hardlink/reflink/symlink, see split_by_class.py).
+- Stream a mapping CSV `mapping_csv` with columns: name_file,subset,labels
+- Remove files from the subset folders that this run did not assign to
+  them (left over from another seed, ratios or limit, or rows that left
+  the CSV), so an image is never present in two subsets.
+
+Name collisions are resolved against an in-memory set of names already
+used in each subset. Run with `--dry-run` to print per-class and
+per-subset counts without touching the disk. When `manifest` is set, the
+subset folders are indexed into the dataset manifest with their labels.
 """
 from __future__ import annotations
 
+import csv
+import hashlib
 import json
-import math
 import os
-import shutil
 import sys
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+
+from split_by_class import DEFAULT_CLASSES, is_up_to_date, materialize, parse_labels_field, scan_dir
 
 DEFAULT_CONFIG = os.path.join('utils', 'split_config.json')
+SUBSETS = ('train', 'valid', 'test')
 
 
 def load_config(path: str) -> Dict:
@@ -33,111 +50,150 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def is_image_file(name: str) -> bool:
-    return os.path.splitext(name)[1].lower() in {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.gif'}
+def stable_unit(name: str, seed: str) -> float:
+    """Map `name` to a reproducible number in [0, 1)."""
+    digest = hashlib.sha1(f'{seed}:{name}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / float(1 << 64)
 
 
-def collect_class_images(base_split_dir: str) -> Dict[str, List[str]]:
-    classes = {}
-    if not os.path.isdir(base_split_dir):
-        raise FileNotFoundError(base_split_dir)
-    for entry in sorted(os.listdir(base_split_dir)):
-        folder = os.path.join(base_split_dir, entry)
-        if not os.path.isdir(folder):
-            continue
-        images = [f for f in sorted(os.listdir(folder)) if is_image_file(f)]
-        classes[entry] = [os.path.join(folder, f) for f in images]
-    return classes
+def assign_subset(u: float, ratios: Dict[str, float]) -> str:
+    # Ratios expected to sum to ~1.0, e.g. {'train':0.7,'valid':0.1,'test':0.2}
+    train_r = ratios.get('train', 0.7)
+    valid_r = ratios.get('valid', 0.1)
+    if u < train_r:
+        return 'train'
+    if u < train_r + valid_r:
+        return 'valid'
+    return 'test'
 
 
-def split_counts(total: int, ratios: Dict[str, float]) -> Dict[str, int]:
-    # Ratios expected to sum to ~1.0, e.g. {'train':0.7,'valid':0.1,'test':0.2}
-    train_n = int(math.floor(total * ratios.get('train', 0.7)))
-    valid_n = int(math.floor(total * ratios.get('valid', 0.1)))
-    test_n = total - train_n - valid_n
-    return {'train': train_n, 'valid': valid_n, 'test': test_n}
+def unique_name(fname: str, used: Set[str]) -> str:
+    if fname not in used:
+        return fname
+    base, ext = os.path.splitext(fname)
+    counter = 1
+    while f"{base}_{counter}{ext}" in used:
+        counter += 1
+    return f"{base}_{counter}{ext}"
 
 
 def run(config_path: str = DEFAULT_CONFIG, dry_run: bool = False) -> int:
     cfg = load_config(config_path)
     subset_cfg = cfg.get('subset', {})
-    base_split_dir = subset_cfg.get('base_split_dir')
+    csv_path = subset_cfg.get('csv') or cfg.get('csv')
+    images_dir = subset_cfg.get('images') or cfg.get('images')
     out_dir = subset_cfg.get('out_dir')
     per_class_limit = int(subset_cfg.get('per_class_limit', 250))
     ratios = subset_cfg.get('ratios', {'train': 0.7, 'valid': 0.1, 'test': 0.2})
     mapping_csv = subset_cfg.get('mapping_csv')
+    seed = str(subset_cfg.get('seed', 'pp2021'))
+    classes = subset_cfg.get('classes') or cfg.get('classes') or DEFAULT_CLASSES
+    mode = subset_cfg.get('materialize') or cfg.get('materialize', 'copy')
+    workers = int(subset_cfg.get('workers') or cfg.get('workers', 8))
+    manifest_db = cfg.get('manifest')
 
-    if not (base_split_dir and out_dir and mapping_csv):
+    if not (csv_path and images_dir and out_dir and mapping_csv):
         print('Invalid subset config in', config_path, file=sys.stderr)
         return 2
 
-    classes = collect_class_images(base_split_dir)
-    all_mappings: List[Tuple[str, str, str]] = []  # orig, new, subset
-
-    for cls, paths in classes.items():
-        selected = paths[:per_class_limit]
-        counts = split_counts(len(selected), ratios)
-        # sequential split
-        idx = 0
-        for subset_name in ('train', 'valid', 'test'):
-            n = counts[subset_name]
-            for i in range(n):
-                if idx >= len(selected):
-                    break
-                src = selected[idx]
-                fname = os.path.basename(src)
-                # place files directly under out_dir/{subset} (no per-class subfolders)
-                dst_dir = os.path.join(out_dir, subset_name)
-                ensure_dir(dst_dir)
-
-                # use original filename (no class prefix)
-                dst_path = os.path.join(dst_dir, fname)
-
-                # if collision occurs (unlikely per your note), append a counter
-                if os.path.exists(dst_path):
-                    base, ext = os.path.splitext(fname)
-                    counter = 1
-                    while True:
-                        new_name = f"{base}_{counter}{ext}"
-                        dst_path = os.path.join(dst_dir, new_name)
-                        if not os.path.exists(dst_path):
-                            fname = new_name
-                            break
-                        counter += 1
-
-                all_mappings.append((src, dst_path, subset_name))
-                if not dry_run:
-                    try:
-                        shutil.copy2(src, dst_path)
-                    except Exception as e:
-                        print(f'Failed to copy {src} -> {dst_path}: {e}', file=sys.stderr)
-                idx += 1
-
-    # Write mapping CSV
+    class_set = set(classes)
+    class_counts: Dict[str, int] = {cls: 0 for cls in classes}
+    table: Dict[str, Dict[str, int]] = {cls: {s: 0 for s in SUBSETS} for cls in classes}
+    subset_totals: Dict[str, int] = {s: 0 for s in SUBSETS}
+    used: Dict[str, Set[str]] = {s: set() for s in SUBSETS}
+    existing: Dict[str, Dict[str, os.stat_result]] = {}
+    seen: Set[str] = set()
+    labels_by_fname: Dict[str, str] = {}
+    jobs: List[Tuple[str, str, os.stat_result, str]] = []  # src, dst, src stat, subset
+    missing = 0
+    sources = scan_dir(images_dir)
+
+    writer = None
+    mapping_file = None
+    if not dry_run:
+        ensure_dir(os.path.dirname(mapping_csv) or '.')
+        for s in SUBSETS:
+            ensure_dir(os.path.join(out_dir, s))
+            existing[s] = scan_dir(os.path.join(out_dir, s))
+        mapping_file = open(mapping_csv, 'w', newline='', encoding='utf-8')
+        writer = csv.writer(mapping_file)
+        writer.writerow(['name_file', 'subset', 'labels'])
+
+    try:
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if 'image' not in reader.fieldnames or 'labels' not in reader.fieldnames:
+                raise ValueError("CSV must contain 'image' and 'labels' headers")
+            for row in reader:
+                name = row.get('image')
+                if not name or name in seen:
+                    continue
+                labels = [lbl for lbl in dict.fromkeys(parse_labels_field(row.get('labels', ''))) if lbl in class_set]
+                if not labels or all(class_counts[lbl] >= per_class_limit for lbl in labels):
+                    continue
+                src_st = sources.get(name)
+                if src_st is None:
+                    missing += 1
+                    continue
+                seen.add(name)
+                subset_name = assign_subset(stable_unit(name, seed), ratios)
+                fname = unique_name(name, used[subset_name])
+                used[subset_name].add(fname)
+                subset_totals[subset_name] += 1
+                for lbl in labels:
+                    class_counts[lbl] += 1
+                    table[lbl][subset_name] += 1
+                labels_by_fname[fname] = ' '.join(labels)
+                if writer is not None:
+                    writer.writerow([fname, subset_name, labels_by_fname[fname]])
+                    jobs.append((os.path.join(images_dir, name), os.path.join(out_dir, subset_name, fname), src_st, subset_name))
+    except Exception as e:
+        print(f'Failed to split {csv_path}: {e}', file=sys.stderr)
+        return 3
+    finally:
+        if mapping_file is not None:
+            mapping_file.close()
+
+    failed = 0
     if not dry_run:
-        try:
-            parent_dir = os.path.dirname(mapping_csv) or '.'
-            ensure_dir(parent_dir)
-            with open(mapping_csv, 'w', newline='', encoding='utf-8') as f:
-                import csv
-                writer = csv.writer(f)
-                # concise mapping: filename in subset, subset name
-                writer.writerow(['name_file', 'subset'])
-                for orig, new, subset in all_mappings:
-                    writer.writerow([os.path.basename(new), subset])
-            print(f'Mapping CSV written to {mapping_csv} ({len(all_mappings)} rows)')
-        except Exception as e:
-            print(f'Failed to write mapping CSV: {e}', file=sys.stderr)
-            return 3
-    else:
-        print('Dry-run complete. Files selected (examples):')
-        for entry in all_mappings[:20]:
-            print(' ', entry)
-        print(f'Total files to copy: {len(all_mappings)}')
-
-    return 0
+        def run_job(job: Tuple[str, str, os.stat_result, str]) -> bool:
+            src, dst, src_st, subset_name = job
+            dst_st = existing[subset_name].get(os.path.basename(dst))
+            try:
+                if dst_st is None or not is_up_to_date(src, src_st, dst, dst_st, 'mtime'):
+                    materialize(src, dst, mode)
+                return True
+            except Exception as e:
+                print(f'Failed to materialize {src} -> {dst}: {e}', file=sys.stderr)
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            failed = sum(1 for ok in pool.map(run_job, jobs) if not ok)
+        pruned = 0
+        for s in SUBSETS:
+            for fname in existing[s]:
+                if fname not in used[s]:
+                    os.unlink(os.path.join(out_dir, s, fname))
+                    pruned += 1
+        print(f'Mapping CSV written to {mapping_csv} ({len(seen)} rows)')
+        if pruned:
+            print(f'Removed {pruned} stale files from the subset folders')
+        if manifest_db:
+            from dataset_manifest import Manifest
+            Manifest(manifest_db).refresh(out_dir, labels=labels_by_fname, reuse_from=images_dir)
+
+    print('\nPer-class / per-subset counts:')
+    print(f"  {'class':<22}" + ''.join(f'{s:>8}' for s in SUBSETS) + f"{'total':>8}")
+    for cls in classes:
+        row = table[cls]
+        print(f'  {cls:<22}' + ''.join(f'{row[s]:>8}' for s in SUBSETS) + f'{sum(row.values()):>8}')
+    print(f"  {'images':<22}" + ''.join(f'{subset_totals[s]:>8}' for s in SUBSETS) + f'{len(seen):>8}')
+    if missing:
+        print(f'Images listed in the CSV but missing from {images_dir}: {missing}')
+    if dry_run:
+        print('Dry-run complete; nothing was written.')
+    return 4 if failed else 0
 
 
 if __name__ == '__main__':
-    # default run (not dry-run)
-    raise SystemExit(run())
+    raise SystemExit(run(dry_run='--dry-run' in sys.argv[1:]))
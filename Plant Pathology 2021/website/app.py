@@ -1,29 +1,76 @@
 import os
+import sys
 import glob
+import json
+import hashlib
+import io
+import shutil
+import time
 import traceback
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, session
-from werkzeug.utils import secure_filename
+import uuid
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, stream_with_context, jsonify, abort, send_file
+from werkzeug.utils import safe_join, secure_filename
+
+import caching
+import cascade
+import masks
+import model_cache
+import pipeline
+import profiles
+import singleflight
+import stage_cache
+import thumbnails
+from results_store import GROUPS, ResultsStore
+from upload_registry import UploadRegistry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'utils'))
+from dataset_manifest import Manifest
 
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results_predict'
 MODELS_FOLDER = os.path.join('models', 'object_detection')
+# the manifest the dataset tools write (utils/split_config.json, tools/copy_assets.py)
+MANIFEST_DB = os.path.join(os.path.dirname(BASE_DIR), 'dataset', 'manifest.sqlite')
+UPLOAD_DB = 'uploads.sqlite'
+RESULTS_DB = 'results.sqlite'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULTS_FOLDER'] = RESULTS_FOLDER
 app.secret_key = 'change-me'
+caching.init_app(app)
+app.jinja_env.globals['inference_profiles'] = profiles.NAMES
+app.jinja_env.globals['default_skip_rules'] = ','.join(f'{k}:{v:g}' for k, v in pipeline.SKIP_RULES.items())
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 os.makedirs(MODELS_FOLDER, exist_ok=True)
 
+UPLOADS = UploadRegistry(UPLOAD_DB, UPLOAD_FOLDER)
+RESULTS = ResultsStore(RESULTS_DB)
+MANIFEST = Manifest(MANIFEST_DB)
+
 # Simple in-memory model cache to avoid re-loading models each request
 MODEL_CACHE = {
     'detection': {},
     'segmentation': {}
 }
 
+# With INFERENCE_SOCKET set, models live in a separate inference process (inference_server.py)
+INFERENCE_SOCKET = os.environ.get('INFERENCE_SOCKET')
+INFERENCE = None
+if INFERENCE_SOCKET:
+    from inference_server import InferenceClient, RemoteModel
+    INFERENCE = InferenceClient(INFERENCE_SOCKET)
+
+# Detection and per-crop segmentation outputs, reused when a re-run only changes later stages
+STAGES = stage_cache.StageCache()
+
+# Identical predictions (same image content and parameters) running at the same time share one computation
+FLIGHTS = singleflight.SingleFlight()
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -77,37 +124,64 @@ def dashboard():
     return render_template('dashboard.html', examples=examples, models=models)
 
 
+DATASET_SAMPLES = os.path.join(BASE_DIR, 'static', 'dataset_samples')
+DATASET_PAGE_SIZE = 48
+
+
+def dataset_rows(subset, label=''):
+    """Manifest rows of the sample images of one subset, optionally filtered by a label substring.
+
+    The samples are indexed when tools/copy_assets.py syncs them; requests only query the manifest.
+    """
+    rows = [r for r in MANIFEST.query(os.path.join(DATASET_SAMPLES, subset)) if r['name'].lower().endswith(('.jpg', '.jpeg', '.png'))]
+    label = label.strip().lower().replace('_', '-')
+    if label:
+        rows = [r for r in rows if label in r['labels'].replace('_', '-')]
+    return rows
+
+
+def gallery_item(subset, r):
+    return {
+        'name': r['name'],
+        'label': r['labels'].split()[0].replace('_', '-') if r['labels'] else 'unknown',
+        'width': r['width'],
+        'height': r['height'],
+        'thumbs': thumbnails.urls(r['sha1'], url_for) if r['sha1'] else None,
+        'full': caching.asset_url(f'dataset_samples/{subset}/{r["name"]}', r['sha1']),
+    }
+
+
 @app.route('/dataset')
 def dataset():
     samples = {}
-    base = os.path.join('static', 'dataset_samples')
-    full_lists = {}
+    totals = {}
     for subset in ('train', 'valid', 'test'):
-        folder = os.path.join(base, subset)
-        if os.path.exists(folder):
-            files = [f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-            files_sorted = sorted(files)
-            samples[subset] = files_sorted[:6]
-            full_lists[subset] = files_sorted
-        else:
-            samples[subset] = []
-            full_lists[subset] = []
-
-    def infer_class(name):
-        lname = name.lower()
-        if 'frog' in lname:
-            return 'frog-eye-leaf-spot'
-        if 'rust' in lname:
-            return 'rust'
-        if 'healthy' in lname:
-            return 'healthy'
-        return 'unknown'
-
-    classes = {}
-    for subset, fl in full_lists.items():
-        classes[subset] = {f: infer_class(f) for f in fl}
-
-    return render_template('dataset.html', samples=samples, full_lists=full_lists, classes=classes)
+        rows = dataset_rows(subset)
+        thumbnails.ensure_thumbnails([(r['path'], r['sha1']) for r in rows[:6]])
+        samples[subset] = [gallery_item(subset, r) for r in rows[:6]]
+        totals[subset] = len(rows)
+
+    return render_template('dataset.html', samples=samples, totals=totals, page_size=DATASET_PAGE_SIZE)
+
+
+@app.route('/api/dataset/<subset>')
+def api_dataset(subset):
+    """One page of gallery items; thumbnails missing for that page are generated on the fly."""
+    if subset not in ('train', 'valid', 'test'):
+        return jsonify({'error': 'unknown subset'}), 404
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(200, max(1, request.args.get('per_page', DATASET_PAGE_SIZE, type=int)))
+    rows = dataset_rows(subset, request.args.get('label', ''))
+    chunk = rows[(page - 1) * per_page:page * per_page]
+    thumbnails.ensure_thumbnails([(r['path'], r['sha1']) for r in chunk])
+    return jsonify({
+        'subset': subset,
+        'page': page,
+        'per_page': per_page,
+        'total': len(rows),
+        'has_more': page * per_page < len(rows),
+        'items': [gallery_item(subset, r) for r in chunk],
+    })
 
 
 @app.route('/project')
@@ -130,25 +204,18 @@ def severity():
 
 @app.route('/upload')
 def upload():
-    det_models = []
-    seg_models = []
-    for root, _, files in os.walk(os.path.join('models', 'object_detection')):
-        for f in files:
-            if f.endswith(('.pt', '.pth')):
-                full = os.path.join(root, f)
-                det_models.append((full, model_label(full)))
-    for root, _, files in os.walk(os.path.join('models', 'segmentation')):
-        for f in files:
-            if f.endswith(('.pt', '.pth')):
-                full = os.path.join(root, f)
-                seg_models.append((full, model_label(full)))
+    det_models, seg_models = list_models()
 
     last = {
         'task': session.get('last_task', 'detection'),
         'det_model': session.get('last_det_model', ''),
         'seg_model': session.get('last_seg_model', ''),
         'pad': session.get('last_pad', 10),
-        'multi_leaf': session.get('last_multi_leaf', '')
+        'multi_leaf': session.get('last_multi_leaf', ''),
+        'cascade': session.get('last_cascade', ''),
+        'seg_mode': session.get('last_seg_mode', 'crop'),
+        'profile': session.get('last_profile', profiles.DEFAULT),
+        'tiles': session.get('last_tiles', 2)
     }
     last_uploaded = session.get('last_uploaded', '')
     uploaded_rel = os.path.join('uploads', last_uploaded) if last_uploaded else ''
@@ -157,70 +224,417 @@ def upload():
     return render_template('upload.html', det_models=det_models, seg_models=seg_models, last=last, uploaded_rel=uploaded_rel, uploaded_basename=uploaded_basename, uploaded=uploaded)
 
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    # Prefer uploaded file, otherwise existing_file form field or session fallback
+class PredictError(Exception):
+    """User-facing prediction failure; the message is flashed on the upload page."""
+
+
+def resolve_input():
+    """Return (filename, in_path) for the image this request refers to.
+
+    Prefers an uploaded file (stored through the upload registry, which
+    deduplicates identical content), otherwise the existing_file form field
+    or the session fallback, both resolved by registry lookup. Raises
+    PredictError when nothing usable is found.
+    """
     if 'file' in request.files and request.files['file'].filename:
         file = request.files['file']
         if file.filename == '':
-            flash('No selected file')
-            return redirect(url_for('upload'))
+            raise PredictError('No selected file')
         if not (file and allowed_file(file.filename)):
-            flash('Invalid file type')
-            return redirect(url_for('upload'))
-        filename = secure_filename(file.filename)
-        in_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(in_path)
+            raise PredictError('Invalid file type')
+        record, deduplicated = UPLOADS.save(file, secure_filename(file.filename))
+        print(f"[PREDICT] Upload {record['id']} {'matches an earlier upload' if deduplicated else 'saved'}: {record['stored']}")
+    else:
+        existing = request.values.get('existing_file')
+        if not existing:
+            raise PredictError('No file part')
+        record = UPLOADS.lookup(existing)
+        if record is None:
+            fallback = session.get('last_uploaded')
+            record = UPLOADS.lookup(fallback)
+            if record is None:
+                print(f"[PREDICT] existing_file='{existing}' not registered; will request re-upload")
+                raise PredictError('Requested existing uploaded file not found on server. Please re-upload.')
+            print(f"[PREDICT] Using session fallback last_uploaded={fallback}")
+    filename = record['stored']
+    try:
+        session['last_uploaded'] = filename
+    except Exception:
+        pass
+    return filename, os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+
+def read_params():
+    det_model = request.values.get('det_model')
+    seg_model = request.values.get('seg_model')
+    pad = int(request.values.get('pad', 10)) if request.values.get('pad') else 10
+    multi_leaf = True if request.values.get('multi_leaf') == 'on' else False
+    return det_model, seg_model, pad, multi_leaf
+
+
+def read_cascade():
+    """Cascade thresholds (defaults overridden by form fields), or None when cascade mode is off."""
+    if request.values.get('cascade') != 'on':
+        return None
+    thresholds = dict(cascade.DEFAULTS)
+    for key in thresholds:
         try:
-            session['last_uploaded'] = filename
-        except Exception:
+            thresholds[key] = float(request.values[key])
+        except (KeyError, ValueError):
             pass
-        print(f"[PREDICT] Saved uploaded file to: {in_path}")
+    return thresholds
+
+
+def read_profile():
+    """Inference profile name from the form (see profiles.py); defaults to profiles.DEFAULT."""
+    name = request.values.get('profile') or profiles.DEFAULT
+    if name not in profiles.NAMES:
+        raise PredictError(f"Unknown inference profile '{name}'")
+    return name
+
+
+def model_settings(profile):
+    """weights -> predict arguments of `profile` for that model."""
+    return lambda weights: profiles.resolve(profile, weights)
+
+
+def read_seg_mode():
+    """(seg_mode, tiles) from the form; `tiles` is the grid size used by the tiled mode."""
+    seg_mode = request.values.get('seg_mode', 'crop')
+    if seg_mode not in pipeline.SEG_MODES:
+        raise PredictError(f"Unknown segmentation mode '{seg_mode}'")
+    try:
+        tiles = min(max(int(request.values.get('tiles', 2)), 2), 4)
+    except ValueError:
+        tiles = 2
+    return seg_mode, (tiles if seg_mode == 'tiled' else 1)
+
+
+def read_positive_int(name, default, maximum=10000):
+    """Integer form field in [1, maximum]; the default when absent, PredictError when invalid."""
+    text = request.values.get(name)
+    if text in (None, ''):
+        return default
+    try:
+        value = int(text)
+    except ValueError:
+        raise PredictError(f"'{name}' must be an integer")
+    if not 1 <= value <= maximum:
+        raise PredictError(f"'{name}' must be between 1 and {maximum}")
+    return value
+
+
+def read_skip_rules():
+    """Skip rules from the `skip_rules` field ('healthy:0.7,...'); None means the defaults."""
+    text = request.values.get('skip_rules')
+    if text is None:
+        return None
+    try:
+        return pipeline.parse_skip_rules(text)
+    except ValueError:
+        raise PredictError("Invalid skip rules; use 'class:confidence' pairs, e.g. healthy:0.7")
+
+
+def remember_params(task, det_model, seg_model, pad, multi_leaf, cascade_cfg=None, seg_mode='crop', tiles=1,
+                    profile=profiles.DEFAULT):
+    try:
+        session['last_task'] = task
+        session['last_det_model'] = det_model if det_model else ''
+        session['last_seg_model'] = seg_model if seg_model else ''
+        session['last_pad'] = int(pad)
+        session['last_multi_leaf'] = 'on' if multi_leaf else ''
+        session['last_cascade'] = 'on' if cascade_cfg is not None else ''
+        session['last_seg_mode'] = seg_mode
+        session['last_profile'] = profile
+        if tiles > 1:
+            session['last_tiles'] = tiles
+    except Exception:
+        pass
+
+
+def list_models():
+    det_models = []
+    seg_models = []
+    for root, _, files in os.walk(os.path.join('models', 'object_detection')):
+        for f in files:
+            if f.endswith(('.pt', '.pth')):
+                full = os.path.join(root, f)
+                det_models.append((full, model_label(full)))
+    for root, _, files in os.walk(os.path.join('models', 'segmentation')):
+        for f in files:
+            if f.endswith(('.pt', '.pth')):
+                full = os.path.join(root, f)
+                seg_models.append((full, model_label(full)))
+    return det_models, seg_models
+
+
+def get_model(kind, path):
+    """Load a YOLO model once per process and keep it in MODEL_CACHE.
+
+    Models come from the prepared-model cache (model_cache.py). When an
+    inference server is configured, a RemoteModel proxy is returned instead.
+    """
+    if path in MODEL_CACHE[kind]:
+        return MODEL_CACHE[kind][path]
+    if INFERENCE is not None:
+        model = RemoteModel(INFERENCE, os.path.abspath(path))
     else:
-        existing = request.form.get('existing_file')
-        if not existing:
-            flash('No file part')
-            return redirect(url_for('upload'))
-        filename = secure_filename(os.path.basename(existing))
-        in_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if not os.path.exists(in_path):
-            try:
-                uploads_list = os.listdir(app.config['UPLOAD_FOLDER'])
-            except Exception:
-                uploads_list = []
-            print(f"[PREDICT] existing_field='{existing}' basename='{filename}' in_path='{in_path}' uploads_list={uploads_list} session_last_uploaded={session.get('last_uploaded')}")
-            match = None
-            for c in uploads_list:
-                if c == filename or c.endswith(filename) or filename in c:
-                    match = c
-                    break
-            if match:
-                print(f"[PREDICT] Flexible match found: {match}")
-                filename = match
-                in_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            else:
-                fallback = session.get('last_uploaded')
-                if fallback and os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], fallback)):
-                    print(f"[PREDICT] Using session fallback last_uploaded={fallback}")
-                    filename = fallback
-                    in_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                else:
-                    print(f"[PREDICT] No match/fallback found; will request re-upload")
-                    flash('Requested existing uploaded file not found on server. Please re-upload.')
-                    return redirect(url_for('upload'))
+        model, info = model_cache.load_model(path)
+        print(f"[MODEL] Loaded {path} in {info['load_ms']} ms ({'prepared cache hit' if info['hit'] else 'prepared now'})")
+    MODEL_CACHE[kind][path] = model
+    return model
+
+
+def prediction_key(in_path, task, **params):
+    """Hash of the image content plus the parameters that affect the output."""
+    payload = json.dumps({'image': caching.file_etag(in_path), 'task': task, 'params': params}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def weights_hash(hashes, weights):
+    """model_cache.weights_sha1, looked up once per request in `hashes`."""
+    if weights not in hashes:
+        hashes[weights] = model_cache.weights_sha1(weights)
+    return hashes[weights]
+
+
+def memo_detect(image_sha1, hashes):
+    """cascade `run` hook: detection memoized per image, detection weights and predict arguments."""
+    def run(weights, source, args):
+        key = stage_cache.stage_key('detection', image_sha1, weights_hash(hashes, weights), args)
+        return STAGES.get_or_compute('detection', key, lambda: pipeline.detect(get_model('detection', weights), source, **args))
+    return run
+
+
+def memo_segment(image_sha1, region, hashes):
+    """cascade `run` hook: segmentation of one crop memoized per image, crop region, weights and predict arguments."""
+    def run(weights, source, args):
+        key = stage_cache.stage_key('segmentation', image_sha1, [int(v) for v in region], weights_hash(hashes, weights), args)
+        return STAGES.get_or_compute('segmentation', key, lambda: pipeline.segment(get_model('segmentation', weights), source, **args))
+    return run
+
+
+def result_url(filename):
+    """Link to a result file carrying its content hash (?v=), so browsers may cache it as immutable."""
+    return caching.versioned_url('result', app.config['RESULTS_FOLDER'], filename)
+
+
+app.jinja_env.globals['result_url'] = result_url
+
+
+def output_name(ns, name):
+    """`ns/name` relative to the results/uploads folders; creates the namespace folders."""
+    if not ns:
+        return name
+    for folder in (app.config['RESULTS_FOLDER'], app.config['UPLOAD_FOLDER']):
+        os.makedirs(os.path.join(folder, ns), exist_ok=True)
+    return f"{ns}/{name}"
+
+
+def iter_annotate(kind, in_path, filename, model_path, profile=profiles.DEFAULT, ns=''):
+    """Plain detection or segmentation: one 'summary' event with the annotated image."""
+    model = get_model(kind, model_path)
+    res = model.predict(source=in_path, **profiles.resolve(profile, model_path))
+    if not res:
+        raise PredictError('Model returned no results' if kind == 'detection' else 'Segmentation model returned no results')
+    r = res[0]
+    if kind == 'detection':
+        out_name = output_name(ns, f"annotated_{filename}")
+        pipeline.save_plot(r, os.path.join(app.config['RESULTS_FOLDER'], out_name))
+        preds = []
         try:
-            session['last_uploaded'] = filename
+            cls = r.boxes.cls.cpu().numpy().astype(int)
+            for c in cls:
+                preds.append(int(c))
         except Exception:
             pass
+        yield 'summary', {'annotated': out_name, 'pred_classes': preds, 'task': 'detection', 'profile': profile}
+    else:
+        out_name = output_name(ns, f"seg_annotated_{filename}")
+        pipeline.save_plot(r, os.path.join(app.config['RESULTS_FOLDER'], out_name))
+        yield 'summary', {'annotated': out_name, 'task': 'segmentation', 'profile': profile}
+
+
+def iter_severity(in_path, filename, det_model, seg_model, pad, multi_leaf, cascade_cfg=None, skip_rules=None,
+                  seg_mode='crop', tiles=1, profile=profiles.DEFAULT, ns=''):
+    """Run severity estimation and yield (event, payload) pairs as work completes.
+
+    Events are 'detection' once, then 'leaf' for each segmented crop, then a
+    final 'summary'. With `cascade_cfg` (see read_cascade) the nano/small/
+    medium tiers are tried in turn instead of the selected models, and every
+    result carries the tier that produced it. Leaves matching `skip_rules`
+    (detection class -> min confidence, default pipeline.SKIP_RULES) get 0%
+    severity without being segmented. With `seg_mode` 'full' or 'tiled' the
+    segmentation model runs once on the whole image (or a tiles x tiles
+    grid) and its instances are assigned to the detection boxes by mask
+    overlap, instead of one run per crop; cascade escalation then only
+    applies to detection and the cheapest segmentation tier is used. Every
+    model runs with the predict arguments of `profile` (profiles.resolve).
+    Detection and per-crop segmentation go through the stage cache
+    (STAGES), so a re-run that only changes pad, multi_leaf or the
+    segmentation model does not detect again. The leaf and lesion masks of
+    the run are kept in a compact masks file (see masks.py) so overlays can
+    be re-rendered later without inference. Outputs are written under the `ns`
+    subfolder of the results and uploads folders. Raises PredictError for
+    user-facing failures.
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    image_sha1 = caching.file_etag(in_path)
+    hashes = {}  # weights path -> sha1 for this run
+    if cascade_cfg is not None:
+        det_tiers = cascade.tier_models(os.path.join('models', 'object_detection'))
+        seg_tiers = cascade.tier_models(os.path.join('models', 'segmentation'))
+        if not det_tiers or not seg_tiers:
+            raise PredictError('Cascade mode needs nano/small/medium models under models/object_detection and models/segmentation')
+        thresholds = cascade_cfg
+    else:
+        if not det_model:
+            models = find_model()
+            det_model = models[0] if models else None
+        if not det_model or not seg_model:
+            raise PredictError('Both detection and segmentation models are required for severity estimation')
+        # a single model is a one-tier cascade that always accepts
+        det_tiers = [(model_label(det_model), det_model)]
+        seg_tiers = [(model_label(seg_model), seg_model)]
+        thresholds = {k: 0.0 for k in cascade.DEFAULTS}
+    try:
+        t0 = time.perf_counter()
+        det, det_tier, det_tried = cascade.detect(get_model, det_tiers, in_path, thresholds, model_settings(profile),
+                                                  memo_detect(image_sha1, hashes))
+    except Exception:
+        raise PredictError('Unable to extract detection boxes')
+    det_ms = (time.perf_counter() - t0) * 1000.0
+    if det is None:
+        raise PredictError('Detection returned no results')
+    boxes = det['boxes']
+    if len(boxes) == 0:
+        raise PredictError('No detection boxes found')
+    idxs = pipeline.select_boxes(boxes, multi_leaf)
+
+    try:
+        det_name = output_name(ns, f"det_annotated_{filename}")
+        pipeline.save_detection_plot(det, os.path.join(app.config['RESULTS_FOLDER'], det_name))
+    except Exception:
+        det_name = None
+    if skip_rules is None:
+        skip_rules = pipeline.SKIP_RULES
+    plan = pipeline.plan_leaves(det, idxs, skip_rules)
+    yield 'detection', {'detection_annotated': det_name, 'boxes': len(boxes), 'selected': idxs,
+                        'tier': det_tier, 'tried': det_tried, 'plan': plan}
+
+    img = Image.open(in_path).convert('RGB')
+    W, H = img.size
+    seg_ms = 0.0
+    if seg_mode != 'crop':
+        t0 = time.perf_counter()
+        seg_tier, seg_weights = seg_tiers[0]
+        to_segment = [step['index'] for step in plan if step['action'] == 'segment']
+        instances = (pipeline.segment_instances(get_model('segmentation', seg_weights), img, tiles=tiles,
+                                                **profiles.resolve(profile, seg_weights)) if to_segment else [])
+        assigned = pipeline.assign_instances(instances, [boxes[i] for i in to_segment])
+        assigned = {to_segment[pos]: insts for pos, insts in assigned.items()}
+        seg_ms += (time.perf_counter() - t0) * 1000.0
+    crop_overlays, stored = [], []
+    for step in plan:
+        i_idx = step['index']
+        region = pipeline.crop_region(boxes[i_idx], pad, W, H)
+        crop = img.crop(region)
+        out_name = output_name(ns, f"severity_crop_{i_idx}_{filename}")
+        if step['action'] == 'skip':
+            crop.save(os.path.join(app.config['RESULTS_FOLDER'], out_name))
+            leaf = {'index': i_idx, 'filename': out_name, 'severity': 0.0, 'leaf_px': None, 'lesion_px': 0,
+                    'tier': det_tier, 'skipped': True, 'rule': step['rule'], 'det_class': step['class'], 'det_conf': step['conf']}
+            crop_overlays.append(leaf)
+            stored.append(dict(leaf, region=region))
+            yield 'leaf', leaf
+            continue
+        t0 = time.perf_counter()
+        if seg_mode == 'crop':
+            crop_path = os.path.join(app.config['UPLOAD_FOLDER'], output_name(ns, f"crop_{i_idx}_{filename}"))
+            crop.save(crop_path)
+            seg, combined, seg_info = cascade.segment(get_model, seg_tiers, crop_path, thresholds, model_settings(profile),
+                                                      memo_segment(image_sha1, region, hashes))
+        else:
+            seg = dict(zip(('masks', 'cls', 'conf'), pipeline.instances_in_region(assigned.get(i_idx, []), region)))
+            score, _, combined = cascade.segmentation_quality(seg)
+            seg_info = {'tier': seg_tier, 'tried': [seg_tier], 'score': round(score, 3)}
+        seg_ms += (time.perf_counter() - t0) * 1000.0
+        if combined is None:
+            continue
+        combined_leaf, combined_lesion = combined
+        leaf_px, lesion_px, severity_pct = pipeline.severity_from_masks(combined_leaf, combined_lesion)
+        overlay = pipeline.render_overlay(crop, combined_leaf, combined_lesion)
+        Image.fromarray(overlay).save(os.path.join(app.config['RESULTS_FOLDER'], out_name))
+        leaf = {'index': i_idx, 'filename': out_name, 'severity': severity_pct, 'leaf_px': leaf_px, 'lesion_px': lesion_px,
+                'tier': seg_info['tier'], 'tried': seg_info['tried'], 'seg_score': seg_info['score'], 'skipped': False,
+                'det_class': step['class'], 'det_conf': step['conf']}
+        crop_overlays.append(leaf)
+        stored.append(dict(leaf, region=region, leaf=combined_leaf, lesion=combined_lesion))
+        yield 'leaf', leaf
+
+    try:
+        masks_name = output_name(ns, f"masks_{os.path.splitext(os.path.basename(filename))[0]}.npz")
+        masks.save(os.path.join(app.config['RESULTS_FOLDER'], masks_name), filename, (W, H), stored)
+    except Exception as e:
+        print(f"[PREDICT] Could not store masks: {e}")
+        masks_name = None
+    skipped = sum(1 for step in plan if step['action'] == 'skip')
+    yield 'summary', {'task': 'severity', 'crop_overlays': crop_overlays, 'detection_annotated': det_name, 'masks': masks_name,
+                      'det_tier': det_tier, 'cascade': cascade_cfg, 'seg_mode': seg_mode, 'tiles': tiles, 'profile': profile,
+                      'planner': {'rules': skip_rules, 'skipped': skipped, 'segmented': len(plan) - skipped},
+                      'timings': {'det_ms': round(det_ms, 1), 'seg_ms': round(seg_ms, 1),
+                                  'total_ms': round((time.perf_counter() - started) * 1000.0, 1)}}
+
+
+def recorded(events, key, in_path, filename, det_model, seg_model, params):
+    """Pass the severity events through and queue the final summary for the results store."""
+    for event, payload in events:
+        if event == 'summary':
+            leaves = payload['crop_overlays']
+            severities = [leaf['severity'] for leaf in leaves]
+            run = {'key': key, 'image_sha1': caching.file_etag(in_path), 'filename': filename,
+                   'det_model': det_model or payload['det_tier'], 'seg_model': seg_model if params['cascade'] is None else 'cascade',
+                   'params': params, 'leaves': len(leaves),
+                   'mean_severity': sum(severities) / len(severities) if severities else None,
+                   'max_severity': max(severities) if severities else None,
+                   'created': time.time(), **payload['timings']}
+            RESULTS.add(run, [{'leaf_index': leaf['index'], 'det_class': leaf.get('det_class'), 'det_conf': leaf.get('det_conf'),
+                               'severity': leaf['severity'], 'leaf_px': leaf['leaf_px'], 'lesion_px': leaf['lesion_px'],
+                               'skipped': int(leaf.get('skipped', False)), 'model': leaf.get('tier')} for leaf in leaves])
+        yield event, payload
+
+
+def follow_severity(in_path, filename, det_model, seg_model, pad, multi_leaf, cascade_cfg, skip_rules, seg_mode='crop', tiles=1,
+                    profile=profiles.DEFAULT):
+    """Events of the severity run for these inputs, shared with identical requests in flight."""
+    params = {'pad': pad, 'multi_leaf': multi_leaf, 'cascade': cascade_cfg, 'skip_rules': skip_rules,
+              'seg_mode': seg_mode, 'tiles': tiles, 'profile': profile}
+    key = prediction_key(in_path, 'severity', det_model=det_model, seg_model=seg_model, profiles=profiles.load(), **params)
+    return FLIGHTS.follow(key, lambda: recorded(
+        iter_severity(in_path, filename, det_model, seg_model, pad, multi_leaf, cascade_cfg, skip_rules, seg_mode, tiles,
+                      profile, ns=key[:16]),
+        key, in_path, filename, det_model, seg_model, params))
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    try:
+        filename, in_path = resolve_input()
+    except PredictError as e:
+        flash(str(e))
+        return redirect(url_for('upload'))
 
     task = request.form.get('task', 'detection')
-    det_model = request.form.get('det_model')
-    seg_model = request.form.get('seg_model')
-    pad = int(request.form.get('pad', 10)) if request.form.get('pad') else 10
-    multi_leaf = True if request.form.get('multi_leaf') == 'on' else False
+    det_model, seg_model, pad, multi_leaf = read_params()
+    cascade_cfg = read_cascade() if task == 'severity' else None
+    seg_mode, tiles = 'crop', 1
+    profile = profiles.DEFAULT
 
     try:
-        from ultralytics import YOLO
+        if INFERENCE is None:
+            from ultralytics import YOLO
         import numpy as np
         from PIL import Image
     except Exception:
@@ -230,7 +644,7 @@ def predict():
     result_data = {}
 
     try:
-        # Detection task
+        profile = read_profile()
         if task == 'detection':
             if not det_model:
                 models = find_model()
@@ -238,228 +652,252 @@ def predict():
             if not det_model:
                 flash('No detection model available')
                 return redirect(url_for('upload'))
-            if det_model in MODEL_CACHE['detection']:
-                model = MODEL_CACHE['detection'][det_model]
-            else:
-                model = YOLO(det_model)
-                MODEL_CACHE['detection'][det_model] = model
-            res = model.predict(source=in_path, conf=0.25, imgsz=640)
-            if not res:
-                flash('Model returned no results')
-                return redirect(url_for('upload'))
-            r = res[0]
-            ann = r.plot()
-            try:
-                import numpy as _np
-                if ann.shape[2] == 3:
-                    ann_rgb = _np.stack([ann[:, :, 2], ann[:, :, 1], ann[:, :, 0]], axis=2)
-                else:
-                    ann_rgb = ann
-            except Exception:
-                ann_rgb = ann
-            img_out = Image.fromarray(ann_rgb.astype('uint8'))
-            out_name = f"annotated_{filename}"
-            out_path = os.path.join(app.config['RESULTS_FOLDER'], out_name)
-            img_out.save(out_path)
-            preds = []
-            try:
-                boxes = r.boxes.xyxy.cpu().numpy()
-                cls = r.boxes.cls.cpu().numpy().astype(int)
-                for c in cls:
-                    preds.append(int(c))
-            except Exception:
-                pass
-            result_data.update({'annotated': out_name, 'pred_classes': preds, 'task': 'detection'})
-
-        # Segmentation task
+            key = prediction_key(in_path, task, det_model=det_model, params=profiles.resolve(profile, det_model))
+            events = FLIGHTS.follow(key, lambda: iter_annotate('detection', in_path, filename, det_model, profile, ns=key[:16]))
         elif task == 'segmentation':
             if not seg_model:
                 flash('No segmentation model selected')
                 return redirect(url_for('upload'))
-            if seg_model in MODEL_CACHE['segmentation']:
-                model = MODEL_CACHE['segmentation'][seg_model]
-            else:
-                model = YOLO(seg_model)
-                MODEL_CACHE['segmentation'][seg_model] = model
-            res = model.predict(source=in_path, conf=0.25, imgsz=640)
-            if not res:
-                flash('Segmentation model returned no results')
-                return redirect(url_for('upload'))
-            r = res[0]
-            ann = r.plot()
-            try:
-                import numpy as _np
-                if ann.shape[2] == 3:
-                    ann_rgb = _np.stack([ann[:, :, 2], ann[:, :, 1], ann[:, :, 0]], axis=2)
-                else:
-                    ann_rgb = ann
-            except Exception:
-                ann_rgb = ann
-            img_out = Image.fromarray(ann_rgb.astype('uint8'))
-            out_name = f"seg_annotated_{filename}"
-            out_path = os.path.join(app.config['RESULTS_FOLDER'], out_name)
-            img_out.save(out_path)
-            result_data.update({'annotated': out_name, 'task': 'segmentation'})
-
-        # Severity task
+            key = prediction_key(in_path, task, seg_model=seg_model, params=profiles.resolve(profile, seg_model))
+            events = FLIGHTS.follow(key, lambda: iter_annotate('segmentation', in_path, filename, seg_model, profile, ns=key[:16]))
         elif task == 'severity':
-            if not det_model:
+            if not det_model and cascade_cfg is None:
                 models = find_model()
                 det_model = models[0] if models else None
-            if not det_model or not seg_model:
-                flash('Both detection and segmentation models are required for severity estimation')
-                return redirect(url_for('upload'))
-            if det_model in MODEL_CACHE['detection']:
-                model_det = MODEL_CACHE['detection'][det_model]
-            else:
-                model_det = YOLO(det_model)
-                MODEL_CACHE['detection'][det_model] = model_det
-            det_res = model_det.predict(source=in_path, conf=0.25, imgsz=640)
-            if not det_res:
-                flash('Detection returned no results')
-                return redirect(url_for('upload'))
-            det_r = det_res[0]
-            try:
-                boxes = det_r.boxes.xyxy.cpu().numpy()
-                dcls = det_r.boxes.cls.cpu().numpy().astype(int)
-            except Exception:
-                flash('Unable to extract detection boxes')
-                return redirect(url_for('upload'))
-            if len(boxes) == 0:
-                flash('No detection boxes found')
-                return redirect(url_for('upload'))
-            idxs = list(range(len(boxes))) if multi_leaf else [int(np.argmax((boxes[:,2]-boxes[:,0]) * (boxes[:,3]-boxes[:,1])))]
-            from PIL import ImageDraw
-            img = Image.open(in_path).convert('RGB')
-            W, H = img.size
-            crop_overlays = []
-            if seg_model in MODEL_CACHE['segmentation']:
-                model_seg = MODEL_CACHE['segmentation'][seg_model]
-            else:
-                model_seg = YOLO(seg_model)
-                MODEL_CACHE['segmentation'][seg_model] = model_seg
-            for i_idx in idxs:
-                x1, y1, x2, y2 = boxes[i_idx].astype(int)
-                x1p = max(0, x1 - pad)
-                y1p = max(0, y1 - pad)
-                x2p = min(W, x2 + pad)
-                y2p = min(H, y2 + pad)
-                crop = img.crop((x1p, y1p, x2p, y2p))
-                crop_path = os.path.join(app.config['UPLOAD_FOLDER'], f"crop_{i_idx}_{filename}")
-                crop.save(crop_path)
-                seg_res = model_seg.predict(source=crop_path, conf=0.25, imgsz=640)
-                if not seg_res:
-                    continue
-                seg_r = seg_res[0]
-                try:
-                    masks = (seg_r.masks.data.cpu().numpy() > 0.5)
-                    scls = seg_r.boxes.cls.cpu().numpy().astype(int)
-                except Exception:
-                    continue
-                SEG_LEAF_IDS = [0, 2, 3]
-                PAIR_LESION_ID = {0:1, 3:4}
-                leaf_idxs = [j for j, c in enumerate(scls) if int(c) in SEG_LEAF_IDS]
-                if not leaf_idxs:
-                    continue
-                import numpy as _np
-                combined_leaf = None
-                for j in leaf_idxs:
-                    if combined_leaf is None:
-                        combined_leaf = masks[j].copy()
-                    else:
-                        combined_leaf = combined_leaf | masks[j]
-                if combined_leaf is None:
-                    continue
-                lesion_idxs_all = []
-                for j in leaf_idxs:
-                    leaf_class = int(scls[j])
-                    if leaf_class in PAIR_LESION_ID:
-                        lesion_id = PAIR_LESION_ID[leaf_class]
-                        lesion_idxs_all += [k for k, c in enumerate(scls) if int(c) == lesion_id]
-                combined_lesion = np.zeros_like(combined_leaf, dtype=bool)
-                if lesion_idxs_all:
-                    combined_lesion = np.any([masks[k] for k in lesion_idxs_all], axis=0)
-                lesion_in_leaf = combined_lesion & combined_leaf
-                leaf_px = int(combined_leaf.sum())
-                lesion_px = int(lesion_in_leaf.sum())
-                severity_pct = round(float((lesion_px / leaf_px * 100.0) if leaf_px > 0 else 0.0), 2)
-                crop_arr = _np.array(crop)
-                Hc, Wc = crop_arr.shape[:2]
-                leaf_up = _np.array(Image.fromarray(combined_leaf.astype('uint8')*255).resize((Wc,Hc))).astype(bool)
-                lesion_up = _np.array(Image.fromarray(combined_lesion.astype('uint8')*255).resize((Wc,Hc))).astype(bool)
-                lesion_in_leaf_up = lesion_up & leaf_up
-                overlay = crop_arr.copy()
-                overlay[leaf_up] = (0.7*overlay[leaf_up] + 0.3*_np.array([0,255,0])).astype(_np.uint8)
-                overlay[lesion_in_leaf_up] = _np.array([139,0,0], dtype=_np.uint8)
-                out_name = f"severity_crop_{i_idx}_{filename}"
-                out_path = os.path.join(app.config['RESULTS_FOLDER'], out_name)
-                Image.fromarray(overlay).save(out_path)
-                crop_overlays.append({'filename': out_name, 'severity': severity_pct, 'leaf_px': leaf_px, 'lesion_px': lesion_px})
-            try:
-                det_ann = det_r.plot()
-                import numpy as _np
-                if det_ann.shape[2] == 3:
-                    det_ann_rgb = _np.stack([det_ann[:, :, 2], det_ann[:, :, 1], det_ann[:, :, 0]], axis=2)
-                else:
-                    det_ann_rgb = det_ann
-                det_out = Image.fromarray(det_ann_rgb.astype('uint8'))
-                det_name = f"det_annotated_{filename}"
-                det_path = os.path.join(app.config['RESULTS_FOLDER'], det_name)
-                det_out.save(det_path)
-            except Exception:
-                det_name = None
-            result_data.update({'task': 'severity', 'crop_overlays': crop_overlays, 'detection_annotated': det_name})
-
+            seg_mode, tiles = read_seg_mode()
+            events = follow_severity(in_path, filename, det_model, seg_model, pad, multi_leaf, cascade_cfg, read_skip_rules(),
+                                     seg_mode, tiles, profile)
         else:
             flash('Unknown task')
             return redirect(url_for('upload'))
 
+        for event, payload in events:
+            if event == 'summary':
+                result_data.update(payload)
+
+    except PredictError as e:
+        flash(str(e))
+        return redirect(url_for('upload'))
     except Exception as e:
         print('[PREDICT] Exception during prediction:')
         traceback.print_exc()
         flash(f'Error during prediction: {e}')
         return redirect(url_for('upload'))
 
-    # prepare model lists again
-    det_models = []
-    seg_models = []
-    for root, _, files in os.walk(os.path.join('models', 'object_detection')):
-        for f in files:
-            if f.endswith(('.pt', '.pth')):
-                full = os.path.join(root, f)
-                det_models.append((full, model_label(full)))
-    for root, _, files in os.walk(os.path.join('models', 'segmentation')):
-        for f in files:
-            if f.endswith(('.pt', '.pth')):
-                full = os.path.join(root, f)
-                seg_models.append((full, model_label(full)))
-
+    det_models, seg_models = list_models()
     uploaded_rel = os.path.join('uploads', filename)
-    try:
-        session['last_task'] = task
-        session['last_det_model'] = det_model if det_model else ''
-        session['last_seg_model'] = seg_model if seg_model else ''
-        session['last_pad'] = int(pad)
-        session['last_multi_leaf'] = 'on' if multi_leaf else ''
-    except Exception:
-        pass
+    remember_params(task, det_model, seg_model, pad, multi_leaf, cascade_cfg, seg_mode, tiles, profile)
     return render_template('upload.html', det_models=det_models, seg_models=seg_models, uploaded=uploaded_rel, result=result_data)
 
 
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route('/predict/stream', methods=['GET', 'POST'])
+def predict_stream():
+    """Severity estimation as Server-Sent Events.
+
+    Sends the detection result first, then one 'leaf' event per crop as soon
+    as it has been segmented, then a 'summary'. Failures arrive as an
+    'error' event so the client can show them without a page reload.
+    """
+    try:
+        filename, in_path = resolve_input()
+    except PredictError as e:
+        return Response(sse('error', {'message': str(e)}), mimetype='text/event-stream')
+    det_model, seg_model, pad, multi_leaf = read_params()
+    cascade_cfg = read_cascade()
+    if not det_model and cascade_cfg is None:
+        models = find_model()
+        det_model = models[0] if models else None
+    try:
+        seg_mode, tiles = read_seg_mode()
+        profile = read_profile()
+    except PredictError as e:
+        return Response(sse('error', {'message': str(e)}), mimetype='text/event-stream')
+    remember_params('severity', det_model, seg_model, pad, multi_leaf, cascade_cfg, seg_mode, tiles, profile)
+
+    def generate():
+        yield sse('upload', {'uploaded': url_for('uploaded_file', filename=filename), 'filename': filename})
+        try:
+            events = follow_severity(in_path, filename, det_model, seg_model, pad, multi_leaf, cascade_cfg, read_skip_rules(),
+                                     seg_mode, tiles, profile)
+            for event, payload in events:
+                # followers share payload dicts: add URLs to a copy
+                payload = dict(payload)
+                if event == 'detection' and payload.get('detection_annotated'):
+                    payload['url'] = result_url(payload['detection_annotated'])
+                elif event == 'leaf':
+                    payload['url'] = result_url(payload['filename'])
+                yield sse(event, payload)
+        except PredictError as e:
+            yield sse('error', {'message': str(e)})
+        except Exception as e:
+            print('[PREDICT] Exception during streamed prediction:')
+            traceback.print_exc()
+            yield sse('error', {'message': f'Error during prediction: {e}'})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/predict/sequence', methods=['POST'])
+def predict_sequence():
+    """Per-leaf severity timeline for a video or a burst of frames.
+
+    Accepts one video (`file`) or several images (`files`) and returns the
+    timeline as JSON; a copy is written to RESULTS_FOLDER.
+    """
+    import sequence
+
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f and f.filename]
+    if not uploads:
+        return jsonify({'error': 'No video or frames uploaded'}), 400
+    names = [secure_filename(f.filename) for f in uploads]
+    exts = [n.rsplit('.', 1)[-1].lower() if '.' in n else '' for n in names]
+    single_video = len(names) == 1 and exts[0] in sequence.VIDEO_EXTENSIONS
+    if not single_video and not all(e in ALLOWED_EXTENSIONS for e in exts):
+        return jsonify({'error': 'Upload one video (' + ', '.join(sorted(sequence.VIDEO_EXTENSIONS)) + ') or image frames'}), 400
+
+    det_model, seg_model, pad, _ = read_params()
+    if not det_model:
+        models = find_model()
+        det_model = models[0] if models else None
+    if not det_model or not seg_model:
+        return jsonify({'error': 'Both detection and segmentation models are required for severity estimation'}), 400
+    profile = request.form.get('profile') or profiles.DEFAULT
+    if profile not in profiles.NAMES:
+        return jsonify({'error': f"Unknown inference profile '{profile}'"}), 400
+    try:
+        det_every = read_positive_int('det_every', 10)
+        stride = read_positive_int('stride', 1)
+    except PredictError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # frames are stored under a hash of their names and content, so sequences never share a folder
+    tmp = os.path.join(app.config['UPLOAD_FOLDER'], f".seq_{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    digest = hashlib.sha1()
+    for f, name in zip(uploads, names):
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(os.path.join(tmp, name), 'wb') as out:
+            for chunk in iter(lambda: f.stream.read(1 << 20), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    seq_name = f"{os.path.splitext(names[0])[0]}_{digest.hexdigest()[:16]}"
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], f"seq_{seq_name}")
+    try:
+        os.rename(tmp, folder)
+    except OSError:  # same frames uploaded before
+        shutil.rmtree(tmp, ignore_errors=True)
+    paths = [os.path.join(folder, name) for name in names]
+
+    try:
+        timeline = sequence.run_sequence(
+            sequence.iter_frames(paths, stride=stride),
+            get_model('detection', det_model), get_model('segmentation', seg_model),
+            det_every=det_every, pad=pad,
+            det_args=profiles.resolve(profile, det_model), seg_args=profiles.resolve(profile, seg_model))
+    except Exception as e:
+        print('[PREDICT] Exception during sequence prediction:')
+        traceback.print_exc()
+        return jsonify({'error': f'Error during prediction: {e}'}), 500
+    timeline.update({'det_model': det_model, 'seg_model': seg_model, 'det_every': det_every, 'stride': stride, 'pad': pad,
+                     'profile': profile})
+    params = hashlib.sha1(json.dumps([det_model, seg_model, det_every, stride, pad, profile]).encode('utf-8')).hexdigest()[:8]
+    out_name = f"timeline_{seq_name}_{params}.json"
+    with open(os.path.join(app.config['RESULTS_FOLDER'], out_name), 'w', encoding='utf-8') as f:
+        json.dump(timeline, f)
+    timeline['timeline_file'] = out_name
+    return jsonify(timeline)
+
+
+@app.route('/api/results')
+def api_results():
+    """Stored severity runs, newest first: ?image=<sha1> or ?upload=<id or name>, since/until (YYYY-MM-DD), limit, offset."""
+    image = request.args.get('image')
+    if request.args.get('upload'):
+        record = UPLOADS.lookup(request.args['upload'])
+        if record is None:
+            return jsonify({'error': 'Unknown upload'}), 404
+        image = record['sha1']
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    runs = RESULTS.runs(image, request.args.get('since'), request.args.get('until'), limit, offset)
+    return jsonify({'runs': runs, 'limit': limit, 'offset': offset})
+
+
+@app.route('/api/results/aggregate')
+def api_results_aggregate():
+    """Severity distribution grouped by ?by=class|model|day, optionally within since/until; bin = histogram width."""
+    by = request.args.get('by', 'class')
+    if by not in GROUPS:
+        return jsonify({'error': f"by must be one of {', '.join(GROUPS)}"}), 400
+    bin_width = request.args.get('bin', 10.0, type=float)
+    if not bin_width or bin_width <= 0:
+        return jsonify({'error': 'bin must be positive'}), 400
+    groups = RESULTS.aggregate(by, request.args.get('since'), request.args.get('until'), bin_width,
+                               include_skipped=request.args.get('skipped', '1') != '0')
+    return jsonify({'by': by, 'bin': bin_width, 'groups': groups})
+
+
+@app.route('/render/<path:name>')
+def render_masks(name):
+    """Overlay re-rendered from a stored masks file, without inference.
+
+    ?view=composite (default: the whole image with every leaf) or
+    view=leaf&index=<detection index> (one crop); leaf_color and
+    lesion_color as rrggbb, alpha in [0, 1]; format=png|jpeg.
+    """
+    from PIL import Image
+
+    path = safe_join(os.path.abspath(app.config['RESULTS_FOLDER']), name)
+    if path is None or not name.endswith('.npz') or not os.path.isfile(path):
+        abort(404)
+    meta, leaves = masks.load(path)
+    image_path = safe_join(os.path.abspath(app.config['UPLOAD_FOLDER']), meta['image'])
+    if image_path is None or not os.path.isfile(image_path):
+        abort(410, 'The original upload of these masks is gone')
+    image = Image.open(image_path).convert('RGB')
+    colors = {'leaf_color': masks.parse_color(request.args.get('leaf_color'), masks.LEAF_COLOR),
+              'lesion_color': masks.parse_color(request.args.get('lesion_color'), masks.LESION_COLOR),
+              'alpha': min(max(request.args.get('alpha', masks.ALPHA, type=float), 0.0), 1.0)}
+    if request.args.get('view', 'composite') == 'leaf':
+        index = request.args.get('index', type=int)
+        leaf = next((leaf for leaf in leaves if leaf['index'] == index), None)
+        if leaf is None:
+            abort(404)
+        out = masks.render_leaf(image, leaf, **colors)
+    else:
+        out = masks.render_composite(image, leaves, **colors)
+    fmt = 'JPEG' if request.args.get('format') in ('jpg', 'jpeg') else 'PNG'
+    buf = io.BytesIO()
+    Image.fromarray(out).save(buf, format=fmt)
+    buf.seek(0)
+    return send_file(buf, mimetype=f'image/{fmt.lower()}', max_age=3600)
+
+
 @app.route('/results')
 def results():
-    files = sorted(os.listdir(app.config['RESULTS_FOLDER']))
-    return render_template('results.html', files=files)
+    # outputs live in per-request namespaces (results_predict/<key>/...); list newest first
+    files = []
+    for root, _, names in os.walk(app.config['RESULTS_FOLDER']):
+        for name in names:
+            if name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+                path = os.path.join(root, name)
+                files.append((os.path.getmtime(path), os.path.relpath(path, app.config['RESULTS_FOLDER']).replace(os.sep, '/')))
+    return render_template('results.html', files=[f for _, f in sorted(files, reverse=True)])
 
 
 @app.route('/results/<path:filename>')
 def result(filename):
-    return send_from_directory(app.config['RESULTS_FOLDER'], filename)
+    return caching.send_cached(app.config['RESULTS_FOLDER'], filename)
 
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return caching.send_cached(app.config['UPLOAD_FOLDER'], filename)
 
 
 if __name__ == '__main__':
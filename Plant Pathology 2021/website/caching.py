@@ -0,0 +1,116 @@
+"""HTTP caching for files served by the app (static, results, uploads).
+
+Every file goes out with a content-hash ETag, so browsers revalidate with
+If-None-Match and get a 304 instead of the body; Range requests are served
+as 206 by Werkzeug's conditional send_file. Responses are:
+
+- `public, max-age=31536000, immutable` when the URL is content-addressed:
+  it carries `?v=<hash>` matching the file (see `asset_url` and
+  `versioned_url`, which the app uses for every result link) or it lives
+  in a content-addressed folder such as static/thumbs/,
+- `no-cache` otherwise, i.e. cache but revalidate; result files can be
+  overwritten under the same name.
+
+Text assets precompressed by tools/precompress.py (`<file>.br`, `<file>.gz`)
+are sent instead of the original when the client accepts the encoding and
+the compressed copy is not older than the source.
+"""
+import hashlib
+import mimetypes
+import os
+from functools import lru_cache
+
+from flask import abort, request, send_file, url_for
+from werkzeug.utils import safe_join
+
+ONE_YEAR = 365 * 24 * 3600
+VERSION_LEN = 12
+# static/ subfolders whose file names already contain the content hash
+IMMUTABLE_PREFIXES = ('thumbs/',)
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(path, size, mtime_ns):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_etag(path):
+    """SHA-1 of the file contents, recomputed only when size or mtime change."""
+    st = os.stat(path)
+    return _hash_file(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _precompressed(path):
+    """(encoding, path) of a usable precompressed copy for this request, or None."""
+    if request.range is not None:
+        return None  # byte ranges refer to the identity encoding
+    accepted = request.accept_encodings
+    mtime = os.stat(path).st_mtime_ns
+    for encoding, suffix in PRECOMPRESSED:
+        candidate = path + suffix
+        if accepted[encoding] and os.path.isfile(candidate) and os.stat(candidate).st_mtime_ns >= mtime:
+            return encoding, candidate
+    return None
+
+
+def send_cached(directory, filename, immutable=False):
+    path = safe_join(os.path.abspath(directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    etag = file_etag(path)
+    immutable = immutable or request.args.get('v') == etag[:VERSION_LEN]
+
+    compressed = _precompressed(path)
+    if compressed is not None:
+        encoding, body = compressed
+        # the mimetype comes from the original name, not from .gz/.br
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        resp = send_file(body, mimetype=mimetype, conditional=True, etag=f'{etag}-{encoding}', max_age=0)
+        resp.headers['Content-Encoding'] = encoding
+    else:
+        resp = send_file(path, conditional=True, etag=etag, max_age=0)
+    resp.vary.add('Accept-Encoding')
+
+    if immutable:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = ONE_YEAR
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
+
+
+def versioned_url(endpoint, directory, filename):
+    """url_for(endpoint, filename=...) plus ?v=<content hash> of `directory/filename`, when it exists."""
+    try:
+        version = file_etag(os.path.join(directory, filename))[:VERSION_LEN]
+    except OSError:
+        return url_for(endpoint, filename=filename)
+    return url_for(endpoint, filename=filename, v=version)
+
+
+def asset_url(filename, sha1=None):
+    """url_for('static', ...) plus ?v=<content hash>, so the URL can be cached forever.
+
+    Pass `sha1` when it is already known (e.g. from the dataset manifest) to skip hashing the file.
+    """
+    if sha1 is None:
+        try:
+            sha1 = file_etag(os.path.join('static', filename))
+        except OSError:
+            return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=sha1[:VERSION_LEN])
+
+
+def init_app(app):
+    """Route static files through send_cached and expose asset_url to templates."""
+    def static(filename):
+        return send_cached(app.static_folder, filename, immutable=filename.startswith(IMMUTABLE_PREFIXES))
+
+    app.view_functions['static'] = static
+    app.jinja_env.globals['asset_url'] = asset_url
@@ -0,0 +1,98 @@
+"""Confidence cascade over the nano -> small -> medium model tiers.
+
+Instead of one model per request, the cheapest tier runs first and a larger
+tier is only tried when the result looks unreliable:
+
+- detection escalates for the whole image when no leaf was found or the
+  mean box confidence is below `det_conf`,
+- segmentation escalates per leaf when no leaf mask was found, the mean
+  leaf-instance confidence is below `seg_conf`, or the leaf mask covers
+  less than `min_leaf_frac` of the crop.
+
+When no tier passes, the best-scoring attempt is kept. Every result records
+the tier that produced it and the tiers that were tried. `settings(weights)`
+gives the predict arguments for each tier's model (see profiles.resolve),
+and `run(weights, source, args)`, when given, replaces the plain
+pipeline.detect / pipeline.segment call (e.g. to memoize it).
+"""
+import glob
+import os
+
+import numpy as np
+
+import pipeline
+
+TIERS = ('nano', 'small', 'medium')
+DEFAULTS = {'det_conf': 0.5, 'seg_conf': 0.5, 'min_leaf_frac': 0.15}
+
+
+def tier_models(models_dir, tiers=TIERS):
+    """[(tier, weights)] for the tiers present under models_dir/<tier>/, cheapest first."""
+    found = []
+    for tier in tiers:
+        weights = sorted(glob.glob(os.path.join(models_dir, tier, '*.pt')) + glob.glob(os.path.join(models_dir, tier, '*.pth')))
+        if weights:
+            found.append((tier, weights[0]))
+    return found
+
+
+def detection_score(det):
+    if det is None or len(det['boxes']) == 0:
+        return 0.0
+    return float(np.mean(det['conf']))
+
+
+def segmentation_quality(seg):
+    """(score, leaf_frac, combined) of one crop segmentation; score 0 without a leaf mask."""
+    if seg is None:
+        return 0.0, 0.0, None
+    combined = pipeline.combine_masks(seg['masks'], seg['cls'])
+    if combined is None:
+        return 0.0, 0.0, None
+    leaf_conf = [float(c) for c, k in zip(seg['conf'], seg['cls']) if int(k) in pipeline.SEG_LEAF_IDS]
+    return float(np.mean(leaf_conf)), float(combined[0].mean()), combined
+
+
+def no_settings(weights):
+    return {}
+
+
+def detect(load, tiers, source, thresholds, settings=no_settings, run=None):
+    """Run detection tier by tier; returns (det, tier, tried)."""
+    if run is None:
+        def run(weights, src, args):
+            return pipeline.detect(load('detection', weights), src, **args)
+    best, best_tier, best_score, tried = None, None, -1.0, []
+    for tier, weights in tiers:
+        det = run(weights, source, settings(weights))
+        tried.append(tier)
+        score = detection_score(det)
+        if score > best_score:
+            best, best_tier, best_score = det, tier, score
+        if score >= thresholds['det_conf']:
+            break
+    return best, best_tier, tried
+
+
+def segment(load, tiers, source, thresholds, settings=no_settings, run=None):
+    """Segment one crop tier by tier; returns (seg, combined, info).
+
+    info holds the tier used, the tiers tried, its score and leaf fraction.
+    """
+    best = (None, None, {'tier': None, 'tried': [], 'score': 0.0, 'leaf_frac': 0.0})
+    if run is None:
+        def run(weights, src, args):
+            return pipeline.segment(load('segmentation', weights), src, **args)
+    best_score = -1.0
+    tried = []
+    for tier, weights in tiers:
+        seg = run(weights, source, settings(weights))
+        tried.append(tier)
+        score, leaf_frac, combined = segmentation_quality(seg)
+        if combined is not None and score > best_score:
+            best_score = score
+            best = (seg, combined, {'tier': tier, 'score': round(score, 3), 'leaf_frac': round(leaf_frac, 3)})
+        if combined is not None and score >= thresholds['seg_conf'] and leaf_frac >= thresholds['min_leaf_frac']:
+            break
+    best[2]['tried'] = tried
+    return best
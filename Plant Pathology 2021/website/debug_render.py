@@ -18,31 +18,18 @@ with app.app_context():
     seg_models = [(m, model_label(m)) for m in models]
     last = {'task':'detection','det_model':'','seg_model':'','pad':10,'multi_leaf':''}
 
-    # dataset context
-    import os
-    base = os.path.join('static','dataset_samples')
+    # dataset context (same rows and items as the /dataset route)
+    from app import dataset_rows, gallery_item, DATASET_PAGE_SIZE
     samples = {}
-    full_lists = {}
-    for subset in ('train','valid','test'):
-        folder = os.path.join(base, subset)
-        if os.path.exists(folder):
-            files = [f for f in os.listdir(folder) if f.lower().endswith(('.jpg','.jpeg','.png'))]
-            files_sorted = sorted(files)
-            samples[subset] = files_sorted[:6]
-            full_lists[subset] = files_sorted
-        else:
-            samples[subset]=[]; full_lists[subset]=[]
-
-    def infer_class(name):
-        lname = name.lower()
-        if 'frog' in lname: return 'frog-eye-leaf-spot'
-        if 'rust' in lname: return 'rust'
-        if 'healthy' in lname: return 'healthy'
-        return 'unknown'
-    classes = {s:{f:infer_class(f) for f in fl} for s,fl in full_lists.items()}
+    totals = {}
+    with app.test_request_context('/'):  # gallery_item() builds URLs
+        for subset in ('train','valid','test'):
+            rows = dataset_rows(subset)
+            samples[subset] = [gallery_item(subset, r) for r in rows[:6]]
+            totals[subset] = len(rows)
 
     ctx_upload = {'det_models':det_models,'seg_models':seg_models,'last':last,'uploaded':'','result':None}
-    ctx_dataset = {'samples':samples,'full_lists':full_lists,'classes':classes}
+    ctx_dataset = {'samples':samples,'totals':totals,'page_size':DATASET_PAGE_SIZE}
     ctx_dashboard = {'examples':{'nano':[],'small':[],'medium':[]}, 'models':det_models}
     ctx_project = {'graphs':[]}
 
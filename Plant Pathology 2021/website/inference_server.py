@@ -0,0 +1,296 @@
+"""Dedicated inference process shared by the web workers.
+
+By default every Flask worker loads its own models. When the app runs with
+`INFERENCE_SOCKET` set, `get_model` returns a `RemoteModel` instead, and a
+single long-lived process started with
+
+    python inference_server.py --socket /tmp/leaf-inference.sock
+
+owns all the models. Web workers can then be scaled without duplicating
+model memory.
+
+Only small control messages travel over the local Unix socket
+(multiprocessing.connection, pickled dicts). Pixel data does not: the
+client copies the decoded image once into a buffer in /dev/shm and sends
+its name; the server maps the same pages and hands the array to
+Ultralytics without a second copy (nothing is pickled or sent through the
+socket). Instance masks and plots come back the same way: the server
+copies them once into a buffer that the client maps and wraps as a numpy
+array. The client unlinks the name right away, so the memory is released
+when the array is garbage collected.
+
+The server also tracks every buffer it hands out and unlinks those a
+client never collected: all of a connection's buffers when it closes
+(e.g. the worker died), and any buffer older than SHM_TTL seconds. Input
+buffers are unlinked by the server once the prediction has read them.
+
+Requests from all connections go through one queue and are run by a
+single inference thread, so models never run concurrently.
+`RemoteModel.predict` returns objects with the parts of an Ultralytics
+result the pipeline uses (boxes, masks, names, orig_shape, plot()).
+"""
+import argparse
+import collections
+import mmap
+import os
+import queue
+import threading
+import time
+import uuid
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+SHM_DIR = '/dev/shm'
+AUTHKEY = os.environ.get('INFERENCE_AUTHKEY', 'leaf-severity').encode('utf-8')
+KEEP_RESULTS = 64
+SHM_TTL = 60.0  # seconds a returned buffer may stay uncollected
+
+
+# -------------------------------------------------------------- shared memory
+
+def shm_put(array):
+    """Copy `array` into a new /dev/shm buffer; returns its descriptor {'shm', 'shape', 'dtype'}."""
+    array = np.ascontiguousarray(array)
+    name = f'leaf-{os.getpid()}-{uuid.uuid4().hex[:16]}'
+    fd = os.open(os.path.join(SHM_DIR, name), os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+    try:
+        os.ftruncate(fd, max(array.nbytes, 1))
+        mm = mmap.mmap(fd, max(array.nbytes, 1))
+    finally:
+        os.close(fd)
+    np.frombuffer(mm, dtype=array.dtype, count=array.size).reshape(array.shape)[...] = array
+    return {'shm': name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+
+def shm_get(desc, unlink=False):
+    """Numpy view of a /dev/shm buffer (no copy); with `unlink` the name is removed at once."""
+    path = os.path.join(SHM_DIR, desc['shm'])
+    fd = os.open(path, os.O_RDWR)
+    try:
+        mm = mmap.mmap(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+        if unlink:
+            os.unlink(path)
+    dtype = np.dtype(desc['dtype'])
+    return np.frombuffer(mm, dtype=dtype, count=int(np.prod(desc['shape']))).reshape(desc['shape'])
+
+
+def shm_unlink(desc):
+    try:
+        os.unlink(os.path.join(SHM_DIR, desc['shm']))
+    except FileNotFoundError:
+        pass
+
+
+# --------------------------------------------------------------------- server
+
+class InferenceServer:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.models = {}
+        self.results = collections.OrderedDict()
+        self.jobs = queue.Queue()
+        self.served = 0
+        self.outstanding = {}  # shm name -> (connection id, handed out at)
+        self._outstanding_lock = threading.Lock()
+        self._conn_id = None  # connection of the job being run by the inference thread
+
+    def model(self, weights):
+        if weights not in self.models:
+            import model_cache
+            self.models[weights], info = model_cache.load_model(weights)
+            print(f"[INFERENCE] Loaded {weights} in {info['load_ms']} ms ({'cache hit' if info['hit'] else 'prepared now'})")
+        return self.models[weights]
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        threading.Thread(target=self._work, daemon=True).start()
+        threading.Thread(target=self._sweep, daemon=True).start()
+        with Listener(self.socket_path, family='AF_UNIX', authkey=AUTHKEY) as listener:
+            os.chmod(self.socket_path, 0o600)
+            print(f"[INFERENCE] Listening on {self.socket_path}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"[INFERENCE] Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        """Forward each request of one connection to the inference thread and send back its reply."""
+        conn_id = uuid.uuid4().hex
+        try:
+            with conn:
+                while True:
+                    try:
+                        request = conn.recv()
+                    except EOFError:
+                        return
+                    reply = queue.Queue(maxsize=1)
+                    self.jobs.put((request, reply, conn_id))
+                    conn.send(reply.get())
+        except OSError:
+            pass
+        finally:
+            self.release(lambda owner, _: owner == conn_id)
+
+    def share(self, array):
+        """shm_put for a reply: the buffer is tracked until the client's connection closes or SHM_TTL passes."""
+        desc = shm_put(array)
+        with self._outstanding_lock:
+            self.outstanding[desc['shm']] = (self._conn_id, time.monotonic())
+        return desc
+
+    def release(self, expired):
+        """Unlink the tracked buffers for which expired(connection id, handed out at) is true."""
+        with self._outstanding_lock:
+            names = [name for name, (owner, at) in self.outstanding.items() if expired(owner, at)]
+            for name in names:
+                del self.outstanding[name]
+        for name in names:
+            shm_unlink({'shm': name})  # a no-op when the client already unlinked it
+        return len(names)
+
+    def _sweep(self):
+        while True:
+            time.sleep(SHM_TTL / 2)
+            cutoff = time.monotonic() - SHM_TTL
+            self.release(lambda _, at: at < cutoff)
+
+    def _work(self):
+        while True:
+            request, reply, self._conn_id = self.jobs.get()
+            try:
+                reply.put({'ok': True, **getattr(self, 'op_' + request['op'])(request)})
+            except Exception as e:
+                reply.put({'ok': False, 'error': f'{type(e).__name__}: {e}'})
+            self.served += 1
+
+    def op_predict(self, request):
+        images = [shm_get(desc) for desc in request['images']]
+        try:
+            res = self.model(request['weights']).predict(source=images, **request['args'])
+        finally:
+            for desc in request['images']:
+                shm_unlink(desc)  # the mapping stays valid; the client may be gone
+        out = []
+        for r in res:
+            rid = uuid.uuid4().hex
+            self.results[rid] = r
+            while len(self.results) > KEEP_RESULTS:
+                self.results.popitem(last=False)
+            item = {'id': rid, 'orig_shape': tuple(r.orig_shape), 'names': dict(getattr(r, 'names', None) or {}),
+                    'xyxy': r.boxes.xyxy.cpu().numpy(), 'cls': r.boxes.cls.cpu().numpy(), 'conf': r.boxes.conf.cpu().numpy(),
+                    'masks': None, 'xy': None}
+            if r.masks is not None:
+                item['masks'] = self.share(r.masks.data.cpu().numpy() > 0.5)
+                item['xy'] = [np.asarray(p) for p in r.masks.xy]
+            out.append(item)
+        return {'results': out}
+
+    def op_plot(self, request):
+        r = self.results.get(request['id'])
+        if r is None:
+            raise KeyError('result expired')
+        return {'plot': self.share(r.plot())}
+
+    def op_stats(self, request):
+        return {'models': sorted(self.models), 'queued': self.jobs.qsize(), 'served': self.served,
+                'outstanding_buffers': len(self.outstanding)}
+
+
+# --------------------------------------------------------------------- client
+
+class InferenceClient:
+    """Connection to the inference server; one socket per thread."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def call(self, request):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = Client(self.socket_path, family='AF_UNIX', authkey=AUTHKEY)
+        try:
+            conn.send(request)
+            reply = conn.recv()
+        except (EOFError, OSError):
+            self._local.conn = None
+            raise RuntimeError(f'Inference server at {self.socket_path} is not reachable')
+        if not reply.pop('ok'):
+            raise RuntimeError(f"Inference server error: {reply['error']}")
+        return reply
+
+
+def to_bgr(source):
+    """Decode a path, PIL image or (BGR) array into a BGR uint8 array, as Ultralytics would."""
+    if isinstance(source, np.ndarray):
+        return source
+    from PIL import Image
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    return np.asarray(img.convert('RGB'))[:, :, ::-1]
+
+
+class _Tensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class RemoteResult:
+    """The subset of an Ultralytics result used by pipeline.py, with arrays in shared memory."""
+
+    def __init__(self, client, item):
+        self._client = client
+        self.id = item['id']
+        self.orig_shape = item['orig_shape']
+        self.names = item['names']
+        self.boxes = type('Boxes', (), {'xyxy': _Tensor(item['xyxy']), 'cls': _Tensor(item['cls']),
+                                        'conf': _Tensor(item['conf'])})()
+        self.masks = None
+        if item['masks'] is not None:
+            self.masks = type('Masks', (), {'data': _Tensor(shm_get(item['masks'], unlink=True)), 'xy': item['xy']})()
+
+    def plot(self):
+        return shm_get(self._client.call({'op': 'plot', 'id': self.id})['plot'], unlink=True)
+
+
+class RemoteModel:
+    def __init__(self, client, weights):
+        self.client = client
+        self.weights = weights
+
+    def predict(self, source, verbose=None, **args):
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images = [shm_put(to_bgr(s)) for s in sources]
+        try:
+            reply = self.client.call({'op': 'predict', 'weights': self.weights, 'images': images, 'args': args})
+        finally:
+            for desc in images:
+                shm_unlink(desc)
+        return [RemoteResult(self.client, item) for item in reply['results']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve all models to the web workers from one process.')
+    parser.add_argument('--socket', default=os.environ.get('INFERENCE_SOCKET', '/tmp/leaf-inference.sock'))
+    parser.add_argument('--preload', nargs='*', default=[], help='weights to load before accepting requests')
+    args = parser.parse_args()
+    server = InferenceServer(args.socket)
+    for weights in args.preload:
+        server.model(weights)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
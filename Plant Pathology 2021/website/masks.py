@@ -0,0 +1,132 @@
+"""Compact storage of per-leaf masks and rendering without inference.
+
+A severity run keeps the combined leaf and lesion mask of every segmented
+leaf in one `masks_<image>.npz` next to its overlays. Each mask is
+run-length encoded (alternating background/foreground run lengths,
+row-major, starting with background) and the file is deflate-compressed.
+A leaf's entry also records its crop region in the original image, the
+mask shape and the severity numbers. Skipped leaves are kept with their
+region only.
+
+From such a file and the uploaded image, `render_leaf` rebuilds a crop
+overlay, `render_composite` a full-image view with every leaf, and
+`severities` the per-leaf numbers, all without running a model. The
+overlay colours and opacity are parameters.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import pipeline
+
+LEAF_COLOR = (0, 255, 0)
+LESION_COLOR = (139, 0, 0)
+ALPHA = 0.3
+
+
+def rle_encode(mask):
+    """Run lengths of a bool mask (row-major), starting with a background run (possibly 0)."""
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate([[0], changes, [flat.size]]))
+    if flat[0]:
+        runs = np.concatenate([[0], runs])
+    return runs.astype(np.uint32)
+
+
+def rle_decode(runs, shape):
+    values = np.arange(len(runs)) % 2 == 1
+    return np.repeat(values, runs.astype(np.int64)).reshape(shape)
+
+
+def save(path, image, image_size, leaves):
+    """Write the masks of one run.
+
+    `leaves` are dicts with index, region (x1, y1, x2, y2), severity,
+    leaf_px, lesion_px, det_class, skipped and, for segmented leaves, the
+    bool `leaf` and `lesion` masks (any resolution; they cover the region).
+    """
+    arrays, meta = {}, []
+    for k, leaf in enumerate(leaves):
+        entry = {key: leaf.get(key) for key in ('index', 'severity', 'leaf_px', 'lesion_px', 'det_class', 'skipped')}
+        entry['region'] = [int(v) for v in leaf['region']]
+        if leaf.get('leaf') is not None:
+            entry['shape'] = list(leaf['leaf'].shape)
+            arrays[f'leaf_{k}'] = rle_encode(leaf['leaf'])
+            arrays[f'lesion_{k}'] = rle_encode(leaf['lesion'])
+        meta.append(entry)
+    arrays['meta'] = np.array(json.dumps({'image': image, 'size': list(image_size), 'leaves': meta}))
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp.npz'
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load(path):
+    """(meta, leaves) of a masks file; segmented leaves carry decoded `leaf` and `lesion` masks."""
+    with np.load(path) as z:
+        meta = json.loads(str(z['meta']))
+        leaves = []
+        for k, entry in enumerate(meta['leaves']):
+            leaf = dict(entry)
+            if 'shape' in entry:
+                leaf['leaf'] = rle_decode(z[f'leaf_{k}'], entry['shape'])
+                leaf['lesion'] = rle_decode(z[f'lesion_{k}'], entry['shape'])
+            leaves.append(leaf)
+    return meta, leaves
+
+
+def severities(leaves):
+    """Per-leaf (index, leaf_px, lesion_px, severity_pct) recomputed from the stored masks."""
+    out = []
+    for leaf in leaves:
+        if 'leaf' in leaf:
+            out.append((leaf['index'], *pipeline.severity_from_masks(leaf['leaf'], leaf['lesion'])))
+        else:
+            out.append((leaf['index'], None, 0, 0.0))
+    return out
+
+
+def render_leaf(image, leaf, leaf_color=LEAF_COLOR, lesion_color=LESION_COLOR, alpha=ALPHA):
+    """Overlay of one leaf's crop (uint8 RGB array); skipped leaves return the plain crop."""
+    crop = image.crop(tuple(leaf['region']))
+    if 'leaf' not in leaf:
+        return np.array(crop)
+    return pipeline.render_overlay(crop, leaf['leaf'], leaf['lesion'], leaf_color, lesion_color, alpha)
+
+
+def render_composite(image, leaves, leaf_color=LEAF_COLOR, lesion_color=LESION_COLOR, alpha=ALPHA, outline=True):
+    """The full image with every segmented leaf overlaid in place and each leaf region outlined."""
+    arr = np.array(image.convert('RGB'))
+    H, W = arr.shape[:2]
+    leaf_full, lesion_full = np.zeros((H, W), dtype=bool), np.zeros((H, W), dtype=bool)
+    for leaf in leaves:
+        if 'leaf' in leaf:
+            x1, y1, x2, y2 = leaf['region']
+            leaf_up = pipeline.resize_mask(leaf['leaf'], x2 - x1, y2 - y1)
+            leaf_full[y1:y2, x1:x2] |= leaf_up
+            lesion_full[y1:y2, x1:x2] |= pipeline.resize_mask(leaf['lesion'], x2 - x1, y2 - y1) & leaf_up
+    out = Image.fromarray(pipeline.color_masks(arr, leaf_full, lesion_full, leaf_color, lesion_color, alpha))
+    if outline:
+        draw = ImageDraw.Draw(out)
+        for leaf in leaves:
+            x1, y1, x2, y2 = leaf['region']
+            draw.rectangle((x1, y1, x2 - 1, y2 - 1), outline=(255, 255, 0), width=max(1, min(out.size) // 300))
+            label = f"{leaf['index']}: {leaf['severity']:.1f}%" + (' (skipped)' if leaf.get('skipped') else '')
+            draw.text((x1 + 3, y1 + 2), label, fill=(255, 255, 0))
+    return np.array(out)
+
+
+def parse_color(text, default):
+    """'#rrggbb' or 'rrggbb' -> (r, g, b); `default` when empty or invalid."""
+    text = (text or '').lstrip('#')
+    if len(text) != 6:
+        return default
+    try:
+        return tuple(int(text[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return default
@@ -0,0 +1,105 @@
+"""On-disk cache of prepared (fused, inference-ready) models.
+
+Training checkpoints carry the EMA copy, optimizer state and half-precision
+weights, and Ultralytics fuses Conv+BatchNorm layers on first use. Every
+process start repeats that work. `load_model` does it once per weight file
+and runtime: the fused float32 model is saved as a slim checkpoint under
+`model_cache/<weights sha1[:16]>-<runtime>.pt`, and later processes load
+that file directly. Ultralytics sees an already fused model and skips
+fusing.
+
+The key includes the torch and ultralytics versions, so upgrading either
+prepares the models again instead of loading an incompatible pickle.
+Stale artifacts are never reused because the weights hash is part of the
+name. Use tools/cold_start.py to measure start-up with and without the
+cache.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache')
+
+
+_known_sha1 = {}  # (path, size, mtime_ns) -> sha1, so per-request callers only stat the file
+
+
+def weights_sha1(path, cache_dir=CACHE_DIR, chunk=1 << 20):
+    """SHA-1 of a weight file, remembered in memory and in <cache_dir>/hashes.json by size and mtime."""
+    st = os.stat(path)
+    key, stamp = os.path.abspath(path), [st.st_size, st.st_mtime_ns]
+    known = _known_sha1.get((key, *stamp))
+    if known is not None:
+        return known
+    index_path = os.path.join(cache_dir, 'hashes.json')
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if index.get(key, {}).get('stamp') == stamp:
+        _known_sha1[(key, *stamp)] = index[key]['sha1']
+        return index[key]['sha1']
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    index[key] = {'stamp': stamp, 'sha1': h.hexdigest()}
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{index_path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, index_path)
+    _known_sha1[(key, *stamp)] = index[key]['sha1']
+    return index[key]['sha1']
+
+
+def runtime_tag():
+    import torch
+    import ultralytics
+    return f"torch{torch.__version__.split('+')[0]}-ul{ultralytics.__version__}"
+
+
+def prepared_path(weights, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{weights_sha1(weights, cache_dir)[:16]}-{runtime_tag()}.pt')
+
+
+def prepare(weights, out_path):
+    """Write the fused float32 inference model of `weights` to out_path."""
+    import torch
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    model.fuse()
+    ckpt = torch.load(weights, map_location='cpu', weights_only=False)
+    for key in ('ema', 'optimizer', 'updates'):
+        ckpt.pop(key, None)
+    ckpt['model'] = model.model.float().eval()
+    ckpt['prepared_from'] = os.path.abspath(weights)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp = f'{out_path}.{uuid.uuid4().hex}.tmp'
+    torch.save(ckpt, tmp)
+    os.replace(tmp, out_path)  # concurrent workers may race; either copy is complete
+
+
+def load_model(weights, cache_dir=CACHE_DIR):
+    """YOLO model for `weights`, loaded from the prepared cache (filled on a miss).
+
+    Returns (model, info) where info has the artifact path, whether it was a
+    cache hit and the load time in ms. Falls back to the raw weights when
+    the model cannot be prepared.
+    """
+    from ultralytics import YOLO
+    t0 = time.perf_counter()
+    try:
+        path = prepared_path(weights, cache_dir)
+        hit = os.path.exists(path)
+        if not hit:
+            prepare(weights, path)
+        model = YOLO(path)
+    except Exception as e:
+        print(f"[MODEL] Prepared cache unavailable for {weights} ({e}); loading the weights directly")
+        path, hit = weights, False
+        model = YOLO(weights)
+    return model, {'artifact': path, 'hit': hit, 'load_ms': round((time.perf_counter() - t0) * 1000.0, 1)}
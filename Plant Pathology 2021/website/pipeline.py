@@ -0,0 +1,283 @@
+"""Severity estimation building blocks shared by the Flask routes and tools.
+
+The pipeline is: detect leaves on the full image, crop each selected box
+with padding, segment the crop, union the leaf masks, intersect them with
+the paired lesion masks and report lesion_px / leaf_px as a percentage.
+
+Functions here take already-loaded Ultralytics models and plain arrays so
+they can be reused outside a request (streaming, tools, evaluation).
+
+Besides one segmentation pass per crop, the segmentation model can run once
+on the full image (or a small grid of tiles): `segment_instances` returns
+the instances in image coordinates, `assign_instances` gives each one to
+the detection box that covers most of its mask, and
+`instances_in_region` rebuilds per-leaf masks for `combine_masks`.
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Segmentation classes that describe a leaf, and the lesion class paired
+# with each leaf class (leaf class 2 has no lesion class).
+SEG_LEAF_IDS = [0, 2, 3]
+PAIR_LESION_ID = {0: 1, 3: 4}
+
+# Detection classes whose boxes are reported as 0% severity without a
+# segmentation pass when the detector is at least this confident.
+SKIP_RULES = {'healthy': 0.7}
+
+
+def plot_rgb(r):
+    """Return the Ultralytics plot of `r` converted from BGR to RGB."""
+    ann = r.plot()
+    try:
+        if ann.shape[2] == 3:
+            return np.stack([ann[:, :, 2], ann[:, :, 1], ann[:, :, 0]], axis=2)
+    except Exception:
+        pass
+    return ann
+
+
+def save_plot(r, out_path):
+    Image.fromarray(plot_rgb(r).astype('uint8')).save(out_path)
+
+
+def save_detection_plot(det, out_path):
+    """Save the annotated detection image of a detect() result, or of a cached one (its 'plot')."""
+    if det.get('result') is not None:
+        save_plot(det['result'], out_path)
+    else:
+        det['plot'].convert('RGB').save(out_path)
+
+
+def detect(model, source, conf=0.25, imgsz=640, **predict_args):
+    """Run the detection model and return boxes/classes/scores as numpy arrays.
+
+    Extra keyword arguments (max_det, half, iou, ...) go to model.predict.
+    Returns None when the model produced no result at all.
+    """
+    res = model.predict(source=source, conf=conf, imgsz=imgsz, **predict_args)
+    if not res:
+        return None
+    r = res[0]
+    return {
+        'boxes': r.boxes.xyxy.cpu().numpy(),
+        'cls': r.boxes.cls.cpu().numpy().astype(int),
+        'conf': r.boxes.conf.cpu().numpy(),
+        'names': getattr(r, 'names', None) or {},
+        'result': r,
+    }
+
+
+def select_boxes(boxes, multi_leaf):
+    """Indices of boxes to estimate: all of them, or only the largest one."""
+    if multi_leaf:
+        return list(range(len(boxes)))
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return [int(np.argmax(areas))]
+
+
+def normalize_class(name):
+    return str(name).strip().lower().replace('-', '_').replace(' ', '_')
+
+
+def parse_skip_rules(text):
+    """'healthy:0.7, rust:0.95' -> {'healthy': 0.7, 'rust': 0.95}; an empty string disables skipping."""
+    rules = {}
+    for part in text.split(','):
+        name, _, conf = part.partition(':')
+        if name.strip():
+            rules[normalize_class(name)] = float(conf) if conf.strip() else SKIP_RULES.get(normalize_class(name), 0.7)
+    return rules
+
+
+def plan_leaves(det, idxs, rules):
+    """Decide per selected box whether it needs segmentation.
+
+    Returns one dict per index with the detection class and confidence,
+    the action ('segment' or 'skip') and the rule that caused a skip.
+    """
+    names = det.get('names') or {}
+    plan = []
+    for i in idxs:
+        cls_name = normalize_class(names.get(int(det['cls'][i]), det['cls'][i]))
+        conf = float(det['conf'][i])
+        min_conf = rules.get(cls_name)
+        skip = min_conf is not None and conf >= min_conf
+        plan.append({'index': i, 'class': cls_name, 'conf': round(conf, 3), 'action': 'skip' if skip else 'segment',
+                     'rule': f'{cls_name}>={min_conf:g}' if skip else None})
+    return plan
+
+
+def crop_region(box, pad, W, H):
+    x1, y1, x2, y2 = np.asarray(box).astype(int)
+    return (max(0, x1 - pad), max(0, y1 - pad), min(W, x2 + pad), min(H, y2 + pad))
+
+
+def segment(model, source, conf=0.25, imgsz=640, **predict_args):
+    """Run the segmentation model and return boolean masks and classes.
+
+    Returns None when there is no result or the result carries no masks.
+    """
+    res = model.predict(source=source, conf=conf, imgsz=imgsz, **predict_args)
+    if not res:
+        return None
+    r = res[0]
+    try:
+        masks = (r.masks.data.cpu().numpy() > 0.5)
+        cls = r.boxes.cls.cpu().numpy().astype(int)
+        confs = r.boxes.conf.cpu().numpy()
+    except Exception:
+        return None
+    return {'masks': masks, 'cls': cls, 'conf': confs, 'result': r}
+
+
+def combine_masks(masks, cls):
+    """Union leaf masks and their paired lesion masks.
+
+    Returns (combined_leaf, combined_lesion) or None when no leaf was found.
+    """
+    leaf_idxs = [j for j, c in enumerate(cls) if int(c) in SEG_LEAF_IDS]
+    if not leaf_idxs:
+        return None
+    combined_leaf = np.any(masks[leaf_idxs], axis=0)
+    lesion_idxs_all = []
+    for j in leaf_idxs:
+        leaf_class = int(cls[j])
+        if leaf_class in PAIR_LESION_ID:
+            lesion_id = PAIR_LESION_ID[leaf_class]
+            lesion_idxs_all += [k for k, c in enumerate(cls) if int(c) == lesion_id]
+    combined_lesion = np.zeros_like(combined_leaf, dtype=bool)
+    if lesion_idxs_all:
+        combined_lesion = np.any(masks[lesion_idxs_all], axis=0)
+    return combined_leaf, combined_lesion
+
+
+def severity_from_masks(combined_leaf, combined_lesion):
+    """Return (leaf_px, lesion_px, severity_pct) for one leaf."""
+    lesion_in_leaf = combined_lesion & combined_leaf
+    leaf_px = int(combined_leaf.sum())
+    lesion_px = int(lesion_in_leaf.sum())
+    severity_pct = round(float((lesion_px / leaf_px * 100.0) if leaf_px > 0 else 0.0), 2)
+    return leaf_px, lesion_px, severity_pct
+
+
+def resize_mask(mask, W, H):
+    """Bool mask resized to W x H (as the overlays have always been drawn)."""
+    return np.array(Image.fromarray(mask.astype('uint8') * 255).resize((W, H))).astype(bool)
+
+
+def color_masks(arr, leaf, lesion, leaf_color=(0, 255, 0), lesion_color=(139, 0, 0), alpha=0.3):
+    """Copy of an RGB array with the leaf blended in and the lesion inside the leaf painted opaque."""
+    overlay = arr.copy()
+    overlay[leaf] = ((1 - alpha) * overlay[leaf] + alpha * np.array(leaf_color)).astype(np.uint8)
+    overlay[lesion & leaf] = np.array(lesion_color, dtype=np.uint8)
+    return overlay
+
+
+def render_overlay(crop, combined_leaf, combined_lesion, leaf_color=(0, 255, 0), lesion_color=(139, 0, 0), alpha=0.3):
+    """Leaf in semi-transparent green, lesion inside the leaf in opaque dark red (colours adjustable)."""
+    crop_arr = np.array(crop)
+    Hc, Wc = crop_arr.shape[:2]
+    return color_masks(crop_arr, resize_mask(combined_leaf, Wc, Hc), resize_mask(combined_lesion, Wc, Hc),
+                       leaf_color, lesion_color, alpha)
+
+
+SEG_MODES = ('crop', 'full', 'tiled')
+
+
+def tile_grid(W, H, tiles, overlap=0.1):
+    """(x1, y1, x2, y2) of a tiles x tiles grid over the image, each tile grown by `overlap`."""
+    if tiles <= 1:
+        return [(0, 0, W, H)]
+    tw, th = W / tiles, H / tiles
+    ox, oy = int(tw * overlap), int(th * overlap)
+    return [(max(0, int(c * tw) - ox), max(0, int(r * th) - oy), min(W, int((c + 1) * tw) + ox), min(H, int((r + 1) * th) + oy))
+            for r in range(tiles) for c in range(tiles)]
+
+
+def polygon_mask(poly, box):
+    """Rasterize an image-space polygon into a bool mask covering `box`."""
+    x1, y1, x2, y2 = box
+    m = Image.new('L', (x2 - x1, y2 - y1), 0)
+    ImageDraw.Draw(m).polygon([(float(x) - x1, float(y) - y1) for x, y in poly], fill=1)
+    return np.array(m, dtype=bool)
+
+
+def box_iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def segment_instances(model, image, conf=0.25, imgsz=640, tiles=1, overlap=0.1, **predict_args):
+    """Segment a PIL image in one predict call, whole or as a tiles x tiles grid.
+
+    Returns a list of instances {'cls', 'conf', 'box', 'mask'} where box is
+    (x1, y1, x2, y2) in image pixels and mask is a bool array over that box.
+    Duplicates from overlapping tiles (same class, box IoU > 0.6) are merged,
+    keeping the more confident one.
+    """
+    W, H = image.size
+    grid = tile_grid(W, H, tiles, overlap)
+    results = model.predict(source=[image.crop(t) for t in grid], conf=conf, imgsz=imgsz, verbose=False, **predict_args)
+    instances = []
+    for (tx, ty, _, _), r in zip(grid, results):
+        if r.masks is None:
+            continue
+        cls = r.boxes.cls.cpu().numpy().astype(int)
+        confs = r.boxes.conf.cpu().numpy()
+        for poly, c, score in zip(r.masks.xy, cls, confs):
+            if len(poly) < 3:
+                continue
+            poly = poly + np.array([tx, ty])
+            x1, y1 = np.maximum(np.floor(poly.min(axis=0)).astype(int), 0)
+            x2, y2 = np.minimum(np.ceil(poly.max(axis=0)).astype(int) + 1, [W, H])
+            if x2 <= x1 or y2 <= y1:
+                continue
+            box = (int(x1), int(y1), int(x2), int(y2))
+            instances.append({'cls': int(c), 'conf': float(score), 'box': box, 'mask': polygon_mask(poly, box)})
+    if len(grid) > 1:
+        kept = []
+        for inst in sorted(instances, key=lambda i: -i['conf']):
+            if all(k['cls'] != inst['cls'] or box_iou(k['box'], inst['box']) <= 0.6 for k in kept):
+                kept.append(inst)
+        instances = kept
+    return instances
+
+
+def assign_instances(instances, boxes, min_overlap=0.5):
+    """{box position: [instances]}: each instance goes to the box holding the largest share of its mask.
+
+    Instances with less than `min_overlap` of their area inside any box are dropped.
+    """
+    boxes = np.asarray(boxes).astype(int)
+    assigned = {}
+    for inst in instances:
+        x1, y1, x2, y2 = inst['box']
+        area = inst['mask'].sum()
+        if area == 0 or len(boxes) == 0:
+            continue
+        ix1, iy1 = np.maximum(boxes[:, 0], x1), np.maximum(boxes[:, 1], y1)
+        ix2, iy2 = np.minimum(boxes[:, 2], x2), np.minimum(boxes[:, 3], y2)
+        fracs = np.zeros(len(boxes))
+        for j in np.flatnonzero((ix2 > ix1) & (iy2 > iy1)):
+            fracs[j] = inst['mask'][iy1[j] - y1:iy2[j] - y1, ix1[j] - x1:ix2[j] - x1].sum() / area
+        best = int(np.argmax(fracs))
+        if fracs[best] >= min_overlap:
+            assigned.setdefault(best, []).append(inst)
+    return assigned
+
+
+def instances_in_region(instances, region):
+    """(masks (N, h, w), cls, conf) of the instances pasted into `region` (x1, y1, x2, y2)."""
+    rx1, ry1, rx2, ry2 = region
+    masks = np.zeros((len(instances), ry2 - ry1, rx2 - rx1), dtype=bool)
+    for k, inst in enumerate(instances):
+        x1, y1, x2, y2 = inst['box']
+        ix1, iy1, ix2, iy2 = max(x1, rx1), max(y1, ry1), min(x2, rx2), min(y2, ry2)
+        if ix2 > ix1 and iy2 > iy1:
+            masks[k, iy1 - ry1:iy2 - ry1, ix1 - rx1:ix2 - rx1] = inst['mask'][iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1]
+    return (masks, np.array([i['cls'] for i in instances], dtype=int),
+            np.array([i['conf'] for i in instances], dtype=float))
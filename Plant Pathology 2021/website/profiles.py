@@ -0,0 +1,86 @@
+"""Named inference profiles.
+
+A profile bundles the Ultralytics predict arguments that trade accuracy
+for latency (conf, imgsz, max_det, half, iou). `half` (FP16) only takes
+effect on a CUDA device; the website runs on the CPU, where it is ignored,
+so every built-in profile leaves it off. Requests pick one with the
+`profile` field; `balanced` reproduces the former fixed conf=0.25 /
+imgsz=640.
+
+Profiles can be tuned per model in `profiles.json` (written by
+tools/calibrate.py), keyed by the weights path relative to the website
+folder:
+
+    {"models": {"models/segmentation/nano/best.pt": {
+        "profiles": {"fast": {"imgsz": 320}},
+        "auto": {"conf": 0.25, "imgsz": 512, ...},
+        "calibration": {...}}}}
+
+`profiles` overrides individual arguments of a named profile for that
+model, and `auto` holds the arguments of the candidate (a named profile or
+an imgsz variant) the calibration picked to meet its target p95 latency
+on this machine. The `auto` profile falls back to `balanced`
+for models that were never calibrated.
+"""
+import json
+import os
+import threading
+
+PROFILES = {
+    'fast': {'conf': 0.3, 'imgsz': 416, 'max_det': 100, 'half': False, 'iou': 0.7},
+    'balanced': {'conf': 0.25, 'imgsz': 640, 'max_det': 300, 'half': False, 'iou': 0.7},
+    'accurate': {'conf': 0.2, 'imgsz': 960, 'max_det': 300, 'half': False, 'iou': 0.6},
+}
+DEFAULT = 'balanced'
+NAMES = tuple(PROFILES) + ('auto',)
+PROFILES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles.json')
+
+_lock = threading.Lock()
+_loaded = {'mtime': None, 'data': {}}
+
+
+def model_key(weights):
+    """Key of a weights file in profiles.json: its path relative to the website folder."""
+    base = os.path.dirname(PROFILES_FILE)
+    path = os.path.abspath(weights)
+    return os.path.relpath(path, base).replace(os.sep, '/') if path.startswith(base + os.sep) else path
+
+
+def load(path=PROFILES_FILE):
+    """Parsed profiles.json, re-read only when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _lock:
+        if _loaded['mtime'] != (path, mtime):
+            with open(path, 'r', encoding='utf-8') as f:
+                _loaded['data'] = json.load(f)
+            _loaded['mtime'] = (path, mtime)
+        return _loaded['data']
+
+
+def resolve(name, weights=None, path=PROFILES_FILE):
+    """Predict arguments of profile `name` for the model at `weights`.
+
+    Raises KeyError for an unknown profile name.
+    """
+    if name not in NAMES:
+        raise KeyError(name)
+    tuned = load(path).get('models', {}).get(model_key(weights), {}) if weights else {}
+    if name == 'auto':
+        return dict(tuned.get('auto') or PROFILES[DEFAULT])
+    params = dict(PROFILES[name])
+    params.update(tuned.get('profiles', {}).get(name, {}))
+    return params
+
+
+def save_model(weights, entry, path=PROFILES_FILE):
+    """Merge `entry` into the profiles.json section of one model."""
+    data = json.loads(json.dumps(load(path)))  # don't mutate the cached copy
+    models = data.setdefault('models', {})
+    models.setdefault(model_key(weights), {}).update(entry)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,190 @@
+"""Persistent store of severity results, backed by SQLite.
+
+Every severity run is recorded with its image hash, models, parameters,
+timings and one row per leaf (class, detector confidence, severity,
+leaf_px, lesion_px and the model that produced it), so the numbers can be
+queried later without running inference again.
+
+Writes never block a request: `add` puts the run on a queue and a writer
+thread inserts whatever has accumulated (up to BATCH runs or FLUSH_SECONDS)
+in one transaction with executemany. Leaf rows carry the run's day and
+the model label so the aggregates (severity distribution by class, model or
+day) are answered from covering indexes.
+"""
+import atexit
+import contextlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    image_sha1 TEXT NOT NULL,
+    filename TEXT,
+    det_model TEXT,
+    seg_model TEXT,
+    params TEXT NOT NULL,
+    leaves INTEGER NOT NULL,
+    mean_severity REAL,
+    max_severity REAL,
+    det_ms REAL,
+    seg_ms REAL,
+    total_ms REAL,
+    created REAL NOT NULL,
+    day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_image ON runs(image_sha1, created);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created);
+CREATE TABLE IF NOT EXISTS leaves (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    leaf_index INTEGER NOT NULL,
+    det_class TEXT,
+    det_conf REAL,
+    severity REAL NOT NULL,
+    leaf_px INTEGER,
+    lesion_px INTEGER,
+    skipped INTEGER NOT NULL,
+    model TEXT,
+    day TEXT NOT NULL,
+    PRIMARY KEY (run_id, leaf_index)
+);
+CREATE INDEX IF NOT EXISTS leaves_class ON leaves(det_class, day, severity, skipped);
+CREATE INDEX IF NOT EXISTS leaves_model ON leaves(model, day, severity, skipped);
+CREATE INDEX IF NOT EXISTS leaves_day ON leaves(day, severity, skipped);
+"""
+GROUPS = {'class': 'det_class', 'model': 'model', 'day': 'day'}
+BATCH = 64
+FLUSH_SECONDS = 0.5
+
+
+class ResultsStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        self._idle = threading.Condition()
+        self._pending = 0
+        with self.connect() as con:
+            con.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    @contextlib.contextmanager
+    def connect(self):
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA foreign_keys=ON')
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ------------------------------------------------------------------ writes
+
+    def add(self, run, leaves):
+        """Queue one run (dict with the `runs` columns except id/day) and its leaf dicts."""
+        with self._idle:
+            self._pending += 1
+        self._queue.put((run, leaves))
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far has been written."""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._pending and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while len(batch) < BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._insert(batch)
+            except Exception as e:
+                print(f"[RESULTS] Failed to store {len(batch)} runs: {e}")
+            finally:
+                with self._idle:
+                    self._pending -= len(batch)
+                    self._idle.notify_all()
+
+    def _insert(self, batch):
+        with self.connect() as con:
+            leaf_rows = []
+            for run, leaves in batch:
+                row = dict(run, day=time.strftime('%Y-%m-%d', time.localtime(run['created'])))
+                row['params'] = json.dumps(row['params'], sort_keys=True)
+                cur = con.execute(
+                    'INSERT INTO runs (key, image_sha1, filename, det_model, seg_model, params, leaves, mean_severity, '
+                    'max_severity, det_ms, seg_ms, total_ms, created, day) VALUES (:key, :image_sha1, :filename, '
+                    ':det_model, :seg_model, :params, :leaves, :mean_severity, :max_severity, :det_ms, :seg_ms, '
+                    ':total_ms, :created, :day)', row)
+                leaf_rows += [dict(leaf, run_id=cur.lastrowid, day=row['day']) for leaf in leaves]
+            con.executemany(
+                'INSERT INTO leaves (run_id, leaf_index, det_class, det_conf, severity, leaf_px, lesion_px, '
+                'skipped, model, day) VALUES (:run_id, :leaf_index, :det_class, :det_conf, :severity, :leaf_px, '
+                ':lesion_px, :skipped, :model, :day)', leaf_rows)
+
+    # ----------------------------------------------------------------- queries
+
+    def runs(self, image_sha1=None, since=None, until=None, limit=50, offset=0):
+        """Newest runs first, each with its leaves; optionally filtered by image hash and day range."""
+        where, args = [], []
+        if image_sha1:
+            where.append('image_sha1 = ?')
+            args.append(image_sha1)
+        if since:
+            where.append('day >= ?')
+            args.append(since)
+        if until:
+            where.append('day <= ?')
+            args.append(until)
+        sql = 'SELECT * FROM runs' + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY created DESC LIMIT ? OFFSET ?'
+        with self.connect() as con:
+            runs = [dict(r) for r in con.execute(sql, args + [limit, offset])]
+            for run in runs:
+                run['params'] = json.loads(run['params'])
+                run['leaves'] = [dict(r) for r in con.execute(
+                    'SELECT leaf_index, det_class, det_conf, severity, leaf_px, lesion_px, skipped, model '
+                    'FROM leaves WHERE run_id = ? ORDER BY leaf_index', (run['id'],))]
+        return runs
+
+    def aggregate(self, by='class', since=None, until=None, bin_width=10.0, include_skipped=True):
+        """Severity distribution per class, model or day.
+
+        Returns one dict per group value with count, mean, min and max
+        severity and a histogram {bin start: count} of `bin_width` wide bins.
+        """
+        column = GROUPS[by]
+        where, args = [], []
+        if since:
+            where.append('day >= ?')
+            args.append(since)
+        if until:
+            where.append('day <= ?')
+            args.append(until)
+        if not include_skipped:
+            where.append('skipped = 0')
+        clause = ' WHERE ' + ' AND '.join(where) if where else ''
+        with self.connect() as con:
+            stats = con.execute(
+                f'SELECT {column} AS grp, COUNT(*) AS n, AVG(severity) AS mean, MIN(severity) AS min, '
+                f'MAX(severity) AS max FROM leaves{clause} GROUP BY {column} ORDER BY {column}', args).fetchall()
+            bins = con.execute(
+                f'SELECT {column} AS grp, CAST(severity / ? AS INTEGER) AS b, COUNT(*) AS n FROM leaves{clause} '
+                f'GROUP BY {column}, b', [bin_width] + args).fetchall()
+        hist = {}
+        for r in bins:
+            hist.setdefault(r['grp'], {})[round(r['b'] * bin_width, 3)] = r['n']
+        return [{by: r['grp'], 'count': r['n'], 'mean': round(r['mean'], 3), 'min': r['min'], 'max': r['max'],
+                 'histogram': dict(sorted(hist.get(r['grp'], {}).items()))} for r in stats]
@@ -0,0 +1,89 @@
+"""Coalesce identical in-flight computations.
+
+A double-submitted form or a client retrying a slow /predict would run the
+whole pipeline again in parallel on the same image. `SingleFlight.follow`
+runs one producer per key in a background thread and lets every request
+with that key, including the first, replay its events as they are
+produced. A request that disconnects therefore never stalls the others,
+and streaming and non-streaming requests can share one run. Once the
+computation finishes the key is released, so a later request recomputes.
+"""
+import threading
+
+
+class Flight:
+    """Event log of one computation, readable by any number of followers."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.cond = threading.Condition()
+
+    def publish(self, item):
+        with self.cond:
+            self.events.append(item)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self):
+        """Yield every event from the beginning; re-raise the producer's error at the end."""
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.events) and not self.done:
+                    self.cond.wait()
+                if i < len(self.events):
+                    item = self.events[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield item
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def follow(self, key, produce):
+        """Iterate the events of the computation for `key`, starting `produce()` if none is running.
+
+        `produce` returns an iterable of events; it runs in its own thread.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self._flights[key] = flight
+            flight.followers += 1
+        if leader:
+            threading.Thread(target=self._run, args=(key, flight, produce), daemon=True).start()
+        else:
+            print(f"[PREDICT] Joined in-flight computation {key[:16]} ({flight.followers} requests)")
+        return flight.follow()
+
+    def _run(self, key, flight, produce):
+        error = None
+        try:
+            for item in produce():
+                flight.publish(item)
+        except BaseException as e:
+            error = e
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.finish(error)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
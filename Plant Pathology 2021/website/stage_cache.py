@@ -0,0 +1,171 @@
+"""Memoization of pipeline stages across severity re-runs.
+
+Changing `pad`, `multi_leaf` or the segmentation model on the same upload
+used to repeat detection on the whole image. `StageCache` keeps stage
+outputs keyed by what they depend on:
+
+- detection: image hash, detection weights hash and predict arguments;
+  boxes, classes, scores, class names and the annotated plot (JPEG),
+- segmentation of one crop: image hash, crop region, segmentation weights
+  hash and predict arguments; bit-packed masks, classes and scores.
+
+Severity numbers are cheap and always recomputed from these. Entries live
+in a small in-memory LRU (bounded by entries and bytes) in front of npz
+files under `stage_cache/<stage>/`, which are shared by all workers and
+evicted least-recently-used first when the folder grows past `max_bytes`.
+"""
+import collections
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from PIL import Image
+
+import pipeline
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stage_cache')
+
+
+def stage_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# ------------------------------------------------------------------ encoding
+
+def pack_detection(det):
+    """npz arrays for a pipeline.detect result; the plot is rendered once and stored as JPEG."""
+    buf = io.BytesIO()
+    Image.fromarray(pipeline.plot_rgb(det['result']).astype('uint8')).save(buf, format='JPEG', quality=90)
+    return {'boxes': det['boxes'], 'cls': det['cls'], 'conf': det['conf'],
+            'names': np.array(json.dumps({str(k): v for k, v in det['names'].items()})),
+            'plot': np.frombuffer(buf.getvalue(), dtype=np.uint8)}
+
+
+def unpack_detection(z):
+    return {'boxes': z['boxes'], 'cls': z['cls'].astype(int), 'conf': z['conf'],
+            'names': {int(k): v for k, v in json.loads(str(z['names'])).items()},
+            'plot': Image.open(io.BytesIO(z['plot'].tobytes()))}
+
+
+def pack_segmentation(seg):
+    n, h, w = seg['masks'].shape
+    return {'packed': np.packbits(seg['masks'].reshape(n, h * w), axis=1), 'shape': np.array([n, h, w]),
+            'cls': seg['cls'], 'conf': seg['conf']}
+
+
+def unpack_segmentation(z):
+    n, h, w = (int(v) for v in z['shape'])
+    masks = np.unpackbits(z['packed'], axis=1, count=h * w).reshape(n, h, w).astype(bool)
+    return {'masks': masks, 'cls': z['cls'].astype(int), 'conf': z['conf']}
+
+
+def value_bytes(value):
+    """Approximate memory held by a decoded stage value."""
+    total = 0
+    for v in value.values():
+        if isinstance(v, np.ndarray):
+            total += v.nbytes
+        elif isinstance(v, Image.Image):
+            total += v.width * v.height * 3
+    return total
+
+
+CODECS = {'detection': (pack_detection, unpack_detection), 'segmentation': (pack_segmentation, unpack_segmentation)}
+
+
+# --------------------------------------------------------------------- cache
+
+class StageCache:
+    def __init__(self, folder=CACHE_DIR, max_items=256, max_memory=256 << 20, max_bytes=1 << 30):
+        self.folder = folder
+        self.max_items = max_items
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # (stage, key) -> (value, nbytes)
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self.stats = collections.Counter()
+
+    def _path(self, stage, key):
+        return os.path.join(self.folder, stage, key[:2], key + '.npz')
+
+    def get_or_compute(self, stage, key, compute):
+        """Stage output for `key`: from memory, then disk, else `compute()` (a None result is not cached)."""
+        pack, unpack = CODECS[stage]
+        with self._lock:
+            hit = self._memory.get((stage, key))
+            if hit is not None:
+                self._memory.move_to_end((stage, key))
+                self.stats[stage + '_memory'] += 1
+                return hit[0]
+        path = self._path(stage, key)
+        try:
+            with np.load(path) as z:
+                value = unpack(z)
+            os.utime(path)  # recently used: evicted last
+            self.stats[stage + '_disk'] += 1
+        except (FileNotFoundError, ValueError, OSError):
+            value = compute()
+            self.stats[stage + '_miss'] += 1
+            if value is None:
+                return None
+            arrays = pack(value)
+            self._write(path, arrays)
+            value = unpack(arrays)
+        self._remember(stage, key, value, value_bytes(value))
+        return value
+
+    def _remember(self, stage, key, value, nbytes):
+        with self._lock:
+            self._memory[(stage, key)] = (value, nbytes)
+            self._memory_bytes += nbytes
+            while self._memory and (len(self._memory) > self.max_items or self._memory_bytes > self.max_memory):
+                _, (_, size) = self._memory.popitem(last=False)
+                self._memory_bytes -= size
+
+    def _write(self, path, arrays):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(s for _, s, _ in self._files())
+            else:
+                self._disk_bytes += size
+            over = self._disk_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _files(self):
+        for root, _, files in os.walk(self.folder):
+            for f in files:
+                if f.endswith('.npz') and '.tmp' not in f:
+                    p = os.path.join(root, f)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:
+                        continue
+                    yield p, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """Delete the least recently used files until the folder is under 90% of max_bytes."""
+        files = sorted(self._files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats['evicted'] += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
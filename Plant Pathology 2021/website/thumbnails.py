@@ -0,0 +1,110 @@
+"""Content-addressed thumbnails for the dataset gallery.
+
+Thumbnails are named after the SHA-1 of the source image (taken from the
+dataset manifest), so they are generated once per distinct image, survive
+renames and never go stale: a changed image gets a new hash and a new
+thumbnail. Each image gets every size in SIZES as WebP (when Pillow was
+built with it) and JPEG:
+
+    static/thumbs/<sha1[:2]>/<sha1>_<size>.<webp|jpg>
+
+Generation runs in a pool and skips files that already exist. Run this
+module directly to pre-generate thumbnails for a folder:
+
+    python thumbnails.py static/dataset_samples
+"""
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+THUMB_DIR = os.path.join('static', 'thumbs')
+# longest side in pixels; 'sm' for the grid, 'md' for large cards / retina
+SIZES = {'sm': 160, 'md': 480}
+WEBP = features.check('webp')
+FORMATS = ('webp', 'jpg') if WEBP else ('jpg',)
+
+
+def thumb_rel(sha1, size, fmt):
+    """Path of a thumbnail relative to THUMB_DIR."""
+    return f'{sha1[:2]}/{sha1}_{size}.{fmt}'
+
+
+def thumb_paths(sha1, out_dir=THUMB_DIR):
+    return {(size, fmt): os.path.join(out_dir, thumb_rel(sha1, size, fmt)) for size in SIZES for fmt in FORMATS}
+
+
+def is_complete(sha1, out_dir=THUMB_DIR):
+    return all(os.path.exists(p) for p in thumb_paths(sha1, out_dir).values())
+
+
+def make_thumbnails(src, sha1, out_dir=THUMB_DIR):
+    """Write the missing thumbnails of one image; returns how many were written."""
+    todo = {k: p for k, p in thumb_paths(sha1, out_dir).items() if not os.path.exists(p)}
+    if not todo:
+        return 0
+    with Image.open(src) as im:
+        im.draft('RGB', (max(SIZES.values()),) * 2)  # JPEG: decode at reduced scale
+        im = ImageOps.exif_transpose(im).convert('RGB')
+        # largest first, so each smaller size is resampled from the previous one
+        for size in sorted(SIZES, key=SIZES.get, reverse=True):
+            im.thumbnail((SIZES[size], SIZES[size]), Image.LANCZOS)
+            for fmt in FORMATS:
+                path = todo.get((size, fmt))
+                if path is None:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # unique per writer: duplicate images share a sha1 and may be built concurrently
+                tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+                if fmt == 'webp':
+                    im.save(tmp, 'WEBP', quality=80, method=4)
+                else:
+                    im.save(tmp, 'JPEG', quality=82, optimize=True, progressive=True)
+                os.replace(tmp, path)
+    return len(todo)
+
+
+def _make(job):
+    src, sha1, out_dir = job
+    try:
+        return make_thumbnails(src, sha1, out_dir)
+    except Exception as e:
+        print(f'[THUMBS] failed {src}: {e}')
+        return 0
+
+
+def ensure_thumbnails(items, out_dir=THUMB_DIR, workers=4, processes=False):
+    """Generate thumbnails for (src_path, sha1) pairs that are missing any.
+
+    Requests use threads (Pillow releases the GIL while resampling); batch
+    runs pass processes=True. Returns the number of files written.
+    """
+    jobs = [(src, sha1, out_dir) for src, sha1 in items if sha1 and not is_complete(sha1, out_dir)]
+    if not jobs:
+        return 0
+    if len(jobs) == 1 or workers <= 1:
+        return sum(map(_make, jobs))
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        return sum(pool.map(_make, jobs, chunksize=8 if processes else 1))
+
+
+def urls(sha1, url_for):
+    """{size: {fmt: url}} for templates and JSON responses."""
+    return {size: {fmt: url_for('static', filename='thumbs/' + thumb_rel(sha1, size, fmt)) for fmt in FORMATS}
+            for size in SIZES}
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+    from dataset_manifest import Manifest
+
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join('static', 'dataset_samples')
+    manifest = Manifest(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset', 'manifest.sqlite'))
+    root = os.path.abspath(root)
+    manifest.refresh(root)
+    written = ensure_thumbnails([(r['path'], r['sha1']) for r in manifest.query(root)],
+                                workers=os.cpu_count() or 4, processes=True)
+    print(f'{written} thumbnails written to {THUMB_DIR}')
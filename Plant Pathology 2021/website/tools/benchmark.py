@@ -0,0 +1,210 @@
+"""Measured CPU cost of the nano, small and medium model variants.
+
+For every variant under website/models/object_detection/<size>/ and
+website/models/segmentation/<size>/ it reports:
+
+- load_ms: YOLO(weights) in a process that has already imported Ultralytics,
+- latency at batch 1 and batch 8 (warm, per call and per image; p50/p95),
+- throughput in images/s at batch 8,
+- peak RSS of the process after loading and predicting,
+
+and for each size with both models, the end-to-end severity latency
+(detect -> crop -> segment -> severity, as the website runs it) for the
+largest leaf only (single-leaf) and for every detected leaf (multi-leaf).
+
+Every measurement runs in its own subprocess so peak RSS belongs to one
+model. Results go to results/benchmark.json; `--markdown` also prints a
+table for the README.
+
+Usage (from the 'Plant Pathology 2021' folder):
+  python website/tools/benchmark.py
+  python website/tools/benchmark.py --sizes nano small --images dataset/object_detection/test/images --iters 20
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+
+SIZES = ['nano', 'small', 'medium']
+MODELS_DIR = os.path.join(ROOT, 'website', 'models')
+KINDS = {'detection': 'object_detection', 'segmentation': 'segmentation'}
+DEFAULT_IMAGES = os.path.join(ROOT, 'dataset', 'object_detection', 'test', 'images')
+OUT_FILE = os.path.join(ROOT, 'results', 'benchmark.json')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def percentiles(times_ms):
+    import numpy as np
+    return {'p50_ms': round(float(np.percentile(times_ms, 50)), 1), 'p95_ms': round(float(np.percentile(times_ms, 95)), 1),
+            'mean_ms': round(float(np.mean(times_ms)), 1)}
+
+
+def bench_model(weights, images, iters, imgsz):
+    """Load time, batch-1/batch-8 latency, throughput and peak RSS of one model."""
+    from PIL import Image
+    from ultralytics import YOLO
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    model = YOLO(weights)
+    load_ms = (time.perf_counter() - t0) * 1000.0
+    frames = [Image.open(p).convert('RGB') for p in images]
+    model.predict(source=frames[0], imgsz=imgsz, device='cpu', verbose=False)  # warm-up
+    out = {'load_ms': round(load_ms, 1)}
+    for batch in (1, 8):
+        times = []
+        for i in range(iters):
+            part = [frames[(i * batch + j) % len(frames)] for j in range(batch)]
+            t0 = time.perf_counter()
+            model.predict(source=part, imgsz=imgsz, device='cpu', verbose=False)
+            times.append((time.perf_counter() - t0) * 1000.0)
+        stats = percentiles(times)
+        stats['per_image_ms'] = round(stats['mean_ms'] / batch, 1)
+        stats['images_per_s'] = round(1000.0 * batch / stats['mean_ms'], 2)
+        out[f'batch{batch}'] = stats
+    out['throughput_images_per_s'] = out['batch8']['images_per_s']
+    out['peak_rss_mb'] = peak_rss_mb()
+    out['baseline_rss_mb'] = rss_before
+    return out
+
+
+def bench_severity(det_weights, seg_weights, images, iters, imgsz, pad=10):
+    """End-to-end severity latency for the largest leaf and for all leaves."""
+    from PIL import Image
+    from ultralytics import YOLO
+    import pipeline
+    det, seg = YOLO(det_weights), YOLO(seg_weights)
+    frames = [Image.open(p).convert('RGB') for p in images]
+    args = {'imgsz': imgsz, 'device': 'cpu', 'verbose': False}
+
+    def run(img, multi_leaf):
+        d = pipeline.detect(det, img, **args)
+        if d is None or len(d['boxes']) == 0:
+            return 0
+        W, H = img.size
+        idxs = pipeline.select_boxes(d['boxes'], multi_leaf)
+        for i in idxs:
+            s = pipeline.segment(seg, img.crop(pipeline.crop_region(d['boxes'][i], pad, W, H)), **args)
+            combined = pipeline.combine_masks(s['masks'], s['cls']) if s is not None else None
+            if combined is not None:
+                pipeline.severity_from_masks(*combined)
+        return len(idxs)
+
+    run(frames[0], True)  # warm-up both models
+    out = {}
+    for name, multi_leaf in (('single_leaf', False), ('multi_leaf', True)):
+        times, leaves = [], []
+        for i in range(iters):
+            t0 = time.perf_counter()
+            leaves.append(run(frames[i % len(frames)], multi_leaf))
+            times.append((time.perf_counter() - t0) * 1000.0)
+        out[name] = dict(percentiles(times), mean_leaves=round(sum(leaves) / len(leaves), 2))
+    out['peak_rss_mb'] = peak_rss_mb()
+    return out
+
+
+def in_subprocess(*args):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', *args], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit {proc.returncode}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def variant_weights(kind, size):
+    folder = os.path.join(MODELS_DIR, KINDS[kind], size)
+    if not os.path.isdir(folder):
+        return None
+    weights = sorted(f for f in os.listdir(folder) if f.endswith(('.pt', '.pth')))
+    return os.path.join(folder, weights[0]) if weights else None
+
+
+def markdown(report):
+    lines = ['| Varian | Model | Load (ms) | Latensi b1 p50 (ms) | Per gambar b8 (ms) | Throughput (img/s) | Peak RSS (MB) |',
+             '|--------|-------|-----------|---------------------|--------------------|--------------------|---------------|']
+    for size, entry in report['variants'].items():
+        for kind in KINDS:
+            m = entry.get(kind)
+            if m and 'error' not in m:
+                lines.append(f"| `{size}` | {kind} | {m['load_ms']:.0f} | {m['batch1']['p50_ms']:.0f} | "
+                             f"{m['batch8']['per_image_ms']:.0f} | {m['throughput_images_per_s']:.1f} | {m['peak_rss_mb']:.0f} |")
+    lines += ['', '| Varian | Severity 1 daun p50 / p95 (ms) | Severity semua daun p50 / p95 (ms) |',
+              '|--------|--------------------------------|------------------------------------|']
+    for size, entry in report['variants'].items():
+        s = entry.get('severity')
+        if s and 'error' not in s:
+            lines.append(f"| `{size}` | {s['single_leaf']['p50_ms']:.0f} / {s['single_leaf']['p95_ms']:.0f} | "
+                         f"{s['multi_leaf']['p50_ms']:.0f} / {s['multi_leaf']['p95_ms']:.0f} |")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the nano/small/medium variants on CPU.')
+    parser.add_argument('--sizes', nargs='+', default=SIZES)
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help='folder of test images')
+    parser.add_argument('--limit', type=int, default=16, help='images to cycle through')
+    parser.add_argument('--iters', type=int, default=10, help='timed calls per measurement')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--out', default=OUT_FILE)
+    parser.add_argument('--markdown', action='store_true', help='also print a README table')
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = sorted(os.path.join(args.images, f) for f in os.listdir(args.images)
+                    if f.lower().endswith(IMAGE_EXTS))[:args.limit] if os.path.isdir(args.images) else []
+    if not images:
+        print(f'No images in {args.images}')
+        return 2
+    if args.child:
+        what, *weights = args.child
+        if what == 'model':
+            result = bench_model(weights[0], images, args.iters, args.imgsz)
+        else:
+            result = bench_severity(weights[0], weights[1], images, args.iters, args.imgsz)
+        print(json.dumps(result))
+        return 0
+
+    common = ['--images', args.images, '--limit', str(args.limit), '--iters', str(args.iters), '--imgsz', str(args.imgsz)]
+    report = {'host': {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+                       'cpus': os.cpu_count()},
+              'settings': {'images': len(images), 'iters': args.iters, 'imgsz': args.imgsz, 'device': 'cpu'},
+              'variants': {}}
+    for size in args.sizes:
+        entry = report['variants'][size] = {}
+        found = {kind: variant_weights(kind, size) for kind in KINDS}
+        for kind, weights in found.items():
+            if weights is None:
+                continue
+            print(f'[{size}] {kind}: {os.path.relpath(weights, ROOT)}')
+            try:
+                entry[kind] = dict(in_subprocess('model', weights, *common), weights=os.path.relpath(weights, ROOT))
+            except RuntimeError as e:
+                entry[kind] = {'error': str(e)}
+        if all(found.values()):
+            print(f'[{size}] end-to-end severity')
+            try:
+                entry['severity'] = in_subprocess('severity', found['detection'], found['segmentation'], *common)
+            except RuntimeError as e:
+                entry['severity'] = {'error': str(e)}
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    if args.markdown:
+        print('\n' + markdown(report))
+    print(f'\nWritten to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,249 @@
+"""Pick the `auto` inference profile of each model for this machine.
+
+Every registered model (the .pt files under website/models/object_detection
+and website/models/segmentation, or --models) is run on the CPU with each
+named profile (fast, balanced, accurate, including per-model overrides
+from profiles.json) and, with --sizes, with extra imgsz variants of the
+--base profile. For each candidate it records the p50/p95 latency of one
+predict call per image and its accuracy:
+
+- with labels (`<images>/../labels/<stem>.txt`, YOLO format, as used by
+  tools/evaluate.py): detection F1 against the ground-truth boxes (matched
+  by class at IoU >= 0.5), or segmentation mean leaf/lesion mask IoU
+  against the ground-truth polygons,
+- without labels: agreement with the `accurate` profile's own output
+  (same measures). This is only a proxy: it favours settings close to
+  `accurate` and is reported as `agreement`, not accuracy.
+
+The most accurate candidate whose p95 meets --target-p95 (ms) becomes the
+model's `auto` profile in website/profiles.json (ties go to the faster
+one), together with the measurements; when none meets the target the
+fastest is used.
+
+Usage (from the 'Plant Pathology 2021' folder):
+  python website/tools/calibrate.py --target-p95 300
+  python website/tools/calibrate.py --target-p95 150 --sizes 320 512 --limit 10 \\
+      --models website/models/segmentation/nano/best.pt
+"""
+import argparse
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+sys.path.insert(0, os.path.join(ROOT, 'website', 'tools'))
+import pipeline
+import profiles
+
+MODELS_DIR = os.path.join(ROOT, 'website', 'models')
+KINDS = {'object_detection': 'detection', 'segmentation': 'segmentation'}
+DEFAULT_IMAGES = {
+    'detection': os.path.join(ROOT, 'dataset', 'object_detection', 'test', 'images'),
+    'segmentation': os.path.join(ROOT, 'dataset', 'mask_lesi_and_leaf', 'test', 'images'),
+}
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def registered_models():
+    """[(kind, weights)] for every model under website/models."""
+    found = []
+    for folder, kind in KINDS.items():
+        for root, _, files in os.walk(os.path.join(MODELS_DIR, folder)):
+            found += [(kind, os.path.join(root, f)) for f in sorted(files) if f.endswith(('.pt', '.pth'))]
+    return found
+
+
+def kind_of(weights):
+    return 'segmentation' if os.sep + 'segmentation' + os.sep in os.path.abspath(weights) else 'detection'
+
+
+def labels_dir(images):
+    """The YOLO `labels` folder next to an `images` folder, or None."""
+    folder = os.path.join(os.path.dirname(os.path.normpath(images)), 'labels')
+    return folder if os.path.isdir(folder) else None
+
+
+def label_path(labels, image):
+    return os.path.join(labels, os.path.splitext(os.path.basename(image))[0] + '.txt')
+
+
+def read_boxes(path, H, W):
+    """(xyxy boxes, cls) of a YOLO detection label file (`cls cx cy w h`, normalized)."""
+    boxes, cls = [], []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                vals = line.split()
+                if len(vals) != 5:
+                    continue
+                cx, cy, w, h = (float(v) for v in vals[1:])
+                boxes.append([(cx - w / 2) * W, (cy - h / 2) * H, (cx + w / 2) * W, (cy + h / 2) * H])
+                cls.append(int(float(vals[0])))
+    return np.array(boxes, dtype=float).reshape(-1, 4), np.array(cls, dtype=int)
+
+
+def result_boxes(r):
+    return r.boxes.xyxy.cpu().numpy(), r.boxes.cls.cpu().numpy().astype(int)
+
+
+def box_f1(boxes, cls, ref_boxes, ref_cls):
+    """F1 of `boxes` against `ref_boxes`, greedily matched by class at IoU >= 0.5."""
+    if len(boxes) == 0 and len(ref_boxes) == 0:
+        return 1.0
+    used, matched = set(), 0
+    for b, c in zip(boxes, cls):
+        best, best_iou = None, 0.5
+        for j, (rb, rc) in enumerate(zip(ref_boxes, ref_cls)):
+            if j not in used and rc == c:
+                iou = pipeline.box_iou(b, rb)
+                if iou >= best_iou:
+                    best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return 2 * matched / (len(boxes) + len(ref_boxes))
+
+
+def union_mask(r, ids):
+    H, W = r.orig_shape
+    mask = Image.new('L', (W, H), 0)
+    if r.masks is not None:
+        draw = ImageDraw.Draw(mask)
+        for poly, c in zip(r.masks.xy, r.boxes.cls.cpu().numpy().astype(int)):
+            if c in ids and len(poly) >= 3:
+                draw.polygon([(float(x), float(y)) for x, y in poly], fill=1)
+    return np.array(mask, dtype=bool)
+
+
+def mask_iou(masks, ref_masks):
+    """Mean IoU over (leaf, lesion) mask pairs; a pair that is empty on both sides counts as 1."""
+    ious = []
+    for a, b in zip(masks, ref_masks):
+        union = (a | b).sum()
+        ious.append((a & b).sum() / union if union else 1.0)
+    return float(np.mean(ious))
+
+
+def result_leaf_lesion(r):
+    return [union_mask(r, ids) for ids in (pipeline.SEG_LEAF_IDS, list(pipeline.PAIR_LESION_ID.values()))]
+
+
+def scorer(kind, images, labels):
+    """score(results, ref_results) -> per-image scores, against labels when available, else against `ref_results`."""
+    if labels is None:
+        if kind == 'detection':
+            return lambda results, refs: [box_f1(*result_boxes(r), *result_boxes(ref)) for r, ref in zip(results, refs)]
+        return lambda results, refs: [mask_iou(result_leaf_lesion(r), result_leaf_lesion(ref)) for r, ref in zip(results, refs)]
+    sizes = []
+    for path in images:
+        with Image.open(path) as im:
+            sizes.append((im.height, im.width))
+    if kind == 'detection':
+        truth = [read_boxes(label_path(labels, p), H, W) for p, (H, W) in zip(images, sizes)]
+        return lambda results, _: [box_f1(*result_boxes(r), *gt) for r, gt in zip(results, truth)]
+    from evaluate import leaf_lesion, read_gt
+    truth = [leaf_lesion(*read_gt(label_path(labels, p), H, W), H, W) for p, (H, W) in zip(images, sizes)]
+    return lambda results, _: [mask_iou(result_leaf_lesion(r), gt) for r, gt in zip(results, truth)]
+
+
+def run(model, images, params):
+    """(results, per-image latency in ms) of one predict call per image on the CPU."""
+    model.predict(source=images[0], device='cpu', verbose=False, **params)  # warm-up
+    results, times = [], []
+    for path in images:
+        t0 = time.perf_counter()
+        res = model.predict(source=path, device='cpu', verbose=False, **params)
+        times.append((time.perf_counter() - t0) * 1000.0)
+        results.append(res[0])
+    return results, times
+
+
+def candidate_params(weights, sizes, base):
+    """[(name, predict arguments)]: the named profiles, then imgsz variants of `base`."""
+    out = [(name, profiles.resolve(name, weights)) for name in profiles.PROFILES]
+    out += [(f'{base}@{size}', dict(profiles.resolve(base, weights), imgsz=size)) for size in sorted(sizes)]
+    return out
+
+
+def calibrate(weights, kind, images, sizes, base, target_p95, labels):
+    """(chosen, candidates, met, metric) for one model; `metric` is 'accuracy' (labels) or 'agreement'."""
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    metric = 'accuracy' if labels else 'agreement'
+    score = scorer(kind, images, labels)
+    runs = {}
+    candidates = []
+    for name, params in candidate_params(weights, sizes, base):
+        results, times = run(model, images, params)
+        runs[name] = results
+        candidates.append({'name': name, 'params': params, 'p50_ms': round(float(np.percentile(times, 50)), 1),
+                           'p95_ms': round(float(np.percentile(times, 95)), 1)})
+    for c in candidates:
+        c[metric] = round(float(np.mean(score(runs[c['name']], runs['accurate']))), 4)
+        print(f"  {c['name']:<16} imgsz {c['params']['imgsz']:>4}: p50 {c['p50_ms']:>7.1f} ms  "
+              f"p95 {c['p95_ms']:>7.1f} ms  {metric} {c[metric]:.3f}")
+    meeting = [c for c in candidates if c['p95_ms'] <= target_p95]
+    chosen = (max(meeting, key=lambda c: (c[metric], -c['p95_ms'])) if meeting
+              else min(candidates, key=lambda c: c['p95_ms']))
+    return chosen, candidates, bool(meeting), metric
+
+
+def runtime_info():
+    info = {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor()}
+    try:
+        import torch
+        import ultralytics
+        info.update({'torch': torch.__version__, 'ultralytics': ultralytics.__version__, 'threads': torch.get_num_threads()})
+    except Exception:
+        pass
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick each model's 'auto' inference profile for a target p95 latency.")
+    parser.add_argument('--target-p95', type=float, required=True, help='target p95 latency per image, in ms')
+    parser.add_argument('--models', nargs='+', default=None, help='weights to calibrate (default: all registered models)')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[], help='extra imgsz variants of --base to try')
+    parser.add_argument('--base', default=profiles.DEFAULT, choices=sorted(profiles.PROFILES),
+                        help='profile whose other arguments (conf, iou, max_det, half) the --sizes variants keep')
+    parser.add_argument('--images', default=None, help='image folder (default: the test split of each model kind)')
+    parser.add_argument('--limit', type=int, default=20, help='images per model')
+    parser.add_argument('--dry-run', action='store_true', help='report only, do not write profiles.json')
+    args = parser.parse_args()
+
+    models = [(kind_of(w), w) for w in args.models] if args.models else registered_models()
+    if not models:
+        print(f'No models found under {MODELS_DIR}')
+        return 2
+    runtime = runtime_info()
+    for kind, weights in models:
+        folder = args.images or DEFAULT_IMAGES[kind]
+        images = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS)) \
+            if os.path.isdir(folder) else []
+        images = images[:args.limit]
+        if not images:
+            print(f'[{weights}] no images in {folder}; skipped')
+            continue
+        labels = labels_dir(folder)
+        print(f'[{kind}] {weights}: {len(images)} images, target p95 {args.target_p95:g} ms, '
+              + (f'scored against {labels}' if labels else 'no labels: scored by agreement with the accurate profile'))
+        chosen, candidates, met, metric = calibrate(weights, kind, images, args.sizes, args.base, args.target_p95, labels)
+        note = '' if met else ' (no candidate meets the target; using the fastest)'
+        print(f"  -> auto: {chosen['name']} (imgsz {chosen['params']['imgsz']}), p95 {chosen['p95_ms']} ms{note}")
+        if not args.dry_run:
+            profiles.save_model(weights, {'auto': chosen['params'], 'calibration': {
+                'chosen': chosen['name'], 'target_p95_ms': args.target_p95, 'meets_target': met, 'device': 'cpu',
+                'images': len(images), 'metric': metric, 'labels': labels, 'candidates': candidates,
+                'runtime': runtime, 'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S')}})
+    if not args.dry_run:
+        print(f'\nWritten to {profiles.PROFILES_FILE}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+"""Measure process cold start with and without the prepared-model cache.
+
+For every registered model (or --models) this starts fresh Python
+processes that import Ultralytics, load the model and run one prediction
+on a blank image, either from the raw weights (`YOLO(weights)`, as before)
+or through model_cache.load_model. The cache is filled before timing, so
+`prepared` measures a worker that starts after the first one. Each mode
+runs --runs times; the medians are reported and written as JSON.
+
+Usage (from the 'Plant Pathology 2021' folder):
+  python website/tools/cold_start.py
+  python website/tools/cold_start.py --models website/models/segmentation/nano/best.pt --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+sys.path.insert(0, os.path.join(ROOT, 'website', 'tools'))
+
+OUT_FILE = os.path.join(ROOT, 'results', 'cold_start.json')
+MODES = ('raw', 'prepared')
+
+
+def child(mode, weights, imgsz):
+    """Runs in the fresh process: prints one JSON line of timings in ms."""
+    t0 = time.perf_counter()
+    import numpy as np
+    from ultralytics import YOLO
+    t_import = time.perf_counter()
+    if mode == 'raw':
+        model = YOLO(weights)
+    else:
+        import model_cache
+        model, _ = model_cache.load_model(weights)
+    t_load = time.perf_counter()
+    model.predict(source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, device='cpu', verbose=False)
+    t_first = time.perf_counter()
+
+    def ms(a, b):
+        return round((b - a) * 1000.0, 1)
+
+    print(json.dumps({'import_ms': ms(t0, t_import), 'load_ms': ms(t_import, t_load),
+                      'first_predict_ms': ms(t_load, t_first), 'total_ms': ms(t0, t_first)}))
+
+
+def measure(mode, weights, imgsz):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, weights, '--imgsz', str(imgsz)],
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def median(rows, key):
+    values = sorted(r[key] for r in rows)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time per model, raw weights vs prepared-model cache.')
+    parser.add_argument('--models', nargs='+', default=None, help='weights (default: all registered models)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--out', default=OUT_FILE)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'WEIGHTS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.imgsz)
+        return 0
+
+    import model_cache
+    from calibrate import registered_models
+    models = args.models or [w for _, w in registered_models()]
+    if not models:
+        print('No models found')
+        return 2
+    report = {'runtime': model_cache.runtime_tag(), 'runs': args.runs, 'imgsz': args.imgsz, 'models': {}}
+    print(f"{'model':<60}{'mode':>10}{'load ms':>10}{'1st pred':>10}{'total ms':>10}")
+    for weights in models:
+        model_cache.load_model(weights)  # fill the cache outside the measurement
+        entry = {}
+        for mode in MODES:
+            rows = [measure(mode, weights, args.imgsz) for _ in range(args.runs)]
+            entry[mode] = {key: median(rows, key) for key in rows[0]}
+            entry[mode]['runs'] = rows
+            m = entry[mode]
+            print(f"{os.path.relpath(weights, ROOT):<60}{mode:>10}{m['load_ms']:>10.0f}{m['first_predict_ms']:>10.0f}{m['total_ms']:>10.0f}")
+        entry['speedup_total'] = round(entry['raw']['total_ms'] / entry['prepared']['total_ms'], 2)
+        report['models'][os.path.relpath(weights, ROOT)] = entry
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nWritten to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
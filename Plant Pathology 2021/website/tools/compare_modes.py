@@ -0,0 +1,163 @@
+"""Compare per-crop segmentation with the full-image and tiled single-pass modes.
+
+For every image of a labelled YOLO-seg split, leaves are detected once and
+then segmented in each mode the way the website does it
+(pipeline.segment per crop, or pipeline.segment_instances +
+assign_instances). Per detected leaf, the predicted leaf/lesion masks are
+compared with the ground truth inside the same crop region (leaf IoU,
+lesion IoU, severity error, see evaluate.batch_metrics), and the
+segmentation wall time and number of model calls are recorded per image.
+
+Inference runs sequentially in this process so the timings are comparable;
+each model is warmed up on the first image before timing starts. Results
+go to results/evaluation/compare_modes/: one CSV of per-leaf rows per mode
+and summary.json with accuracy and latency (mean, p50, p95) per mode.
+
+Usage (from the 'Plant Pathology 2021' folder):
+  python website/tools/compare_modes.py --det website/models/object_detection/medium/best.pt \\
+      --seg website/models/segmentation/medium/best.pt
+  python website/tools/compare_modes.py --det det.pt --seg seg.pt --modes crop tiled --tiles 3 --limit 50
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+sys.path.insert(0, os.path.join(ROOT, 'website', 'tools'))
+import pipeline
+from evaluate import DEFAULT_SPLIT, IMAGE_EXTS, aggregate, batch_metrics, fmt_iou, leaf_lesion, read_gt
+
+OUT_DIR = os.path.join(ROOT, 'results', 'evaluation', 'compare_modes')
+
+
+def resize_mask(mask, W, H):
+    if mask.shape == (H, W):
+        return mask
+    return np.array(Image.fromarray(mask.astype('uint8') * 255).resize((W, H))).astype(bool)
+
+
+def segment_leaves(mode, seg, img, boxes, pad, conf, imgsz, tiles):
+    """{box index: (leaf, lesion) at crop size} for one mode, plus the number of model calls."""
+    W, H = img.size
+    regions = [pipeline.crop_region(b, pad, W, H) for b in boxes]
+    out = {}
+    if mode == 'crop':
+        for i, region in enumerate(regions):
+            s = pipeline.segment(seg, img.crop(region), conf=conf, imgsz=imgsz)
+            combined = pipeline.combine_masks(s['masks'], s['cls']) if s is not None and len(s['cls']) else None
+            if combined is not None:
+                w, h = region[2] - region[0], region[3] - region[1]
+                out[i] = (resize_mask(combined[0], w, h), resize_mask(combined[1], w, h))
+        return out, len(regions)
+    instances = pipeline.segment_instances(seg, img, conf=conf, imgsz=imgsz, tiles=tiles if mode == 'tiled' else 1)
+    for i, insts in pipeline.assign_instances(instances, boxes).items():
+        masks, cls, _ = pipeline.instances_in_region(insts, regions[i])
+        combined = pipeline.combine_masks(masks, cls) if len(cls) else None
+        if combined is not None:
+            out[i] = combined
+    return out, 1
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 4) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare crop, full-image and tiled segmentation on accuracy and latency.')
+    parser.add_argument('--split', default=DEFAULT_SPLIT, help='YOLO-seg split folder with images/ and labels/')
+    parser.add_argument('--det', required=True, help='detection weights')
+    parser.add_argument('--seg', required=True, help='segmentation weights')
+    parser.add_argument('--modes', nargs='+', default=list(pipeline.SEG_MODES), choices=pipeline.SEG_MODES)
+    parser.add_argument('--tiles', type=int, default=2, help='grid size of the tiled mode')
+    parser.add_argument('--pad', type=int, default=10)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--limit', type=int, default=0, help='only the first N images')
+    parser.add_argument('--out', default=OUT_DIR)
+    args = parser.parse_args()
+
+    img_dir, gt_dir = os.path.join(args.split, 'images'), os.path.join(args.split, 'labels')
+    if not os.path.isdir(img_dir):
+        print(f'Images folder not found: {img_dir}')
+        return 2
+    images = [os.path.join(img_dir, f) for f in sorted(os.listdir(img_dir)) if f.lower().endswith(IMAGE_EXTS)]
+    if args.limit:
+        images = images[:args.limit]
+    if not images:
+        print(f'No images in {img_dir}')
+        return 2
+
+    from ultralytics import YOLO
+    det, seg = YOLO(args.det), YOLO(args.seg)
+    warm = Image.open(images[0]).convert('RGB')
+    seg.predict(source=warm, conf=args.conf, imgsz=args.imgsz, verbose=False)
+
+    rows = {m: [] for m in args.modes}
+    timings = {m: [] for m in args.modes}
+    calls = {m: 0 for m in args.modes}
+    det_times = []
+    for n, img_path in enumerate(images, 1):
+        img = Image.open(img_path).convert('RGB')
+        W, H = img.size
+        t0 = time.perf_counter()
+        d = pipeline.detect(det, img, conf=args.conf, imgsz=args.imgsz)
+        det_times.append(time.perf_counter() - t0)
+        boxes = d['boxes'] if d is not None else np.zeros((0, 4))
+        gt_leaf, gt_lesion = leaf_lesion(*read_gt(os.path.join(gt_dir, os.path.splitext(os.path.basename(img_path))[0] + '.txt'), H, W), H, W)
+        for mode in args.modes:
+            t0 = time.perf_counter()
+            leaves, n_calls = segment_leaves(mode, seg, img, boxes, args.pad, args.conf, args.imgsz, args.tiles)
+            timings[mode].append(time.perf_counter() - t0)
+            calls[mode] += n_calls
+            for i, box in enumerate(boxes):
+                x1, y1, x2, y2 = pipeline.crop_region(box, args.pad, W, H)
+                empty = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+                pr_leaf, pr_lesion = leaves.get(i, (empty, empty))
+                m = batch_metrics(gt_leaf[None, y1:y2, x1:x2], gt_lesion[None, y1:y2, x1:x2],
+                                  pr_leaf[None], (pr_lesion & pr_leaf)[None])
+                row = {'image': os.path.basename(img_path), 'leaf': i, 'found': i in leaves}
+                row.update({k: float(v[0]) for k, v in m.items()})
+                rows[mode].append(row)
+        print(f'  {n}/{len(images)} ' + ' '.join(f'{m}={timings[m][-1] * 1000:.0f}ms' for m in args.modes))
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = {'split': args.split, 'det': args.det, 'seg': args.seg, 'tiles': args.tiles, 'images': len(images),
+               'detection_s': {'mean': round(float(np.mean(det_times)), 4), 'p95': percentile(det_times, 95)}, 'modes': {}}
+    for mode in args.modes:
+        with open(os.path.join(args.out, f'compare_{mode}.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['image', 'leaf', 'found', 'leaf_iou', 'lesion_iou', 'gt_severity',
+                                                   'pred_severity', 'severity_error'])
+            writer.writeheader()
+            writer.writerows(rows[mode])
+        summary['modes'][mode] = {
+            'accuracy': aggregate(rows[mode]),
+            'leaves_found': sum(r['found'] for r in rows[mode]),
+            'leaves': len(rows[mode]),
+            'seg_calls': calls[mode],
+            'seg_s': {'mean': round(float(np.mean(timings[mode])), 4), 'p50': percentile(timings[mode], 50),
+                      'p95': percentile(timings[mode], 95)},
+        }
+    with open(os.path.join(args.out, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'mode':<7}{'leaves':>8}{'found':>7}{'leafIoU':>9}{'lesionIoU':>10}{'sevMAE':>8}{'calls':>7}{'mean ms':>9}{'p95 ms':>8}")
+    for mode, res in summary['modes'].items():
+        acc, t = res['accuracy'], res['seg_s']
+        if not acc.get('images'):
+            print(f'{mode:<7}{0:>8}')
+            continue
+        print(f"{mode:<7}{res['leaves']:>8}{res['leaves_found']:>7}{fmt_iou(acc['leaf_iou']):>9}{fmt_iou(acc['lesion_iou']):>10}"
+              f"{acc['severity_mae']:>8.2f}{res['seg_calls']:>7}{t['mean'] * 1000:>9.0f}{t['p95'] * 1000:>8.0f}")
+    print(f'\nWritten to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
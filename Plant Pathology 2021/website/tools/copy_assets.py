@@ -1,40 +1,51 @@
 import os
+import sys
 import glob
-import random
-import shutil
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+from dataset_manifest import Manifest
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+import thumbnails
+from sync import sync
 
-def copy_samples():
+MANIFEST_DB = os.path.join(ROOT, 'dataset', 'manifest.sqlite')
+DST_SAMPLES = os.path.join(ROOT, 'website', 'static', 'dataset_samples')
+DST_GRAPHS = os.path.join(ROOT, 'website', 'static', 'graphs')
+
+def sample_pairs():
     src_base = os.path.join(ROOT, 'dataset', 'object_detection')
-    dst_base = os.path.join(ROOT, 'website', 'static', 'dataset_samples')
-    os.makedirs(dst_base, exist_ok=True)
+    manifest = Manifest(MANIFEST_DB)
+    pairs = []
     for subset in ('train', 'valid', 'test'):
         src = os.path.join(src_base, subset, 'images')
-        dst = os.path.join(dst_base, subset)
-        os.makedirs(dst, exist_ok=True)
+        dst = os.path.join(DST_SAMPLES, subset)
         if os.path.exists(src):
-            files = [f for f in os.listdir(src) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+            # the manifest only re-reads images that changed since the last run
+            manifest.refresh(src)
+            rows = [r for r in manifest.query(src) if r['name'].lower().endswith(('.jpg', '.jpeg', '.png'))]
             # pick up to 6 examples
-            pick = files[:6]
-            for f in pick:
-                shutil.copy(os.path.join(src, f), os.path.join(dst, f))
+            pick = rows[:6]
+            pairs += [(r['path'], os.path.join(dst, r['name'])) for r in pick]
+            # thumbnails are keyed by content hash, so unchanged samples are skipped
+            thumbnails.ensure_thumbnails([(r['path'], r['sha1']) for r in pick],
+                                         out_dir=os.path.join(ROOT, 'website', thumbnails.THUMB_DIR), processes=True)
+    return pairs
 
-def copy_graphs():
-    dst = os.path.join(ROOT, 'website', 'static', 'graphs')
-    os.makedirs(dst, exist_ok=True)
-    # object_detection graphs
-    od_src = os.path.join(ROOT, 'results', 'object_detection', 'graph')
-    if os.path.exists(od_src):
-        for p in glob.glob(os.path.join(od_src, '*.png')):
-            shutil.copy(p, os.path.join(dst, os.path.basename(p)))
-    # mask_lesi_and_leaf graphs
-    seg_src = os.path.join(ROOT, 'results', 'mask_lesi_and_leaf', 'graph')
-    if os.path.exists(seg_src):
-        for p in glob.glob(os.path.join(seg_src, '*.png')):
-            shutil.copy(p, os.path.join(dst, os.path.basename(p)))
+def graph_pairs():
+    pairs = []
+    # object_detection graphs, then mask_lesi_and_leaf graphs
+    for src in (os.path.join(ROOT, 'results', 'object_detection', 'graph'),
+                os.path.join(ROOT, 'results', 'mask_lesi_and_leaf', 'graph')):
+        if os.path.exists(src):
+            for p in sorted(glob.glob(os.path.join(src, '*.png'))):
+                pairs.append((p, os.path.join(DST_GRAPHS, os.path.basename(p))))
+    return pairs
 
 if __name__ == '__main__':
-    copy_samples()
-    copy_graphs()
-    print('Assets copied to website/static (dataset_samples, graphs)')
+    stats = sync(sample_pairs() + graph_pairs(), prune_roots=(DST_SAMPLES, DST_GRAPHS))
+    # the website's gallery only queries the manifest, so index the synced samples here
+    if os.path.exists(DST_SAMPLES):
+        Manifest(MANIFEST_DB).refresh(DST_SAMPLES)
+    print(', '.join(f'{k}: {v}' for k, v in stats.items()))
+    print('Assets synced to website/static (dataset_samples, graphs)')
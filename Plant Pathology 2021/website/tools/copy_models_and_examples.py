@@ -1,19 +1,24 @@
-"""Utility to copy models and example prediction images into website folders.
+"""Utility to sync models and example prediction images into website folders.
 
-This script copies:
+This script syncs:
 1) Object detection models from results/object_detection/training/{nano,small,medium}/weights/best.pt
    -> website/models/object_detection/{nano,best.pt}
 2) Segmentation models from results/mask_lesi_and_leaf/training/{nano,small,medium}/weights/best.pt
    -> website/models/segmentation/{nano,best.pt}
-3) Example prediction images: take 3 random images per {nano,small,medium} from
+3) Example prediction images: 3 images per {nano,small,medium}, picked deterministically, from
    Plant Pathology 2021/results/object_detection/predict/{nano,small,medium}/ -> website/static/examples/object_detection/{size}/
-4) Copy severity example overlays if available (from results/severity_estimation/*)
+4) Up to 12 severity example overlays from results/severity_estimation/* (if available)
+
+Only files whose source changed since the last run are copied (see sync.py);
+examples that are no longer selected are removed from the website folders.
 
 Run this script from repository root (python website/tools/copy_models_and_examples.py)
+Options: --checksum (compare SHA-1 when mtimes differ), --dry-run, --workers N
 """
+import argparse
 import os
-import shutil
-import random
+
+from sync import pick_examples, sync
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 # The repository has a top-level folder named 'Plant Pathology 2021' under ROOT.
@@ -33,65 +38,67 @@ DST_MODELS_SEG = os.path.join(ROOT, 'website', 'models', 'segmentation')
 DST_EXAMPLES_OD = os.path.join(ROOT, 'website', 'static', 'examples', 'object_detection')
 DST_EXAMPLES_SEV = os.path.join(ROOT, 'website', 'static', 'examples', 'severity')
 
-os.makedirs(DST_MODELS_OBJ, exist_ok=True)
-os.makedirs(DST_MODELS_SEG, exist_ok=True)
-os.makedirs(DST_EXAMPLES_OD, exist_ok=True)
-os.makedirs(DST_EXAMPLES_SEV, exist_ok=True)
-
 sizes = ['nano', 'small', 'medium']
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+OD_EXAMPLES = 3
+SEV_EXAMPLES = 12
+
 
-# 1) copy models (object detection)
-for s in sizes:
-    src_weights = os.path.join(OBJ_MODEL_SRC, s, 'weights', 'best.pt')
-    if os.path.exists(src_weights):
-        dst_dir = os.path.join(DST_MODELS_OBJ, s)
-        os.makedirs(dst_dir, exist_ok=True)
-        dst_path = os.path.join(dst_dir, 'best.pt')
-        shutil.copy2(src_weights, dst_path)
-        print(f'Copied OD model: {src_weights} -> {dst_path}')
-    else:
-        print(f'OD model not found for {s}: {src_weights}')
-
-# 2) copy segmentation models
-for s in sizes:
-    src_weights = os.path.join(SEG_MODEL_SRC, s, 'weights', 'best.pt')
-    if os.path.exists(src_weights):
-        dst_dir = os.path.join(DST_MODELS_SEG, s)
-        os.makedirs(dst_dir, exist_ok=True)
-        dst_path = os.path.join(dst_dir, 'best.pt')
-        shutil.copy2(src_weights, dst_path)
-        print(f'Copied SEG model: {src_weights} -> {dst_path}')
-    else:
-        print(f'SEG model not found for {s}: {src_weights}')
-
-# 3) copy 3 random prediction images per size
-for s in sizes:
-    src_pred_dir = os.path.join(PREDICT_SRC, s)
-    dst_dir = os.path.join(DST_EXAMPLES_OD, s)
-    os.makedirs(dst_dir, exist_ok=True)
-    if os.path.exists(src_pred_dir):
-        imgs = [f for f in os.listdir(src_pred_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+def model_pairs(src_base, dst_base, label):
+    pairs = []
+    for s in sizes:
+        src_weights = os.path.join(src_base, s, 'weights', 'best.pt')
+        if os.path.exists(src_weights):
+            pairs.append((src_weights, os.path.join(dst_base, s, 'best.pt')))
+        else:
+            print(f'{label} model not found for {s}: {src_weights}')
+    return pairs
+
+
+def example_pairs():
+    pairs = []
+    for s in sizes:
+        src_pred_dir = os.path.join(PREDICT_SRC, s)
+        if not os.path.exists(src_pred_dir):
+            print(f'Prediction folder not found for {s}: {src_pred_dir}')
+            continue
+        imgs = [f for f in os.listdir(src_pred_dir) if f.lower().endswith(IMAGE_EXTS)]
         if not imgs:
             print(f'No prediction images found for {s} in {src_pred_dir}')
             continue
-        sel = random.sample(imgs, min(3, len(imgs)))
-        for im in sel:
-            shutil.copy2(os.path.join(src_pred_dir, im), os.path.join(dst_dir, im))
-        print(f'Copied {len(sel)} example images for {s} to {dst_dir}')
-    else:
-        print(f'Prediction folder not found for {s}: {src_pred_dir}')
-
-# 4) copy severity overlays (if any)
-if os.path.exists(SEV_SRC):
-    # copy all jpg/png from the severity results folder recursively
+        for im in pick_examples(imgs, OD_EXAMPLES, seed=s):
+            pairs.append((os.path.join(src_pred_dir, im), os.path.join(DST_EXAMPLES_OD, s, im)))
+    return pairs
+
+
+def severity_pairs():
+    if not os.path.exists(SEV_SRC):
+        print('No severity_estimation results folder found; skipping severity copy')
+        return []
+    found = {}
     for root, _, files in os.walk(SEV_SRC):
         for f in files:
-            if f.lower().endswith(('.jpg', '.jpeg', '.png')):
-                srcf = os.path.join(root, f)
-                dstf = os.path.join(DST_EXAMPLES_SEV, f)
-                shutil.copy2(srcf, dstf)
-    print('Copied severity example images if any.')
-else:
-    print('No severity_estimation results folder found; skipping severity copy')
-
-print('Done.')
+            if f.lower().endswith(IMAGE_EXTS):
+                found.setdefault(f, os.path.join(root, f))  # targets are flat: first one wins
+    return [(found[f], os.path.join(DST_EXAMPLES_SEV, f)) for f in pick_examples(found, SEV_EXAMPLES, seed='severity')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync models and example images into the website folders.')
+    parser.add_argument('--checksum', action='store_true', help='compare SHA-1 when size matches but mtime differs')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    pairs = model_pairs(OBJ_MODEL_SRC, DST_MODELS_OBJ, 'OD') + model_pairs(SEG_MODEL_SRC, DST_MODELS_SEG, 'SEG')
+    pairs += example_pairs() + severity_pairs()
+    # models are never pruned: a missing training run should not delete a deployed model
+    stats = sync(pairs, workers=args.workers, checksum=args.checksum, dry_run=args.dry_run,
+                 prune_roots=(DST_EXAMPLES_OD, DST_EXAMPLES_SEV))
+    print(', '.join(f'{k}: {v}' for k, v in stats.items()))
+    print('Done.')
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,309 @@
+"""Evaluate leaf/lesion segmentation and severity against a labelled YOLO-seg split.
+
+For every model size it runs inference over `<split>/images` in a process
+pool (each worker loads the model once and predicts in batches), then
+compares against the polygons in `<split>/labels`:
+
+- leaf IoU and lesion IoU of the combined masks (pipeline.combine_masks),
+- severity error: predicted vs ground-truth lesion_px / leaf_px * 100.
+
+Raw predictions (packed instance masks, classes, scores) are cached under
+`results/evaluation/cache/<model sha1>/<settings>/<image sha1>.npz`, so
+metrics can be recomputed, or new metrics added, without running the
+models again. Metrics are computed on stacked (batch, H, W) arrays per
+image size. Results go to results/evaluation/: one CSV of per-image rows
+per model size and summary.json with per-class / per-size aggregates.
+
+With `--det`, the full severity pipeline is evaluated instead: leaves are
+detected on the image, each crop is segmented, and the crop masks are
+pasted back before comparing with the full-image ground truth.
+
+Usage (from the 'Plant Pathology 2021' folder):
+  python website/tools/evaluate.py
+  python website/tools/evaluate.py --models nano small --split dataset/mask_lesi_and_leaf/test --workers 2
+  python website/tools/evaluate.py --det website/models/object_detection/medium/best.pt
+  python website/tools/evaluate.py --metrics-only      # recompute from the cache, no inference
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'website'))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+import pipeline
+from dataset_manifest import file_sha1, infer_labels
+
+SIZES = ['nano', 'small', 'medium']
+SEG_MODELS = os.path.join(ROOT, 'website', 'models', 'segmentation')
+DEFAULT_SPLIT = os.path.join(ROOT, 'dataset', 'mask_lesi_and_leaf', 'test')
+OUT_DIR = os.path.join(ROOT, 'results', 'evaluation')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# ---------------------------------------------------------------- ground truth
+
+def polygons_to_masks(polys, H, W):
+    """Rasterize a list of (n, 2) pixel polygons into a (N, H, W) bool array."""
+    masks = np.zeros((len(polys), H, W), dtype=np.uint8)
+    for i, poly in enumerate(polys):
+        if len(poly) >= 3:
+            cv2.fillPoly(masks[i], [np.round(poly).astype(np.int32)], 1)
+    return masks.astype(bool)
+
+
+def read_gt(label_path, H, W):
+    """(masks, cls) from a YOLO-seg label file: `cls x1 y1 x2 y2 ...` normalized."""
+    polys, cls = [], []
+    if os.path.exists(label_path):
+        with open(label_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                vals = line.split()
+                if len(vals) < 7:
+                    continue
+                cls.append(int(float(vals[0])))
+                polys.append(np.array(vals[1:], dtype=np.float64).reshape(-1, 2) * [W, H])
+    return polygons_to_masks(polys, H, W), np.array(cls, dtype=int)
+
+
+def leaf_lesion(masks, cls, H, W):
+    combined = pipeline.combine_masks(masks, cls) if len(cls) else None
+    if combined is None:
+        empty = np.zeros((H, W), dtype=bool)
+        return empty, empty
+    leaf, lesion = combined
+    return leaf, lesion & leaf
+
+
+# ----------------------------------------------------------------- prediction
+
+def cache_path(cache_dir, image_sha1):
+    return os.path.join(cache_dir, image_sha1[:2], image_sha1 + '.npz')
+
+
+def save_prediction(path, masks, cls, conf, H, W):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(tmp, packed=np.packbits(masks.reshape(len(masks), H * W), axis=1), cls=cls, conf=conf,
+                        shape=np.array([len(masks), H, W]))
+    os.replace(tmp, path)
+
+
+def load_prediction(path):
+    with np.load(path) as z:
+        n, H, W = (int(v) for v in z['shape'])
+        masks = np.unpackbits(z['packed'], axis=1, count=H * W).reshape(n, H, W).astype(bool)
+        return masks, z['cls'].astype(int), z['conf']
+
+
+def result_masks(r, H, W, offset=(0, 0)):
+    """Instance masks of one Ultralytics result at original resolution (from the polygons)."""
+    if r.masks is None:
+        return np.zeros((0, H, W), dtype=bool), np.zeros(0, dtype=int), np.zeros(0)
+    polys = [p + np.asarray(offset) for p in r.masks.xy]
+    return (polygons_to_masks(polys, H, W), r.boxes.cls.cpu().numpy().astype(int),
+            r.boxes.conf.cpu().numpy())
+
+
+_MODELS = {}
+
+
+def _init_worker(seg_path, det_path):
+    from ultralytics import YOLO
+    _MODELS['seg'] = YOLO(seg_path)
+    _MODELS['det'] = YOLO(det_path) if det_path else None
+
+
+def _predict_chunk(args):
+    """Run inference for a chunk of (image_path, cache_file) and write the cache files."""
+    jobs, conf, imgsz, pad, device, batch = args
+    seg, det = _MODELS['seg'], _MODELS['det']
+    done = 0
+    if det is None:
+        for i in range(0, len(jobs), batch):
+            part = jobs[i:i + batch]
+            results = seg.predict(source=[p for p, _ in part], conf=conf, imgsz=imgsz, device=device, verbose=False)
+            for (img_path, out), r in zip(part, results):
+                H, W = r.orig_shape
+                save_prediction(out, *result_masks(r, H, W), H, W)
+                done += 1
+        return done
+    for img_path, out in jobs:
+        img = Image.open(img_path).convert('RGB')
+        W, H = img.size
+        all_masks, all_cls, all_conf = [np.zeros((0, H, W), dtype=bool)], [np.zeros(0, dtype=int)], [np.zeros(0)]
+        d = pipeline.detect(det, img_path, conf=conf, imgsz=imgsz)
+        if d is not None and len(d['boxes']):
+            crops = [pipeline.crop_region(box, pad, W, H) for box in d['boxes']]
+            # numpy sources are read as BGR by Ultralytics
+            results = seg.predict(source=[np.ascontiguousarray(np.array(img.crop(c))[:, :, ::-1]) for c in crops],
+                                  conf=conf, imgsz=imgsz, device=device, verbose=False)
+            for (x1, y1, _, _), r in zip(crops, results):
+                m, c, s = result_masks(r, H, W, offset=(x1, y1))
+                all_masks.append(m)
+                all_cls.append(c)
+                all_conf.append(s)
+        save_prediction(out, np.concatenate(all_masks), np.concatenate(all_cls), np.concatenate(all_conf), H, W)
+        done += 1
+    return done
+
+
+def run_inference(todo, seg_path, det_path, conf, imgsz, pad, device, workers, batch):
+    if not todo:
+        return
+    workers = max(1, min(workers, len(todo)))
+    chunk = max(batch, len(todo) // (workers * 4) or 1)
+    chunks = [(todo[i:i + chunk], conf, imgsz, pad, device, batch) for i in range(0, len(todo), chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(seg_path, det_path)) as pool:
+        done = 0
+        for n in pool.map(_predict_chunk, chunks):
+            done += n
+            print(f'  predicted {done}/{len(todo)}')
+
+
+# -------------------------------------------------------------------- metrics
+
+def batch_metrics(gt_leaf, gt_lesion, pr_leaf, pr_lesion):
+    """Per-image metrics for stacked (B, H, W) bool arrays, as a dict of (B,) arrays."""
+    ax = (1, 2)
+    gl, gs = gt_leaf.sum(ax), gt_lesion.sum(ax)
+    pl, ps = pr_leaf.sum(ax), pr_lesion.sum(ax)
+    leaf_inter, lesion_inter = (gt_leaf & pr_leaf).sum(ax), (gt_lesion & pr_lesion).sum(ax)
+    leaf_union, lesion_union = gl + pl - leaf_inter, gs + ps - lesion_inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # IoU is undefined (nan) when both masks are empty, e.g. lesions on a healthy leaf
+        leaf_iou = np.where(leaf_union > 0, leaf_inter / leaf_union, np.nan)
+        lesion_iou = np.where(lesion_union > 0, lesion_inter / lesion_union, np.nan)
+        gt_sev = np.where(gl > 0, gs / gl * 100.0, 0.0)
+        pr_sev = np.where(pl > 0, ps / pl * 100.0, 0.0)
+    return {'leaf_iou': leaf_iou, 'lesion_iou': lesion_iou, 'gt_severity': gt_sev, 'pred_severity': pr_sev,
+            'severity_error': pr_sev - gt_sev}
+
+
+def aggregate(rows):
+    """Summary over a list of per-image metric dicts."""
+    if not rows:
+        return {'images': 0}
+    err = np.array([r['severity_error'] for r in rows])
+    leaf_iou = np.array([r['leaf_iou'] for r in rows], dtype=float)
+    lesion_iou = np.array([r['lesion_iou'] for r in rows], dtype=float)
+
+    def mean(a):
+        return None if np.all(np.isnan(a)) else round(float(np.nanmean(a)), 4)
+
+    return {
+        'images': len(rows),
+        'leaf_iou': mean(leaf_iou),
+        'lesion_iou': mean(lesion_iou),
+        'severity_mae': round(float(np.abs(err).mean()), 3),
+        'severity_rmse': round(float(np.sqrt((err ** 2).mean())), 3),
+        'severity_bias': round(float(err.mean()), 3),
+    }
+
+
+def fmt_iou(v):
+    return '-' if v is None else f'{v:.3f}'
+
+
+def evaluate_size(images, gt_dir, cache_dir, batch):
+    """Per-image metric rows for one model, from cached predictions only."""
+    rows = []
+    by_shape = {}
+    for img_path, sha1 in images:
+        pred = cache_path(cache_dir, sha1)
+        if not os.path.exists(pred):
+            continue
+        with Image.open(img_path) as im:
+            W, H = im.size
+        by_shape.setdefault((H, W), []).append((img_path, pred))
+    for (H, W), items in by_shape.items():
+        for i in range(0, len(items), batch):
+            part = items[i:i + batch]
+            gt = [leaf_lesion(*read_gt(os.path.join(gt_dir, os.path.splitext(os.path.basename(p))[0] + '.txt'), H, W), H, W)
+                  for p, _ in part]
+            pr = [leaf_lesion(*load_prediction(c)[:2], H, W) for _, c in part]
+            m = batch_metrics(np.stack([g[0] for g in gt]), np.stack([g[1] for g in gt]),
+                              np.stack([p[0] for p in pr]), np.stack([p[1] for p in pr]))
+            for j, (img_path, _) in enumerate(part):
+                name = os.path.basename(img_path)
+                row = {'image': name, 'class': (infer_labels(name) or ['unknown'])[0]}
+                row.update({k: float(v[j]) for k, v in m.items()})
+                rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate segmentation IoU and severity error per class and model size.')
+    parser.add_argument('--split', default=DEFAULT_SPLIT, help='YOLO-seg split folder with images/ and labels/')
+    parser.add_argument('--models', nargs='+', default=SIZES,
+                        help='model sizes under website/models/segmentation, or name=path.pt')
+    parser.add_argument('--det', default=None, help='detection weights: evaluate detect -> crop -> segment')
+    parser.add_argument('--pad', type=int, default=10)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--workers', type=int, default=2, help='inference processes (each loads the model)')
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--metrics-only', action='store_true', help='use cached predictions only')
+    parser.add_argument('--out', default=OUT_DIR)
+    args = parser.parse_args()
+
+    img_dir, gt_dir = os.path.join(args.split, 'images'), os.path.join(args.split, 'labels')
+    if not os.path.isdir(img_dir):
+        print(f'Images folder not found: {img_dir}')
+        return 2
+    images = [os.path.join(img_dir, f) for f in sorted(os.listdir(img_dir)) if f.lower().endswith(IMAGE_EXTS)]
+    images = [(p, file_sha1(p)) for p in images]
+    os.makedirs(args.out, exist_ok=True)
+
+    det_tag = f'det-{file_sha1(args.det)[:12]}-pad{args.pad}' if args.det else 'seg'
+    settings = f'{det_tag}-conf{args.conf}-imgsz{args.imgsz}'
+    summary = {'split': args.split, 'settings': settings, 'models': {}}
+    for spec in args.models:
+        name, _, path = spec.partition('=')
+        path = path or os.path.join(SEG_MODELS, name, 'best.pt')
+        if not os.path.exists(path):
+            print(f'Model not found for {name}: {path}')
+            continue
+        cache_dir = os.path.join(args.out, 'cache', file_sha1(path)[:12], settings)
+        todo = [(p, cache_path(cache_dir, sha1)) for p, sha1 in images if not os.path.exists(cache_path(cache_dir, sha1))]
+        print(f'[{name}] {len(images)} images, {len(images) - len(todo)} cached, {len(todo)} to predict')
+        if todo and not args.metrics_only:
+            run_inference(todo, path, args.det, args.conf, args.imgsz, args.pad, args.device, args.workers, args.batch)
+
+        rows = evaluate_size(images, gt_dir, cache_dir, args.batch)
+        with open(os.path.join(args.out, f'eval_{name}.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['image', 'class', 'leaf_iou', 'lesion_iou', 'gt_severity',
+                                                   'pred_severity', 'severity_error'])
+            writer.writeheader()
+            writer.writerows(rows)
+        classes = sorted({r['class'] for r in rows})
+        summary['models'][name] = {
+            'weights': path,
+            'overall': aggregate(rows),
+            'per_class': {c: aggregate([r for r in rows if r['class'] == c]) for c in classes},
+        }
+
+    with open(os.path.join(args.out, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'model':<8}{'class':<22}{'images':>7}{'leafIoU':>9}{'lesionIoU':>10}{'sevMAE':>8}{'sevRMSE':>9}")
+    for name, res in summary['models'].items():
+        for cls, agg in [('all', res['overall'])] + sorted(res['per_class'].items()):
+            if not agg.get('images'):
+                continue
+            print(f"{name:<8}{cls:<22}{agg['images']:>7}{fmt_iou(agg['leaf_iou']):>9}{fmt_iou(agg['lesion_iou']):>10}"
+                  f"{agg['severity_mae']:>8.2f}{agg['severity_rmse']:>9.2f}")
+    print(f'\nWritten to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
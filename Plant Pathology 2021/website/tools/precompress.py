@@ -0,0 +1,65 @@
+"""Precompress text assets under website/static with gzip (and brotli when installed).
+
+Writes `<file>.gz` / `<file>.br` next to each CSS/JS/SVG/JSON/HTML file.
+Files whose compressed copy is newer than the source are skipped, and a
+copy is only kept if it is actually smaller. caching.py serves these to
+clients that accept the encoding. Run after copy_assets.py:
+
+    python tools/precompress.py
+"""
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+STATIC = os.path.join(ROOT, 'website', 'static')
+TEXT_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.html', '.txt', '.xml'}
+MIN_SIZE = 512  # smaller files are not worth a second request path
+
+
+def compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+def precompress(root=STATIC):
+    written = skipped = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in TEXT_EXTENSIONS:
+                continue
+            src = os.path.join(dirpath, name)
+            src_st = os.stat(src)
+            if src_st.st_size < MIN_SIZE:
+                continue
+            data = None
+            for suffix, compress in compressors():
+                dst = src + suffix
+                if os.path.exists(dst) and os.stat(dst).st_mtime_ns >= src_st.st_mtime_ns:
+                    skipped += 1
+                    continue
+                if data is None:
+                    with open(src, 'rb') as f:
+                        data = f.read()
+                out = compress(data)
+                if len(out) >= len(data):
+                    if os.path.exists(dst):
+                        os.remove(dst)
+                    continue
+                with open(dst + '.tmp', 'wb') as f:
+                    f.write(out)
+                os.replace(dst + '.tmp', dst)
+                written += 1
+    return written, skipped
+
+
+if __name__ == '__main__':
+    written, skipped = precompress(sys.argv[1] if len(sys.argv) > 1 else STATIC)
+    note = '' if brotli is not None else ' (brotli not installed: gzip only)'
+    print(f'Precompressed {written} files, {skipped} up to date{note}')
@@ -0,0 +1,139 @@
+"""Incremental file sync shared by the website asset tools.
+
+`sync()` takes the full list of (source, target) pairs a tool wants to
+have in place and a JSON manifest that records, per target, the source
+size/mtime (and optionally SHA-1) it was copied from. Only targets whose
+source changed, or that are missing on disk, are copied (through a thread
+pool, via a temporary file and an atomic rename). Targets that an earlier
+run created under one of `prune_roots` but that are no longer wanted are
+deleted; files the manifest does not know about are never touched.
+
+`pick_examples()` selects a stable subset of files, so the example images
+only change when the source folder does.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SYNC_MANIFEST = os.path.join(ROOT, 'website', '.sync_manifest.json')
+
+
+def file_sha1(path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def pick_examples(names, n, seed='examples'):
+    """Up to `n` names chosen by a seeded hash: stable across runs, unbiased by name order."""
+    return sorted(sorted(names, key=lambda f: hashlib.sha1(f'{seed}:{f}'.encode('utf-8')).hexdigest())[:n])
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _key(path, base):
+    return os.path.relpath(os.path.abspath(path), base).replace(os.sep, '/')
+
+
+def is_current(entry, src_st, dst, checksum, src):
+    if not entry or not os.path.exists(dst):
+        return False
+    if os.path.getsize(dst) != src_st.st_size:
+        return False
+    if entry.get('size') == src_st.st_size and entry.get('mtime_ns') == src_st.st_mtime_ns:
+        return True
+    # touched but maybe not changed (e.g. a fresh checkout): compare contents
+    return checksum and entry.get('sha1') is not None and entry['sha1'] == file_sha1(src)
+
+
+def sync(pairs, manifest_path=SYNC_MANIFEST, workers=8, checksum=False, prune_roots=(), dry_run=False):
+    """Bring every target in `pairs` up to date; returns counts per outcome.
+
+    With `checksum`, SHA-1s are stored and compared when size matches but
+    mtime differs, so re-touched sources are not copied again.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = load_manifest(manifest_path)
+    lock = threading.Lock()
+    stats = {'copied': 0, 'unchanged': 0, 'pruned': 0, 'failed': 0}
+
+    wanted = {}
+    for src, dst in pairs:
+        wanted[_key(dst, base)] = (src, dst)
+
+    todo = []
+    for key, (src, dst) in wanted.items():
+        try:
+            src_st = os.stat(src)
+        except OSError:
+            print(f'Source missing: {src}')
+            stats['failed'] += 1
+            continue
+        if is_current(manifest.get(key), src_st, dst, checksum, src):
+            stats['unchanged'] += 1
+            # remember the new mtime so the next run skips the checksum
+            manifest[key].update(size=src_st.st_size, mtime_ns=src_st.st_mtime_ns)
+        else:
+            todo.append((key, src, dst, src_st))
+
+    def copy(job):
+        key, src, dst, src_st = job
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.part'
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        entry = {'src': _key(src, base), 'size': src_st.st_size, 'mtime_ns': src_st.st_mtime_ns}
+        if checksum:
+            entry['sha1'] = file_sha1(dst)
+        with lock:
+            manifest[key] = entry
+        return dst
+
+    try:
+        if not dry_run:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = [(job, pool.submit(copy, job)) for job in todo]
+                for job, fut in futures:
+                    try:
+                        print(f'Copied {job[1]} -> {fut.result()}')
+                        stats['copied'] += 1
+                    except Exception as e:
+                        print(f'Failed {job[1]}: {e}')
+                        stats['failed'] += 1
+        else:
+            for _, src, dst, _ in todo:
+                print(f'Would copy {src} -> {dst}')
+            stats['copied'] = len(todo)
+
+        roots = tuple(_key(r, base).rstrip('/') + '/' for r in prune_roots)
+        for key in [k for k in manifest if k not in wanted and k.startswith(roots)]:
+            path = os.path.join(base, key)
+            print(f'{"Would prune" if dry_run else "Pruned"} {path}')
+            if not dry_run:
+                if os.path.exists(path):
+                    os.remove(path)
+                del manifest[key]
+            stats['pruned'] += 1
+    finally:
+        if not dry_run:
+            save_manifest(manifest_path, manifest)
+    return stats
@@ -0,0 +1,133 @@
+"""Registry of uploaded images, backed by SQLite.
+
+Every upload is hashed while it is written and gets a stable id (the first
+16 hex digits of its SHA-1). The file is stored once as
+`uploads/<id>_<secure name>`; uploading the same content again, under any
+name, reuses the stored file instead of writing a copy. Re-use requests
+(`existing_file`, the session fallback) resolve by a primary-key lookup on
+the stored name or the id, instead of listing and scanning the uploads
+folder.
+
+Files that were uploaded before the registry existed are registered the
+first time they are requested by their exact name.
+"""
+import contextlib
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    stored TEXT NOT NULL UNIQUE,
+    original TEXT NOT NULL,
+    sha1 TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+"""
+ID_LEN = 16
+
+
+def file_sha1(path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class UploadRegistry:
+    def __init__(self, db_path, folder):
+        self.db_path = db_path
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        with self.connect() as con:
+            con.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self):
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            con.execute('PRAGMA journal_mode=WAL')
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def save(self, file_storage, safe_name):
+        """Store an uploaded werkzeug FileStorage; returns (record, deduplicated)."""
+        tmp = os.path.join(self.folder, f'.upload-{uuid.uuid4().hex}.part')
+        h = hashlib.sha1()
+        size = 0
+        try:
+            with open(tmp, 'wb') as out:
+                for block in iter(lambda: file_storage.stream.read(1 << 20), b''):
+                    h.update(block)
+                    out.write(block)
+                    size += len(block)
+            sha1 = h.hexdigest()
+            existing = self.by_sha1(sha1)
+            if existing is not None:
+                return existing, True
+            record = {'id': sha1[:ID_LEN], 'stored': f'{sha1[:ID_LEN]}_{safe_name}', 'original': safe_name,
+                      'sha1': sha1, 'size': size, 'created': time.time()}
+            path = os.path.join(self.folder, record['stored'])
+            os.replace(tmp, path)
+            row = self._insert(record)
+            if row['stored'] != record['stored']:
+                os.remove(path)  # the same content was registered concurrently under another name
+                return row, True
+            return row, False
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _insert(self, record):
+        with self.connect() as con:
+            con.execute('INSERT OR IGNORE INTO uploads (id, stored, original, sha1, size, created) '
+                        'VALUES (:id, :stored, :original, :sha1, :size, :created)', record)
+            # a concurrent upload of the same content may have won the insert
+            row = con.execute('SELECT * FROM uploads WHERE sha1 = ?', (record['sha1'],)).fetchone()
+        return dict(row)
+
+    def by_sha1(self, sha1):
+        with self.connect() as con:
+            row = con.execute('SELECT * FROM uploads WHERE sha1 = ?', (sha1,)).fetchone()
+        return self._present(row)
+
+    def lookup(self, ref):
+        """Record for a stored file name or an upload id, or None."""
+        if not ref:
+            return None
+        ref = os.path.basename(ref)
+        with self.connect() as con:
+            row = con.execute('SELECT * FROM uploads WHERE stored = ? OR id = ?', (ref, ref)).fetchone()
+        if row is not None:
+            return self._present(row)
+        return self._adopt(ref)
+
+    def _present(self, row):
+        """The row as a dict if its file is still on disk; stale rows are dropped."""
+        if row is None:
+            return None
+        if os.path.exists(os.path.join(self.folder, row['stored'])):
+            return dict(row)
+        with self.connect() as con:
+            con.execute('DELETE FROM uploads WHERE id = ?', (row['id'],))
+        return None
+
+    def _adopt(self, name):
+        """Register a file that predates the registry, if it exists under exactly this name."""
+        path = os.path.join(self.folder, name)
+        if name.startswith('.') or not os.path.isfile(path):
+            return None
+        sha1 = file_sha1(path)
+        existing = self.by_sha1(sha1)
+        if existing is not None:
+            return existing
+        return self._insert({'id': sha1[:ID_LEN], 'stored': name, 'original': name, 'sha1': sha1,
+                             'size': os.path.getsize(path), 'created': os.path.getmtime(path)})